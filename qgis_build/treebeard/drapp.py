@@ -14,6 +14,8 @@ import pandas as pd
 from rasterio.mask import mask
 from shapely.geometry import box
 
+from .downloads import TileDownloader
+
 
 def get_filename_from_url(url):
     parsed_url = urllib.parse.urlparse(url)
@@ -37,17 +39,10 @@ def extract_zip(target_dir, zip_filename, resp):
         z.extractall(target_dir)
 
 
-def download_files(localpath, urls):
-    paths = []
-    for url in urls:
-        filename = os.path.basename(url)
-        path = os.path.join(localpath, filename)
-        paths.append(path)
-        if not os.path.exists(path):
-            resp = requests.get(url)
-            with open(path, 'wb') as f:
-                f.write(resp.content)
-    return paths
+def download_files(localpath, urls, workers=4, downloader=None):
+    if downloader is None:
+        downloader = TileDownloader(workers=workers)
+    return downloader.download_all(urls, localpath)
 
 
 def save_shapefile(local_path: str, url=None):
@@ -74,13 +69,13 @@ def save_shapefile(local_path: str, url=None):
     return shapefilepath
 
 
-def save_tiles(localpath, tilenames: list, tile_base_url=None):
+def save_tiles(localpath, tilenames: list, tile_base_url=None, workers=4):
     os.makedirs(localpath, exist_ok=True)
     if not tile_base_url:
         tile_base_url = 'https://drapparchive.s3.amazonaws.com/2020/'
     tile_urls = [f'{tile_base_url}{tile}.tif' for tile in tilenames]
 
-    tile_paths = download_files(localpath, tile_urls)
+    tile_paths = download_files(localpath, tile_urls, workers=workers)
     return tile_paths
 
 
@@ -0,0 +1,458 @@
+# Utility methods used to compute canopy gaps on the raster grid instead of with vector overlays
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import rasterio.features
+import shapely
+from scipy.ndimage import distance_transform_edt, label
+from shapely.geometry import MultiPolygon
+
+from .acreage import GAP_SIZE_LABELS, SQFT_PER_ACRE, categorize_gap_sizes
+from .lidar_grid import grid_from_bounds
+from .raster_polygons import polygonize_raster
+
+
+def gap_grid(study_area, buffer_distance, resolution=1.0):
+    """
+    Builds the raster grid used to compute gaps in a study area.
+
+    The grid covers the study area padded by the buffer distance, so canopy just outside
+    the study area still buffers into it, and snaps to multiples of the resolution so it
+    lines up with canopy rasters produced by `utils.lidar_grid`.
+
+    Parameters
+    ----------
+    study_area : gpd.GeoDataFrame
+        The study area.
+    buffer_distance : float
+        Canopy buffer distance in map units.
+    resolution : float, optional
+        Cell size in map units. Default is 1.0.
+
+    Returns
+    -------
+    transform : affine.Affine
+        Affine transform of the grid.
+    shape : tuple
+        Grid shape as (rows, columns).
+    """
+    minx, miny, maxx, maxy = study_area.total_bounds
+    pad = max(buffer_distance, 0) + resolution
+    return grid_from_bounds((minx - pad, miny - pad, maxx + pad, maxy + pad), resolution)
+
+
+def rasterize_canopy(canopy_gdf, transform, shape):
+    """
+    Burns canopy polygons into a boolean mask.
+
+    Parameters
+    ----------
+    canopy_gdf : gpd.GeoDataFrame
+        Canopy polygons.
+    transform : affine.Affine
+        Affine transform of the grid.
+    shape : tuple
+        Grid shape as (rows, columns).
+
+    Returns
+    -------
+    np.ndarray
+        Boolean mask, True for canopy cells.
+    """
+    geometries = [geom for geom in canopy_gdf.geometry if geom is not None and not geom.is_empty]
+    if not geometries:
+        return np.zeros(shape, dtype=bool)
+    return rasterio.features.rasterize(
+        geometries, out_shape=shape, transform=transform, fill=0, default_value=1, dtype='uint8'
+    ).astype(bool)
+
+
+def rasterize_zones(study_area, transform, shape):
+    """
+    Burns the rows of the study area into a zone raster.
+
+    Only cells whose center lies inside a row are burned (all_touched=False), so cells
+    the study area boundary barely clips are not counted as inside it.
+
+    Parameters
+    ----------
+    study_area : gpd.GeoDataFrame
+        The study area.
+    transform : affine.Affine
+        Affine transform of the grid.
+    shape : tuple
+        Grid shape as (rows, columns).
+
+    Returns
+    -------
+    np.ndarray
+        int32 raster holding the 1-based position of the study area row covering each
+        cell, 0 outside the study area.
+    """
+    return rasterio.features.rasterize(
+        ((geom, position + 1) for position, geom in enumerate(study_area.geometry)),
+        out_shape=shape, transform=transform, fill=0, all_touched=False, dtype='int32'
+    )
+
+
+def zone_coverage(study_area, zones, transform):
+    """
+    Computes the fraction of every zone cell that lies inside its study area row.
+
+    Only cells the row boundaries cross are intersected with the row geometry; every
+    other zone cell is fully inside.
+
+    Parameters
+    ----------
+    study_area : gpd.GeoDataFrame
+        The study area.
+    zones : np.ndarray
+        Zone raster from `rasterize_zones`.
+    transform : affine.Affine
+        Affine transform of the grid.
+
+    Returns
+    -------
+    np.ndarray
+        float32 fraction of each cell inside its zone, 0 outside the study area.
+    """
+    coverage = (zones > 0).astype(np.float32)
+    boundaries = [geom.boundary for geom in study_area.geometry if geom is not None and not geom.is_empty]
+    if not boundaries:
+        return coverage
+    crossed = rasterio.features.rasterize(
+        boundaries, out_shape=zones.shape, transform=transform, fill=0, default_value=1,
+        all_touched=True, dtype='uint8'
+    ).astype(bool)
+    rows, cols = np.nonzero(crossed & (zones > 0))
+
+    # Cell boxes from their corner coordinates, intersected with the row of their zone
+    x0, y0 = transform * (cols, rows)
+    x1, y1 = transform * (cols + 1, rows + 1)
+    cells = shapely.box(np.minimum(x0, x1), np.minimum(y0, y1), np.maximum(x0, x1), np.maximum(y0, y1))
+    geometries = np.asarray(study_area.geometry.values)[zones[rows, cols] - 1]
+    coverage[rows, cols] = shapely.area(shapely.intersection(cells, geometries)) / shapely.area(cells)
+    return coverage
+
+
+def distance_to_canopy(canopy_mask, resolution=1.0):
+    """
+    Computes the Euclidean distance from every cell center to the edge of the nearest canopy cell.
+
+    Measuring to the cell edge rather than the cell center matches how a vector buffer
+    of the pixel-edged canopy polygons grows, including along diagonals.
+
+    Parameters
+    ----------
+    canopy_mask : np.ndarray
+        Boolean mask, True for canopy cells.
+    resolution : float, optional
+        Cell size in map units. Default is 1.0.
+
+    Returns
+    -------
+    np.ndarray
+        float32 distance in map units, 0 on canopy and inf everywhere if there is no canopy.
+    """
+    if not canopy_mask.any():
+        return np.full(canopy_mask.shape, np.inf, dtype=np.float32)
+
+    rows, cols = distance_transform_edt(~canopy_mask, return_distances=False, return_indices=True)
+    row_offset = np.abs(rows - np.arange(canopy_mask.shape[0])[:, np.newaxis]).astype(np.float32)
+    col_offset = np.abs(cols - np.arange(canopy_mask.shape[1])[np.newaxis, :]).astype(np.float32)
+    del rows, cols
+
+    # Offsets to the nearest canopy cell center, minus half a cell, give the offsets to its edge
+    np.subtract(row_offset, 0.5, out=row_offset)
+    np.subtract(col_offset, 0.5, out=col_offset)
+    np.maximum(row_offset, 0, out=row_offset)
+    np.maximum(col_offset, 0, out=col_offset)
+    distance = np.hypot(row_offset, col_offset, out=row_offset)
+    distance *= resolution
+    return distance
+
+
+def buffer_mask(distance, buffer_distance):
+    """
+    Buffers canopy on the grid by thresholding its distance field.
+
+    Parameters
+    ----------
+    distance : np.ndarray
+        Distance field from `distance_to_canopy`.
+    buffer_distance : float
+        Buffer distance in map units.
+
+    Returns
+    -------
+    np.ndarray
+        Boolean mask of the buffered canopy: cells whose center lies within the buffer.
+    """
+    if buffer_distance <= 0:
+        return distance == 0
+    return distance <= buffer_distance
+
+
+def label_gaps(gap_mask, zones, zone_count, coverage=None):
+    """
+    Labels connected gaps (4-connectivity) separately within each study area zone.
+
+    With `coverage`, gaps made only of cells the study area boundary crosses that add up
+    to less than one cell inside the study area are dropped. They are the clipped corners
+    of cells along the boundary, which the vector engine leaves as slivers of a
+    neighbouring gap or as nothing at all.
+
+    Parameters
+    ----------
+    gap_mask : np.ndarray
+        Boolean mask, True for gap cells.
+    zones : np.ndarray
+        Zone raster from `rasterize_zones`.
+    zone_count : int
+        Number of zones (study area rows).
+    coverage : np.ndarray, optional
+        Cell coverage from `zone_coverage`. Default is None, keep every gap.
+
+    Returns
+    -------
+    labels : np.ndarray
+        int32 raster of gap labels numbered from 1, 0 outside gaps.
+    label_zones : np.ndarray
+        Zone of each label; entry 0 belongs to the background.
+    """
+    labels = np.zeros(gap_mask.shape, dtype=np.int32)
+    label_zones = [0]
+    for zone in range(1, zone_count + 1):
+        zone_labels, count = label(gap_mask & (zones == zone))
+        in_zone = zone_labels > 0
+        labels[in_zone] = zone_labels[in_zone] + (len(label_zones) - 1)
+        label_zones.extend([zone] * count)
+    label_zones = np.asarray(label_zones)
+
+    if coverage is not None and len(label_zones) > 1:
+        flat_labels = labels.ravel()
+        flat_coverage = coverage.ravel()
+        interior = np.bincount(flat_labels, weights=flat_coverage >= 1, minlength=len(label_zones))
+        covered = np.bincount(flat_labels, weights=flat_coverage, minlength=len(label_zones))
+        keep = (interior > 0) | (covered >= 1)
+        keep[0] = True
+        lookup = np.cumsum(keep).astype(np.int32) - 1
+        lookup[~keep] = 0
+        labels = lookup[labels]
+        label_zones = label_zones[keep]
+    return labels, label_zones
+
+
+def polygonize_labels(labels, transform):
+    """
+    Converts the non-zero regions of a label raster into polygons.
+
+    Parameters
+    ----------
+    labels : np.ndarray
+        int32 label raster, 0 for background.
+    transform : affine.Affine
+        Affine transform of the raster.
+
+    Returns
+    -------
+    polygons : np.ndarray
+        Array of shapely Polygons, one per 4-connected region.
+    values : np.ndarray
+        Label of each polygon.
+    """
+    polygons, values = polygonize_raster(labels, transform, mask=labels > 0)
+    return polygons, values.astype(np.int64)
+
+
+def gap_acres(labels, label_count, resolution=1.0):
+    """
+    Computes the area of every labeled gap from its pixel count.
+
+    Parameters
+    ----------
+    labels : np.ndarray
+        Gap label raster from `label_gaps`.
+    label_count : int
+        Number of labels, including the background label 0.
+    resolution : float, optional
+        Cell size in map units (feet). Default is 1.0.
+
+    Returns
+    -------
+    np.ndarray
+        Acreage of each label; entry 0 belongs to the background.
+    """
+    pixel_counts = np.bincount(labels.ravel(), minlength=label_count)
+    return pixel_counts * (resolution * resolution) / SQFT_PER_ACRE
+
+
+def _zone_attributes(study_area, zones):
+    attributes = pd.DataFrame(study_area.drop(columns=study_area.geometry.name)).reset_index(drop=True)
+    return attributes.iloc[np.asarray(zones) - 1].reset_index(drop=True)
+
+
+def gap_layers_from_distance(distance, zones, study_area, transform, crs, buffer_distance, resolution=1.0,
+                             coverage=None):
+    """
+    Computes the buffered canopy and canopy gap layers from a precomputed distance field.
+
+    Parameters
+    ----------
+    distance : np.ndarray
+        Distance field from `distance_to_canopy`.
+    zones : np.ndarray
+        Zone raster from `rasterize_zones`.
+    study_area : gpd.GeoDataFrame
+        The study area, in the CRS of the grid.
+    transform : affine.Affine
+        Affine transform of the grid.
+    crs : str or pyproj.CRS
+        CRS of the grid.
+    buffer_distance : float
+        Buffer distance in map units.
+    resolution : float, optional
+        Cell size in map units. Default is 1.0.
+    coverage : np.ndarray, optional
+        Cell coverage from `zone_coverage`, used to drop boundary slivers in `label_gaps`.
+        Default is None.
+
+    Returns
+    -------
+    clipped_buffer : gpd.GeoDataFrame
+        Buffered canopy clipped to each study area row, with the study area attributes.
+    exploded_gap_gdf : gpd.GeoDataFrame
+        One polygon per gap with the study area attributes, 'Acreage' and 'Gap_Size_Category'.
+    """
+    buffered = buffer_mask(distance, buffer_distance)
+    inside = zones > 0
+
+    # Buffered canopy dissolved into one (multi)polygon per study area row
+    buffer_zones = np.where(buffered & inside, zones, 0)
+    polygons, values = polygonize_labels(buffer_zones, transform)
+    buffer_rows = sorted(set(values.tolist()))
+    buffer_geoms = [MultiPolygon([polygons[i] for i in np.flatnonzero(values == zone)]) for zone in buffer_rows]
+    clipped_buffer = gpd.GeoDataFrame(_zone_attributes(study_area, buffer_rows), geometry=buffer_geoms, crs=crs)
+
+    # Label gaps and size them from their pixel counts
+    labels, label_zones = label_gaps(inside & ~buffered, zones, len(study_area), coverage)
+    label_acres = gap_acres(labels, len(label_zones), resolution)
+
+    # Only the gaps themselves are polygonized
+    polygons, values = polygonize_labels(labels, transform)
+    exploded_gap_gdf = gpd.GeoDataFrame(_zone_attributes(study_area, label_zones[values]), geometry=polygons, crs=crs)
+    exploded_gap_gdf['Acreage'] = label_acres[values]
+    exploded_gap_gdf['Gap_Size_Category'] = categorize_gap_sizes(label_acres[values])
+
+    return clipped_buffer, exploded_gap_gdf
+
+
+def canopy_gaps_raster(canopy_gdf, study_area, buffer_distance=5, resolution=1.0):
+    """
+    Computes buffered canopy and canopy gaps on a grid instead of with vector overlays.
+
+    Canopy polygons are burned into a grid, buffered with a Euclidean distance transform,
+    clipped with a rasterized study area mask and the remaining gaps are labeled as
+    connected components. Acreage and size category come from pixel counts, and only the
+    final gaps and buffered canopy are polygonized.
+
+    Parameters
+    ----------
+    canopy_gdf : gpd.GeoDataFrame
+        Canopy polygons, e.g. from `process_lidar_to_canopy`.
+    study_area : gpd.GeoDataFrame
+        The study area, in the CRS of `canopy_gdf`.
+    buffer_distance : float, optional
+        The distance to buffer the canopy. Default is 5 units.
+    resolution : float, optional
+        Cell size used for the gap grid. Use the resolution the canopy was derived at
+        (1.0 for LiDAR canopy) so the canopy is reproduced exactly. Default is 1.0.
+
+    Returns
+    -------
+    clipped_buffer : gpd.GeoDataFrame
+        Buffered canopy clipped to the study area.
+    exploded_gap_gdf : gpd.GeoDataFrame
+        One polygon per gap, including acreage and size category.
+    """
+    transform, shape = gap_grid(study_area, buffer_distance, resolution)
+    canopy_mask = rasterize_canopy(canopy_gdf, transform, shape)
+    zones = rasterize_zones(study_area, transform, shape)
+    coverage = zone_coverage(study_area, zones, transform)
+    distance = distance_to_canopy(canopy_mask, resolution)
+    return gap_layers_from_distance(
+        distance, zones, study_area, transform, canopy_gdf.crs, buffer_distance, resolution, coverage
+    )
+
+
+def sweep_buffer_distances(canopy_gdf, study_area, buffer_distances, resolution=1.0, polygon_distances=None):
+    """
+    Summarizes canopy gaps by size category for many buffer distances in a single pass.
+
+    The distance-to-canopy field is computed once; each buffer distance then only needs a
+    threshold, a connected component labeling and a pixel count, so sweeping N distances
+    costs roughly one raster gap run instead of N calls to `process_canopy_areas`.
+
+    Parameters
+    ----------
+    canopy_gdf : gpd.GeoDataFrame
+        Canopy polygons, e.g. from `process_lidar_to_canopy`.
+    study_area : gpd.GeoDataFrame
+        The study area. It is reprojected to the CRS of `canopy_gdf`.
+    buffer_distances : list of float
+        Buffer distances to evaluate, e.g. range(0, 31).
+    resolution : float, optional
+        Cell size used for the gap grid; use the resolution the canopy was derived at.
+        Default is 1.0.
+    polygon_distances : list of float, optional
+        Buffer distances for which the gap polygons are also returned.
+
+    Returns
+    -------
+    summary_df : pd.DataFrame
+        One row per buffer distance and gap size category with the columns
+        'buffer_distance', 'Gap_Size_Category', 'gap_count' and 'Acreage'.
+    gap_gdfs : dict
+        Maps each of `polygon_distances` to its exploded gap GeoDataFrame, as returned by
+        `process_canopy_areas`.
+
+    Examples
+    --------
+    >>> summary_df, gap_gdfs = sweep_buffer_distances(canopy_gdf, proj_area, range(0, 31), polygon_distances=[5, 15])
+    >>> summary_df.pivot(index='buffer_distance', columns='Gap_Size_Category', values='Acreage')
+    """
+    study_area = study_area.to_crs(canopy_gdf.crs)
+    max_distance = max(max(buffer_distances), max(polygon_distances or [0]))
+
+    transform, shape = gap_grid(study_area, max_distance, resolution)
+    canopy_mask = rasterize_canopy(canopy_gdf, transform, shape)
+    zones = rasterize_zones(study_area, transform, shape)
+    coverage = zone_coverage(study_area, zones, transform)
+    inside = zones > 0
+    distance = distance_to_canopy(canopy_mask, resolution)
+
+    summaries = []
+    for buffer_distance in buffer_distances:
+        labels, label_zones = label_gaps(
+            inside & ~buffer_mask(distance, buffer_distance), zones, len(study_area), coverage
+        )
+        label_acres = gap_acres(labels, len(label_zones), resolution)[1:]
+        categories = pd.Categorical(categorize_gap_sizes(label_acres), categories=GAP_SIZE_LABELS)
+        summary = (
+            pd.DataFrame({'Gap_Size_Category': categories, 'Acreage': label_acres})
+            .groupby('Gap_Size_Category', observed=False)['Acreage']
+            .agg(gap_count='count', Acreage='sum')
+            .reset_index()
+        )
+        summary.insert(0, 'buffer_distance', buffer_distance)
+        summaries.append(summary)
+    summary_df = pd.concat(summaries, ignore_index=True)
+    summary_df['Gap_Size_Category'] = summary_df['Gap_Size_Category'].astype(str)
+
+    gap_gdfs = {}
+    for buffer_distance in polygon_distances or []:
+        _, gap_gdfs[buffer_distance] = gap_layers_from_distance(
+            distance, zones, study_area, transform, canopy_gdf.crs, buffer_distance, resolution, coverage
+        )
+
+    return summary_df, gap_gdfs
@@ -0,0 +1,195 @@
+# Utility methods used to cluster per-segment NDVI values into tree and not-tree classes
+import numpy as np
+from skimage.filters import threshold_multiotsu
+from sklearn.cluster import KMeans, MiniBatchKMeans
+
+# Bins of the NDVI histogram used by the 'otsu' and 'jenks' backends
+HISTOGRAM_BINS = 256
+
+# Clustering backends:
+# - 'kmeans': sklearn KMeans, as used so far. Works on any number of features.
+# - 'kmeans1d': exact, globally optimal 1-D k-means (minimum within-cluster sum of
+#   squares) by dynamic programming over the sorted values. Deterministic; costs a sort
+#   plus one vectorized pass for 2 clusters, about (k - 2) * log2(n) + 1 for k.
+# - 'jenks': Jenks natural breaks, i.e. the same optimization run on an NDVI histogram
+#   instead of the values. Milliseconds for any number of segments.
+# - 'otsu': Otsu (multi-Otsu for more than 2 clusters) thresholds of the NDVI histogram.
+# - 'minibatch': sklearn MiniBatchKMeans, for many segments with several features.
+CLUSTERING_METHODS = ('kmeans', 'kmeans1d', 'jenks', 'otsu', 'minibatch')
+
+
+def _cluster_costs(prefix_weights, prefix_sums, prefix_squares, starts, ends):
+    # Weighted sum of squared deviations of the sorted values starts..ends (inclusive)
+    weights = prefix_weights[ends + 1] - prefix_weights[starts]
+    sums = prefix_sums[ends + 1] - prefix_sums[starts]
+    squares = prefix_squares[ends + 1] - prefix_squares[starts]
+    return squares - sums * sums / weights
+
+
+def optimal_breaks(values, n_clusters, weights=None):
+    """
+    Partitions sorted 1-D values into clusters with the minimum within-cluster sum of squares.
+
+    Dynamic programming over the sorted values (as in Ckmeans.1d.dp): the cost of the
+    best partition of the first m values into c clusters is the minimum, over the start
+    i of the last cluster, of the best partition of the first i values into c - 1
+    clusters plus the cost of values i..m. The optimal start never decreases as m grows,
+    so each row is filled by divide and conquer, one level of the recursion per
+    vectorized pass. The last row is only needed for the last value, so 2 clusters take
+    a single pass.
+
+    Parameters
+    ----------
+    values : np.ndarray
+        1-D values sorted in ascending order.
+    n_clusters : int
+        Number of clusters; at most the number of values.
+    weights : np.ndarray, optional
+        Positive weight of each value, e.g. histogram counts. Default is None, all 1.
+
+    Returns
+    -------
+    np.ndarray
+        Index into `values` of the first value of each cluster after the first.
+    """
+    n = len(values)
+    weights = np.ones(n) if weights is None else np.asarray(weights, dtype=np.float64)
+    # Centre the values so the prefix sums of squares keep their precision
+    centred = values - np.average(values, weights=weights)
+    prefix_weights = np.concatenate([[0], np.cumsum(weights)])
+    prefix_sums = np.concatenate([[0], np.cumsum(weights * centred)])
+    prefix_squares = np.concatenate([[0], np.cumsum(weights * centred * centred)])
+    prefixes = (prefix_weights, prefix_sums, prefix_squares)
+
+    ends = np.arange(n)
+    costs = _cluster_costs(*prefixes, np.zeros(n, dtype=np.int64), ends)
+    starts = []
+    for cluster in range(1, n_clusters):
+        previous = costs
+        costs = np.full(n, np.inf)
+        best_start = np.zeros(n, dtype=np.int64)
+
+        # Ranges of ends still to solve and the range their optimal start lies in; the
+        # last row is only needed for the last value
+        low = np.array([n - 1 if cluster == n_clusters - 1 else cluster])
+        high = np.array([n - 1])
+        opt_low, opt_high = np.array([cluster]), np.array([n - 1])
+        while len(low):
+            mid = (low + high) // 2
+            first = opt_low
+            last = np.minimum(mid, opt_high)
+            counts = last - first + 1
+
+            # Every candidate start of every mid point, flattened
+            group = np.repeat(np.arange(len(mid)), counts)
+            candidates = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + first[group]
+            candidate_costs = previous[candidates - 1] + _cluster_costs(*prefixes, candidates, mid[group])
+
+            group_starts = np.cumsum(counts) - counts
+            minima = np.minimum.reduceat(candidate_costs, group_starts)
+            at_minimum = np.flatnonzero(candidate_costs == minima[group])
+            # Keep the first (smallest) start at the minimum of each group
+            first_minimum = np.flatnonzero(np.diff(group[at_minimum], prepend=-1))
+            best = candidates[at_minimum[first_minimum]]
+            costs[mid] = minima
+            best_start[mid] = best
+
+            # Split each range around its mid point
+            left = low <= mid - 1
+            right = mid + 1 <= high
+            low, high, opt_low, opt_high = (
+                np.concatenate([low[left], mid[right] + 1]),
+                np.concatenate([mid[left] - 1, high[right]]),
+                np.concatenate([opt_low[left], best[right]]),
+                np.concatenate([best[left], opt_high[right]]),
+            )
+        starts.append(best_start)
+
+    # Walk back from the last value to recover where each cluster starts
+    breaks = []
+    end = n - 1
+    for best_start in reversed(starts):
+        start = best_start[end]
+        breaks.append(start)
+        end = start - 1
+    return np.array(breaks[::-1], dtype=np.int64)
+
+
+def _histogram(values):
+    # Centres, counts and lower edges of the non-empty bins of a histogram
+    counts, edges = np.histogram(values, bins=HISTOGRAM_BINS)
+    centres = (edges[:-1] + edges[1:]) / 2
+    filled = counts > 0
+    return centres[filled], counts[filled], edges[:-1][filled]
+
+
+def cluster_segments(features, n_clusters=2, method='kmeans'):
+    """
+    Clusters per-segment features and picks the cluster of trees.
+
+    Every backend returns the same output: a cluster label per segment and the index of
+    the cluster with the highest mean of the first feature (NDVI), which is 'tree'.
+    The 1-D backends ('kmeans1d', 'jenks', 'otsu') number the clusters in order of
+    increasing NDVI.
+
+    Parameters
+    ----------
+    features : np.ndarray
+        Per-segment features, 1-D or (segments, features) with mean NDVI first. The 1-D
+        backends use a single feature.
+    n_clusters : int, optional
+        Number of clusters (default is 2). The 1-D backends return fewer clusters when
+        there are fewer distinct values (or NDVI histogram bins) than clusters.
+    method : {'kmeans', 'kmeans1d', 'jenks', 'otsu', 'minibatch'}, optional
+        Clustering backend, see `CLUSTERING_METHODS`. Default is 'kmeans'.
+
+    Returns
+    -------
+    labels : np.ndarray
+        Cluster label of each segment, from 0 to n_clusters - 1.
+    tree_cluster_idx : int
+        Label of the tree cluster.
+    """
+    if method not in CLUSTERING_METHODS:
+        raise ValueError(f"Unsupported clustering method '{method}'. Use one of {', '.join(CLUSTERING_METHODS)}.")
+    features = np.asarray(features, dtype=np.float64)
+    if features.ndim == 1:
+        features = features.reshape(-1, 1)
+    if method in ('kmeans1d', 'jenks', 'otsu') and features.shape[1] != 1:
+        raise ValueError(f"The '{method}' clustering method takes a single feature.")
+    values = features[:, 0]
+
+    if method == 'kmeans':
+        labels = KMeans(n_clusters=n_clusters, random_state=0).fit(features).labels_
+    elif method == 'minibatch':
+        labels = MiniBatchKMeans(n_clusters=n_clusters, random_state=0, n_init=3).fit(features).labels_
+    elif method == 'kmeans1d':
+        # Equal values always share a cluster, so partition the distinct values weighted
+        # by their counts; there cannot be more clusters than distinct values
+        distinct, counts = np.unique(values, return_counts=True)
+        breaks = optimal_breaks(distinct, min(n_clusters, len(distinct)), weights=counts)
+        # A value belongs to the cluster of the last break at or below it
+        labels = np.searchsorted(distinct[breaks], values, side='right')
+    elif method == 'jenks':
+        centres, counts, lower_edges = _histogram(values)
+        breaks = optimal_breaks(centres, min(n_clusters, len(centres)), weights=counts)
+        # A value belongs to the cluster of the last break whose bin starts at or below it
+        labels = np.searchsorted(lower_edges[breaks], values, side='right')
+    else:
+        # Multi-Otsu needs at least as many non-empty histogram bins as classes, and a
+        # uniform NDVI has a single one: all of its segments form one cluster
+        classes = min(n_clusters, len(_histogram(values)[0]))
+        if classes < 2:
+            labels = np.zeros(len(values), dtype=np.int64)
+        else:
+            # The thresholds are centres of the last bin of each class; split the values
+            # at the upper edges of those bins so every bin stays in one class
+            thresholds = threshold_multiotsu(values, classes=classes, nbins=HISTOGRAM_BINS)
+            half_bin = (values.max() - values.min()) / HISTOGRAM_BINS / 2
+            labels = np.digitize(values, thresholds + half_bin)
+
+    labels = np.asarray(labels, dtype=np.int64)
+    sizes = np.bincount(labels, minlength=n_clusters)
+    sums = np.bincount(labels, weights=values, minlength=n_clusters)
+    cluster_means = np.where(sizes > 0, sums / np.maximum(sizes, 1), -np.inf)
+    return labels, int(np.argmax(cluster_means))
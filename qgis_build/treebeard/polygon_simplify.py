@@ -0,0 +1,91 @@
+# Utility methods used to simplify the pixel-staircase polygons built from rasters
+import numpy as np
+import shapely
+
+from .vector_union import is_coverage
+
+# Default cap on the total relative area change caused by simplification (1%)
+DEFAULT_MAX_AREA_ERROR = 0.01
+
+# Number of times the tolerance is halved when the area error is exceeded
+MAX_TOLERANCE_HALVINGS = 4
+
+
+def _simplify(polygons, tolerance, coverage, simplify_boundary):
+    if coverage:
+        return shapely.coverage_simplify(polygons, tolerance, simplify_boundary=simplify_boundary)
+    return shapely.simplify(polygons, tolerance, preserve_topology=True)
+
+
+def simplify_polygons(polygons, tolerance, max_area_error=DEFAULT_MAX_AREA_ERROR, simplify_boundary=True,
+                      cell_size=None):
+    """
+    Simplifies polygonized raster regions while preserving the boundaries they share.
+
+    Polygons built by `rasterio.features.shapes` have a vertex at every pixel corner.
+    When they form a coverage they are simplified together with
+    `shapely.coverage_simplify`, so neighbouring polygons keep identical shared edges
+    and no gaps or overlaps appear. Otherwise each polygon is simplified on its own with
+    topology preserved. If the total relative area change exceeds `max_area_error`, the
+    tolerance is halved and the simplification repeated; if it still does not fit, the
+    polygons are returned unchanged.
+
+    Parameters
+    ----------
+    polygons : array-like of shapely.Geometry
+        Polygons to simplify.
+    tolerance : float
+        Simplification tolerance in map units; about one cell size removes the staircase.
+    max_area_error : float, optional
+        Largest allowed sum of absolute polygon area changes, relative to the total area.
+        Default is `DEFAULT_MAX_AREA_ERROR`.
+    simplify_boundary : bool, optional
+        Whether the outer boundary of a coverage is simplified too. Pass False when the
+        polygons tile a whole image (e.g. segments) so the image extent is kept. Default
+        is True.
+    cell_size : float, optional
+        Cell size of the raster the polygons were built from. Where three or more
+        regions meet, rasterio only puts a vertex on some of the polygons, so shared edges
+        do not match vertex for vertex and GEOS does not treat them as a coverage. When
+        given, edges are split at every cell first so they do. Default is None.
+
+    Returns
+    -------
+    simplified : np.ndarray
+        Simplified polygons, aligned with `polygons`.
+    report : dict
+        'vertices_before', 'vertices_after', 'area_error' (relative) and 'tolerance'
+        (the tolerance used, 0 if the polygons were left unchanged).
+    """
+    polygons = np.asarray(polygons)
+    vertices_before = int(shapely.get_num_coordinates(polygons).sum())
+    area_before = shapely.area(polygons)
+    total_area = area_before.sum()
+
+    coverage = hasattr(shapely, 'coverage_simplify') and is_coverage(polygons)
+    if hasattr(shapely, 'coverage_simplify') and not coverage and cell_size:
+        segmented = shapely.segmentize(polygons, cell_size)
+        if is_coverage(segmented):
+            polygons, coverage = segmented, True
+    simplified = polygons
+    area_error = 0.0
+    used_tolerance = 0.0
+    for _ in range(MAX_TOLERANCE_HALVINGS + 1):
+        candidate = _simplify(polygons, tolerance, coverage, simplify_boundary)
+        candidate_error = np.abs(shapely.area(candidate) - area_before).sum() / total_area if total_area else 0.0
+        if candidate_error <= max_area_error:
+            simplified, area_error, used_tolerance = candidate, candidate_error, tolerance
+            break
+        tolerance /= 2
+
+    report = {
+        'vertices_before': vertices_before,
+        'vertices_after': int(shapely.get_num_coordinates(simplified).sum()),
+        'area_error': float(area_error),
+        'tolerance': used_tolerance,
+    }
+    print(
+        f"Simplification: {report['vertices_before']} vertices reduced to {report['vertices_after']} "
+        f"(tolerance {used_tolerance:g}, area error {area_error:.3%})."
+    )
+    return simplified, report
@@ -3,7 +3,6 @@ import numpy as np
 import os
 import re
 
-import laspy
 import rioxarray as rxr
 import rioxarray.merge as rxrm
 import rasterio
@@ -14,6 +13,8 @@ from scipy.ndimage import binary_opening, binary_closing
 from shapely.ops import unary_union
 import whitebox
 
+from .lidar_grid import is_point_cloud_file, open_point_cloud
+
 # Method to process canopy gaps.
 def process_canopy_areas(canopy_gdf, proj_area_name, study_area, output_path, buffer_distance=5):
     """
@@ -102,7 +103,7 @@ def process_lidar_to_canopy(proj_area, las_folder_path, canopy_height=5):
     Processes LIDAR data to generate a canopy height GeoDataFrame for a specific project area.
 
     This function performs the following steps:
-    1. Lists all LAS files in the specified directory.
+    1. Lists all LAS and LAZ files in the specified directory.
     2. Processes each LAS file to create DEMs from first and ground returns.
     3. Generates a canopy height DEM by subtracting the ground return DEM from the first return DEM.
     4. Classifies the canopy height into binary values (1 for canopy, 0 for no canopy).
@@ -114,7 +115,7 @@ def process_lidar_to_canopy(proj_area, las_folder_path, canopy_height=5):
     proj_area : GeoDataFrame
         A GeoDataFrame containing the geometry of the project area to which the output will be clipped.
     las_folder_path : str
-        The path to the directory containing the LAS files to be processed.
+        The path to the directory containing the LAS or LAZ files to be processed.
     canopy_height : float, optional
         The height threshold to classify canopy vs. no canopy. 
         All values greater than or equal to this threshold will be considered canopy (default is 5).
@@ -138,8 +139,8 @@ def process_lidar_to_canopy(proj_area, las_folder_path, canopy_height=5):
     >>> canopy_gdf = process_lidar_to_canopy(proj_area, las_folder_path, output_fr_tif, output_gr_tif)
     >>> print(canopy_gdf.head())
     """
-    # List all .tif files in the directory
-    las_files = [os.path.join(las_folder_path, file) for file in os.listdir(las_folder_path) if file.endswith('.las')]
+    # List all .las and .laz files in the directory
+    las_files = [os.path.join(las_folder_path, file) for file in os.listdir(las_folder_path) if is_point_cloud_file(file)]
 
     output_folder_path = os.path.join(las_folder_path, "output")
 
@@ -156,10 +157,11 @@ def process_lidar_to_canopy(proj_area, las_folder_path, canopy_height=5):
         print(las_file)
 
         las_filename_no_ext = os.path.splitext(las_file)[0]
-        las_filename = las_filename_no_ext + ".las"
+        las_filename = las_file
 
-        las_file = laspy.read(las_filename)
-        crs_wkt = las_file.header.parse_crs().to_wkt()
+        # Only the header is needed for the CRS; LAZ files are opened with lazrs
+        with open_point_cloud(las_filename) as las_reader:
+            crs_wkt = las_reader.header.parse_crs().to_wkt()
         print(crs_wkt)
         proj_area = proj_area.to_crs(crs_wkt)
 
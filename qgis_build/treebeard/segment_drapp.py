@@ -4,15 +4,22 @@ import pandas as pd
 import geopandas as gpd
 import matplotlib.pyplot as plt
 import rasterio
-from rasterio.features import shapes
-from shapely.geometry import shape, Polygon, MultiPolygon
+import shapely
+from shapely.geometry import Polygon, MultiPolygon
 from shapely.ops import unary_union
-from skimage import io, color
-from skimage.segmentation import quickshift
-from sklearn.cluster import KMeans
-from tqdm import tqdm
+from skimage import io
 import os
 
+from .acreage import SQFT_PER_ACRE, categorize_gap_sizes
+from .gap_raster import canopy_gaps_raster
+from .ndvi_clustering import cluster_segments
+from .polygon_simplify import simplify_polygons
+from .raster_polygons import polygonize_raster
+from .segment_stats import segment_statistics
+from .segmentation import segment_ndvi
+from .tiled_segmentation import polygonize_segment_classes, segment_mean_ndvi, segment_raster_tiled
+from .vector_output import write_layers
+
 class KMeansProcessor():
     
     def generate_binary_gdf_ndvi(self, tilepath,
@@ -20,75 +27,105 @@ class KMeansProcessor():
                                 plot_segments=False, 
                                 plot_path=None, 
                                 output_shapefile_path=None, 
-                                apply_buffering=False, buffer_size=5):
-        """Generates a segmented K-Means polygon from NDVI, classifies it, and optionally buffers and saves it."""
-
-        import pandas as pd
-        from sklearn.cluster import KMeans
-        from rasterio.features import shapes
-        from skimage.segmentation import quickshift
-        from skimage import io
-        import earthpy.spatial as es
-        from tqdm import tqdm
-        import rasterio
+                                apply_buffering=False, buffer_size=5,
+                                workers=1, cleanup=None, simplify_tolerance=None,
+                                segmentation='quickshift', segmentation_params=None,
+                                window_size=None, labels_path=None, clustering='kmeans'):
+        """Generates a segmented K-Means polygon from NDVI, classifies it, and optionally buffers and saves it.
+
+        `segmentation` selects the segmentation backend ('quickshift', 'felzenszwalb', 'slic',
+        'watershed' or 'pixel', see `SEGMENTATION_METHODS`) and `segmentation_params` overrides
+        its parameters; 'slic' is many times faster than 'quickshift' on large mosaics.
+
+        With `window_size`, the image is segmented in overlapping windows of that many pixels (in
+        parallel when workers != 1) into a label GeoTIFF at `labels_path` (default
+        '<tilepath>_segments.tif'), see `segment_raster_tiled`. The segment statistics, cleanup and
+        polygons are then computed window by window as well, so the image is never loaded whole,
+        and `plot_segments` is skipped.
+
+        `clustering` selects how the segment NDVI means are clustered ('kmeans', 'kmeans1d',
+        'jenks', 'otsu' or 'minibatch', see `CLUSTERING_METHODS`); 'kmeans1d' is exact and
+        deterministic.
+        """
 
+        with rasterio.open(tilepath) as tile:
+            affine = tile.transform
+            sr = tile.crs
+
+        if window_size:
+            # Segment NDVI window by window into a label GeoTIFF and compute the mean NDVI
+            # of each segment from it, without loading the whole image
+            if labels_path is None:
+                labels_path = os.path.splitext(tilepath)[0] + '_segments.tif'
+            n_segments = segment_raster_tiled(
+                tilepath, labels_path, segmentation, segmentation_params, window_size=window_size, workers=workers
+            )
+            print(f"{segmentation.capitalize()} number of segments: {n_segments}")
+            if plot_segments and plot_path:
+                print("Segment plots are skipped in tiled mode, which never loads the whole image.")
+            segment_index = np.arange(n_segments)
+            mean_ndvi_vals = segment_mean_ndvi(tilepath, labels_path, n_segments, window_size).reshape(-1, 1)
+        else:
             # Load the image and bands
-        tile = rasterio.open(tilepath)
-        red = tile.read(1).astype(float)
-        nir = tile.read(4).astype(float)
-        affine = tile.transform
-        sr = tile.crs
-
-        # Compute NDVI and handle NaNs
-        ndvi = es.normalized_diff(nir, red)
-        ndvi = np.where(np.isnan(ndvi), 0, ndvi)
-
-        # Segment NDVI using quickshift
-        img = io.imread(tilepath)
-        img_ndvi = np.expand_dims(ndvi, axis=2).astype(np.float32)
-        segments = quickshift(img_ndvi, kernel_size=3, convert2lab=False, max_dist=6, ratio=0.5).astype('int32')
-        
-        print(f"Quickshift number of segments: {len(np.unique(segments))}")
-
-        # Optional: save segment image
-        if plot_segments and plot_path:
-            self.plot_segments(img, ndvi, segments, plot_path)
-
-        # Efficient mean NDVI calculation per segment using vectorized grouping
-        flat_segments = segments.flatten()
-        flat_ndvi = ndvi.flatten()
-        import pandas as pd
-        df = pd.DataFrame({'segment': flat_segments, 'ndvi': flat_ndvi})
-        mean_ndvi_per_segment = df.groupby('segment')['ndvi'].mean()
-
-        # Convert segments to polygons
-        polys = []
-        segment_ids = []
-        for shp, val in tqdm(shapes(segments, transform=affine), desc="Converting segments to vector features"):
-            polys.append(shape(shp))
-            segment_ids.append(val)
-
-        # Create GeoDataFrame with geometry and segment ID
-        gdf = gpd.GeoDataFrame({'geometry': polys, 'segment': segment_ids}, crs=sr)
-
-        # Map mean NDVI values to each polygon using segment ID
-        gdf['mean_ndvi'] = gdf['segment'].map(mean_ndvi_per_segment)
-
-        # KMeans clustering based on mean NDVI per polygon
-        from sklearn.cluster import KMeans
-        mean_ndvi_vals = gdf['mean_ndvi'].values.reshape(-1, 1)
-        kmeans = KMeans(n_clusters=n_clusters, random_state=0).fit(mean_ndvi_vals)
-        gdf['cluster'] = kmeans.labels_
-
-        # Determine which cluster is 'tree' (highest mean NDVI)
-        cluster_means = [mean_ndvi_vals[gdf['cluster'] == i].mean() for i in range(n_clusters)]
-        tree_cluster_idx = np.argmax(cluster_means)
-
-        # Assign class labels: 1 = tree/canopy, 0 = open space
-        gdf['class'] = gdf['cluster'].apply(lambda x: 1 if x == tree_cluster_idx else 0)
-
-        # Dissolve polygons by class to merge connected polygons
-        dissolved_gdf = gdf.dissolve(by='class', as_index=False)
+            with rasterio.open(tilepath) as tile:
+                red = tile.read(1).astype(float)
+                nir = tile.read(4).astype(float)
+
+            # Compute NDVI and handle NaNs
+            ndvi = es.normalized_diff(nir, red)
+            ndvi = np.where(np.isnan(ndvi), 0, ndvi)
+
+            # Segment NDVI into an int32 label raster
+            segments = segment_ndvi(ndvi, segmentation, **(segmentation_params or {}))
+            print(f"{segmentation.capitalize()} number of segments: {len(np.unique(segments))}")
+
+            # Optional: save segment image
+            if plot_segments and plot_path:
+                img = io.imread(tilepath)
+                self.plot_segments(img, ndvi, segments, plot_path)
+
+            # Mean NDVI per segment computed directly on the label raster
+            segment_ndvi_stats = segment_statistics(segments, {'ndvi': ndvi}, statistics=('mean',))
+            segment_index = segment_ndvi_stats.index.to_numpy()
+            mean_ndvi_vals = segment_ndvi_stats['ndvi_mean'].values.reshape(-1, 1)
+
+        # Cluster the segments on mean NDVI; the cluster with the highest mean is 'tree'
+        clusters, tree_cluster_idx = cluster_segments(mean_ndvi_vals, n_clusters, clustering)
+
+        # Map the classes (1 = tree/canopy, 0 = open space) back onto the segment raster
+        # through a lookup table, so only the two-class raster is polygonized
+        class_lookup = np.zeros(segment_index.max() + 1, dtype=np.uint8)
+        class_lookup[segment_index] = clusters == tree_cluster_idx
+
+        if window_size:
+            # Classify, clean and polygonize the label GeoTIFF window by window
+            polys, classes = polygonize_segment_classes(
+                labels_path, class_lookup, cleanup=cleanup, window_size=window_size, workers=workers
+            )
+        else:
+            tree_mask = class_lookup[segments]
+            del segments
+
+            # Optional raster cleanup (opening/closing and minimum mapping unit sieve) of the tree mask
+            if cleanup is not None:
+                tree_mask, _ = cleanup.apply(tree_mask, resolution=abs(affine.a), crs=sr)
+
+            # Convert the tree mask to polygons in row blocks (in parallel when workers != 1)
+            polys, classes = polygonize_raster(tree_mask, affine, workers=workers)
+            del tree_mask
+
+        # Optionally drop the pixel-corner vertices, keeping shared boundaries intact
+        if simplify_tolerance:
+            polys, _ = simplify_polygons(polys, simplify_tolerance, simplify_boundary=False, cell_size=abs(affine.a))
+
+        # One MultiPolygon per class; polygons of a class built from one raster never
+        # overlap, so no dissolve (union) is needed
+        class_values = np.unique(classes)
+        dissolved_gdf = gpd.GeoDataFrame(
+            {'class': class_values.astype(int)},
+            geometry=[shapely.multipolygons(polys[classes == cls]) for cls in class_values],
+            crs=sr
+        )
 
         # Optional buffering
         if apply_buffering:
@@ -294,7 +331,8 @@ class KMeansProcessor():
 
         return buffered_gdf, openspace_gdf
     
-    def process_canopy_areas_imagery(self, canopy_gdf, proj_area_name, study_area, output_path, buffer_distance=5):
+    def process_canopy_areas_imagery(self, canopy_gdf, proj_area_name, study_area, output_path, buffer_distance=5,
+                                     output_format='shapefile', engine='vector', resolution=1.0):
         """
         Processes canopy areas by buffering, dissolving, clipping, and exploding the geometries.
         Adds acreage and size category columns.
@@ -309,6 +347,16 @@ class KMeansProcessor():
             File path to output processed shapefiles
         buffer_distance : float, optional
             The distance to buffer the canopy geometries. Default is 5 units.
+        output_format : {'shapefile', 'gpkg', 'fgb', 'parquet'}, optional
+            Format of the output layers, see `write_layers`. 'gpkg' writes all three
+            layers into one 'imagery_<proj_area_name>.gpkg'. Default is 'shapefile'.
+        engine : {'vector', 'raster'}, optional
+            'vector' buffers, unions and overlays the canopy polygons. 'raster' burns the
+            canopy into a grid, buffers it with a distance transform and sizes gaps from
+            pixel counts, see `canopy_gaps_raster`. Default is 'vector'.
+        resolution : float, optional
+            Cell size of the grid used by the 'raster' engine; use the resolution of the
+            imagery the canopy was derived from. Default is 1.0.
 
         Returns
         -------
@@ -324,54 +372,41 @@ class KMeansProcessor():
         if canopy_gdf.crs is None or study_area.crs is None:
             raise ValueError("Input GeoDataFrames must have a CRS defined.")
 
-        # Buffer the canopy geometries
-        buffered_canopy = canopy_gdf.geometry.buffer(buffer_distance)
-
-        # Create a new GeoDataFrame with the buffered geometries
-        buffer_gdf = gpd.GeoDataFrame(geometry=buffered_canopy, crs=canopy_gdf.crs)
-
-        # Dissolve the buffered geometries into a single MultiPolygon
-        dissolved_canopy = unary_union(buffer_gdf.geometry)
+        if engine == 'vector':
+            # Buffer the canopy geometries
+            buffered_canopy = canopy_gdf.geometry.buffer(buffer_distance)
 
-        # Convert the dissolved canopy back to a GeoDataFrame
-        dissolved_canopy_gdf = gpd.GeoDataFrame(geometry=[dissolved_canopy], crs=canopy_gdf.crs)
+            # Create a new GeoDataFrame with the buffered geometries
+            buffer_gdf = gpd.GeoDataFrame(geometry=buffered_canopy, crs=canopy_gdf.crs)
 
-        # Clip the dissolved canopy with the study area
-        clipped_buffer = gpd.overlay(dissolved_canopy_gdf, study_area, how='intersection')
+            # Dissolve the buffered geometries into a single MultiPolygon
+            dissolved_canopy = unary_union(buffer_gdf.geometry)
 
-        # Calculate the difference between the study area and the clipped buffer
-        non_tree_canopy_gdf = gpd.overlay(study_area, clipped_buffer, how='difference')
+            # Convert the dissolved canopy back to a GeoDataFrame
+            dissolved_canopy_gdf = gpd.GeoDataFrame(geometry=[dissolved_canopy], crs=canopy_gdf.crs)
 
-        # Explode multipart polygon to prepare for area calculations
-        exploded_gap_gdf = non_tree_canopy_gdf.explode(index_parts=True)
+            # Clip the dissolved canopy with the study area
+            clipped_buffer = gpd.overlay(dissolved_canopy_gdf, study_area, how='intersection')
 
-        # Reset the index to have a clean DataFrame
-        exploded_gap_gdf.reset_index(drop=True, inplace=True)
+            # Calculate the difference between the study area and the clipped buffer
+            non_tree_canopy_gdf = gpd.overlay(study_area, clipped_buffer, how='difference')
 
-        # Calculate the area in acres (1 acre = 43,560 square feet)
-        exploded_gap_gdf['Acreage'] = exploded_gap_gdf.geometry.area / 43560
-
-        # Define a function to categorize the gap size
-        def categorize_gap_size(acres):
-            if acres < 1/8:
-                return '< 1/8 acre'
-            elif 1/8 <= acres < 1/4:
-                return '1/8 - 1/4 acre'
-            elif 1/4 <= acres < 1/2:
-                return '1/4 - 1/2 acre'
-            elif 1/2 <= acres < 1:
-                return '1/2 - 1 acre'
-            else:
-                return '> 1 acre'
+            # Explode multipart polygon to prepare for area calculations
+            exploded_gap_gdf = non_tree_canopy_gdf.explode(index_parts=True)
 
-        # Apply the categorization function to the Acreage column
-        exploded_gap_gdf['Gap_Size_Category'] = exploded_gap_gdf['Acreage'].apply(categorize_gap_size)
+            # Reset the index to have a clean DataFrame
+            exploded_gap_gdf.reset_index(drop=True, inplace=True)
 
-        # Output shapefiles
+            # Calculate the area in acres and categorize the gap sizes
+            exploded_gap_gdf['Acreage'] = exploded_gap_gdf.geometry.area / SQFT_PER_ACRE
+            exploded_gap_gdf['Gap_Size_Category'] = categorize_gap_sizes(exploded_gap_gdf['Acreage'])
+        elif engine == 'raster':
+            clipped_buffer, exploded_gap_gdf = canopy_gaps_raster(canopy_gdf, study_area, buffer_distance, resolution)
+        else:
+            raise ValueError(f"Unsupported engine '{engine}'. Use 'vector' or 'raster'.")
 
-        canopy_gaps_calced_path = os.path.join(output_path,'imagery_'+ proj_area_name + '_canopy_gaps_calced.shp')
-        exploded_gap_gdf.to_file(canopy_gaps_calced_path)
-        dissolved_canopy_path = os.path.join(output_path, 'imagery_'+ proj_area_name + '_canopy.shp')
-        canopy_gdf.to_file(dissolved_canopy_path)
-        buffered_canopy_path = os.path.join(output_path,'imagery_'+ proj_area_name + '_buffered_canopy.shp')
-        clipped_buffer.to_file(buffered_canopy_path)
\ No newline at end of file
+        # Output layers
+        write_layers(
+            {'canopy_gaps_calced': exploded_gap_gdf, 'canopy': canopy_gdf, 'buffered_canopy': clipped_buffer},
+            output_path, 'imagery_' + proj_area_name, output_format
+        )
\ No newline at end of file
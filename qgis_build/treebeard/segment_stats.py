@@ -0,0 +1,110 @@
+# Utility methods used to compute per-segment statistics directly from a label raster
+import numpy as np
+import pandas as pd
+
+# Statistics computed when none are requested
+DEFAULT_STATISTICS = ('mean',)
+
+SUPPORTED_STATISTICS = ('count', 'mean', 'std', 'min', 'max')
+
+
+def _percentiles(values, labels, counts, starts, percentiles):
+    # Percentiles of every segment from one sort of the pixels by (label, value), with
+    # linear interpolation between the closest ranks as in np.percentile. Sorting by
+    # value and then stably by label is about twice as fast as np.lexsort.
+    order = np.argsort(values)
+    order = order[np.argsort(labels[order], kind='stable')]
+    sorted_values = values[order]
+    present = counts > 0
+    results = {}
+    for q in percentiles:
+        rank = (counts[present] - 1) * (q / 100)
+        lower = np.floor(rank).astype(np.int64)
+        upper = np.minimum(lower + 1, counts[present] - 1)
+        fraction = rank - lower
+        low_values = sorted_values[starts[present] + lower]
+        high_values = sorted_values[starts[present] + upper]
+        results[q] = low_values + (high_values - low_values) * fraction
+    return results
+
+
+def segment_statistics(labels, bands, statistics=DEFAULT_STATISTICS, percentiles=()):
+    """
+    Computes statistics of one or more bands for every segment of a label raster.
+
+    Works on the label raster itself instead of on segment polygons: counts, sums and
+    sums of squares come from `np.bincount`, minima and maxima from unbuffered ufunc
+    reductions (`np.minimum.at`), and percentiles from a single sort of the pixels by
+    segment and value. Every statistic of a band therefore costs a few passes over the
+    pixels, however many segments there are.
+
+    Parameters
+    ----------
+    labels : np.ndarray
+        2D raster of non-negative integer segment labels, e.g. from `segment_ndvi`.
+    bands : dict or np.ndarray
+        Band name to 2D array of the shape of `labels`, or a single 2D array (named
+        'band') or a 3D (band, row, column) array (named 'band1', 'band2', ...).
+    statistics : sequence of str, optional
+        Any of 'count', 'mean', 'std' (population), 'min' and 'max'. Default is ('mean',).
+    percentiles : sequence of float, optional
+        Percentiles (0 to 100) to compute for every band, e.g. (10, 50, 90). Default is none.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per segment present in `labels`, indexed by label, with a
+        '<band>_<statistic>' column per band and statistic ('<band>_p<q>' for
+        percentiles) and a single 'count' column if requested.
+
+    Examples
+    --------
+    >>> stats = segment_statistics(segments, {'ndvi': ndvi}, statistics=('mean', 'std'), percentiles=(50,))
+    >>> stats['ndvi_mean']
+    """
+    unsupported = set(statistics) - set(SUPPORTED_STATISTICS)
+    if unsupported:
+        raise ValueError(
+            f"Unsupported statistics {sorted(unsupported)}. Use any of {', '.join(SUPPORTED_STATISTICS)}."
+        )
+    if isinstance(bands, np.ndarray):
+        if bands.ndim == 2:
+            bands = {'band': bands}
+        else:
+            bands = {f'band{i + 1}': band for i, band in enumerate(bands)}
+
+    labels = np.asarray(labels).ravel()
+    counts = np.bincount(labels)
+    present = np.flatnonzero(counts)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+
+    columns = {}
+    if 'count' in statistics:
+        columns['count'] = counts[present]
+
+    for name, band in bands.items():
+        values = np.asarray(band, dtype=np.float64).ravel()
+        if values.shape != labels.shape:
+            raise ValueError(f"Band '{name}' does not match the shape of the label raster.")
+
+        if 'mean' in statistics or 'std' in statistics:
+            sums = np.bincount(labels, weights=values, minlength=len(counts))[present]
+            means = sums / counts[present]
+            if 'mean' in statistics:
+                columns[f'{name}_mean'] = means
+            if 'std' in statistics:
+                squares = np.bincount(labels, weights=values * values, minlength=len(counts))[present]
+                columns[f'{name}_std'] = np.sqrt(np.maximum(squares / counts[present] - means ** 2, 0))
+        if 'min' in statistics:
+            minima = np.full(len(counts), np.inf)
+            np.minimum.at(minima, labels, values)
+            columns[f'{name}_min'] = minima[present]
+        if 'max' in statistics:
+            maxima = np.full(len(counts), -np.inf)
+            np.maximum.at(maxima, labels, values)
+            columns[f'{name}_max'] = maxima[present]
+        if percentiles:
+            for q, result in _percentiles(values, labels, counts, starts, percentiles).items():
+                columns[f'{name}_p{q:g}'] = result
+
+    return pd.DataFrame(columns, index=pd.Index(present, name='segment'))
@@ -66,7 +66,7 @@ call "%OSGeo4W_SETUP%" ^
 echo.
 echo Installing additional dependencies...
 call "%OSGeo4W_SETUP%" ^
-    python3 -m pip install --no-cache-dir --force-reinstall geopandas shapely scipy whitebox scikit-learn fiona pyogrio laspy earthpy tqdm
+    python3 -m pip install --no-cache-dir --force-reinstall geopandas shapely scipy whitebox scikit-learn fiona pyogrio laspy lazrs earthpy tqdm
 
 echo.
 echo Verifying installed packages...
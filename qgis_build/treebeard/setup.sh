@@ -22,7 +22,7 @@ export PYTHONNOUSERSITE=1
 echo "Installing dependencies using OSGeo4W..."
 source "$OSGEO_SETUP"
 python3 -m pip install --upgrade pip && \
-python3 -m pip install --force-reinstall rioxarray rasterio geopandas shapely scipy whitebox scikit-learn fiona pyogrio laspy earthpy tqdm && \
+python3 -m pip install --force-reinstall rioxarray rasterio geopandas shapely scipy whitebox scikit-learn fiona pyogrio laspy lazrs earthpy tqdm && \
 python3 -c "import rioxarray, rasterio, geopandas, shapely; print('Packages installed correctly')"
 
 # Check if there was an error during the installation
@@ -0,0 +1,295 @@
+# Utility methods used to segment large imagery mosaics window by window into a label raster on disk
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import earthpy.spatial as es
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+from .raster_polygons import polygonize_windows
+from .segmentation import segment_ndvi
+
+# Side of the core windows segmented independently, in pixels
+DEFAULT_WINDOW_SIZE = 2048
+
+# Pixels of context read around each core window
+DEFAULT_OVERLAP = 64
+
+# Block size of the label GeoTIFF
+LABEL_BLOCK_SIZE = 256
+
+
+def _read_ndvi(src, window):
+    # NDVI of a window of a 4-band (R, G, B, NIR) image, with NaN set to 0 as in
+    # generate_binary_gdf_ndvi
+    red = src.read(1, window=window).astype(float)
+    nir = src.read(4, window=window).astype(float)
+    ndvi = es.normalized_diff(nir, red)
+    return np.where(np.isnan(ndvi), 0, ndvi)
+
+
+def _segment_window(tilepath, core, overlap, method, params):
+    # Segments a core window with `overlap` pixels of context and returns the labels of
+    # the core plus, for each side, the labels of the core's edge pixels and of the
+    # pixels just outside it (the first row/column of the context)
+    row, col, height, width = core
+    with rasterio.open(tilepath) as src:
+        row0, col0 = max(row - overlap, 0), max(col - overlap, 0)
+        row1, col1 = min(row + height + overlap, src.height), min(col + width + overlap, src.width)
+        ndvi = _read_ndvi(src, Window(col0, row0, col1 - col0, row1 - row0))
+
+    labels = segment_ndvi(ndvi, method, **params)
+    r, c = row - row0, col - col0
+    core_labels = labels[r:r + height, c:c + width]
+
+    # Edge strips as (inside, outside) pairs; None where the core is on the image edge
+    edges = {
+        'top': (labels[r, c:c + width], labels[r - 1, c:c + width]) if r > 0 else None,
+        'bottom': (labels[r + height - 1, c:c + width], labels[r + height, c:c + width])
+        if r + height < labels.shape[0] else None,
+        'left': (labels[r:r + height, c], labels[r:r + height, c - 1]) if c > 0 else None,
+        'right': (labels[r:r + height, c + width - 1], labels[r:r + height, c + width])
+        if c + width < labels.shape[1] else None,
+    }
+    return np.ascontiguousarray(core_labels), edges
+
+
+def _windows(height, width, window_size):
+    # Windows of at most window_size pixels covering a raster, row by row
+    return [
+        Window(col, row, min(window_size, width - col), min(window_size, height - row))
+        for row in range(0, height, window_size)
+        for col in range(0, width, window_size)
+    ]
+
+
+def _class_window(labels_path, class_lookup, cleanup, context, resolution, crs, core):
+    # Reads the labels of a core window with `context` pixels around it, maps them to
+    # classes and returns the (optionally cleaned) classes of the core
+    row, col, height, width = core
+    with rasterio.open(labels_path) as src:
+        row0, col0 = max(row - context, 0), max(col - context, 0)
+        row1, col1 = min(row + height + context, src.height), min(col + width + context, src.width)
+        classes = class_lookup[src.read(1, window=Window(col0, row0, col1 - col0, row1 - row0))]
+    if cleanup is None:
+        return classes
+    return cleanup.apply_window(classes, (row - row0, col - col0, height, width), resolution=resolution, crs=crs)
+
+
+def _seam_pairs(first_edge, second_edge, first_offset, second_offset):
+    # Pairs of global labels to merge across a seam. `first_edge` is the (inside,
+    # outside) strip of the window before the seam and `second_edge` that of the window
+    # after it, so first's outside pixels are second's inside pixels and vice versa. A
+    # pair is merged only where both windows agree their segment crosses the seam.
+    first_in, first_out = first_edge
+    second_in, second_out = second_edge
+    agree = (first_in == first_out) & (second_in == second_out)
+    return first_in[agree] + first_offset, second_in[agree] + second_offset
+
+
+def segment_raster_tiled(tilepath, labels_path, method='slic', params=None, window_size=DEFAULT_WINDOW_SIZE,
+                         overlap=DEFAULT_OVERLAP, workers=1):
+    """
+    Segments the NDVI of a large image window by window into a label GeoTIFF.
+
+    The image is split into core windows of `window_size` pixels. Each is segmented
+    independently (in a process pool when `workers` is not 1) with `overlap` pixels of
+    context around it, so segments are shaped the same way near window edges as in the
+    interior. Only the core of each window is kept and written to `labels_path` with an
+    offset that makes its labels unique. Segments cut by a window edge are then joined:
+    across every seam, two labels are merged where both windows agree that the segment
+    continues over the seam, i.e. each window gave the pixels on both sides of the seam
+    the same label. The merged labels are renumbered consecutively in a second pass over
+    the label raster. Memory use is set by the window size, not by the image size.
+
+    Parameters
+    ----------
+    tilepath : str
+        Path to a 4-band (R, G, B, NIR) GeoTIFF, e.g. a merged and cropped DRAPP mosaic.
+    labels_path : str
+        Path of the int32 label GeoTIFF to write.
+    method : str, optional
+        Segmentation backend, see `SEGMENTATION_METHODS`. Default is 'slic', since its
+        segment sizes do not depend on the window size.
+    params : dict, optional
+        Parameters of the segmentation backend (default is None, the backend defaults).
+    window_size : int, optional
+        Side of the core windows in pixels. Default is `DEFAULT_WINDOW_SIZE`.
+    overlap : int, optional
+        Pixels of context read around each core window; at least 1. Default is
+        `DEFAULT_OVERLAP`.
+    workers : int, optional
+        Number of worker processes. 1 segments the windows in this process and None uses
+        every available core (default is 1).
+
+    Returns
+    -------
+    int
+        Number of segments in the label raster, labelled 0 to n - 1.
+    """
+    if overlap < 1:
+        raise ValueError("overlap must be at least 1 pixel to reconcile segments across windows.")
+    params = params or {}
+
+    with rasterio.open(tilepath) as src:
+        height, width = src.height, src.width
+        profile = {
+            'driver': 'GTiff',
+            'height': height,
+            'width': width,
+            'count': 1,
+            'dtype': 'int32',
+            'crs': src.crs,
+            'transform': src.transform,
+            'tiled': True,
+            'blockxsize': LABEL_BLOCK_SIZE,
+            'blockysize': LABEL_BLOCK_SIZE,
+            'compress': 'deflate',
+            'BIGTIFF': 'IF_SAFER',
+        }
+
+    cores = [
+        (row, col, min(window_size, height - row), min(window_size, width - col))
+        for row in range(0, height, window_size)
+        for col in range(0, width, window_size)
+    ]
+    n_cols = len(range(0, width, window_size))
+
+    os.makedirs(os.path.dirname(os.path.abspath(labels_path)), exist_ok=True)
+    offsets = []
+    edges = []
+    used = []
+    next_label = 0
+    args = ([tilepath] * len(cores), cores, [overlap] * len(cores), [method] * len(cores), [params] * len(cores))
+    serial = len(cores) == 1 or (workers is not None and workers <= 1)
+    executor = None if serial else ProcessPoolExecutor(max_workers=workers)
+    try:
+        results = map(_segment_window, *args) if serial else executor.map(_segment_window, *args)
+        with rasterio.open(labels_path, 'w', **profile) as dst:
+            # Write each core with an offset as its result comes in
+            for (row, col, core_height, core_width), (core_labels, core_edges) in zip(cores, results):
+                dst.write(core_labels + next_label, 1, window=Window(col, row, core_width, core_height))
+                offsets.append(next_label)
+                edges.append(core_edges)
+                used.append(np.unique(core_labels) + next_label)
+                next_label += int(core_labels.max()) + 1
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    # Merge the labels of segments that cross a seam
+    first = [np.empty(0, dtype=np.int64)]
+    second = [np.empty(0, dtype=np.int64)]
+    for index in range(len(cores)):
+        right = index + 1
+        if edges[index]['right'] is not None and right % n_cols:
+            pair = _seam_pairs(edges[index]['right'], edges[right]['left'], offsets[index], offsets[right])
+            first.append(pair[0])
+            second.append(pair[1])
+        below = index + n_cols
+        if edges[index]['bottom'] is not None and below < len(cores):
+            pair = _seam_pairs(edges[index]['bottom'], edges[below]['top'], offsets[index], offsets[below])
+            first.append(pair[0])
+            second.append(pair[1])
+    first, second = np.concatenate(first), np.concatenate(second)
+    graph = coo_matrix((np.ones(len(first), dtype=bool), (first, second)), shape=(next_label, next_label))
+    _, components = connected_components(graph, directed=False)
+
+    # Number the merged segments consecutively, skipping labels no window used
+    used = np.concatenate(used)
+    lookup = np.zeros(next_label, dtype=np.int32)
+    merged, lookup[used] = np.unique(components[used], return_inverse=True)
+    n_segments = len(merged)
+    window_segments = len(used)
+
+    # Renumber the label raster in place, one strip of blocks at a time
+    with rasterio.open(labels_path, 'r+') as dst:
+        for row in range(0, height, LABEL_BLOCK_SIZE):
+            window = Window(0, row, width, min(LABEL_BLOCK_SIZE, height - row))
+            dst.write(lookup[dst.read(1, window=window)], 1, window=window)
+
+    print(f"Tiled segmentation: {len(cores)} windows, {window_segments} window segments merged into {n_segments}.")
+    return n_segments
+
+
+def segment_mean_ndvi(tilepath, labels_path, n_segments, window_size=DEFAULT_WINDOW_SIZE):
+    """
+    Computes the mean NDVI of every segment of a label GeoTIFF, window by window.
+
+    Sums and counts of the NDVI of each segment are accumulated with `np.bincount` over
+    windows of the image and of the label raster, so neither is ever read whole.
+
+    Parameters
+    ----------
+    tilepath : str
+        Path to the 4-band (R, G, B, NIR) GeoTIFF the labels were computed from.
+    labels_path : str
+        Path of the label GeoTIFF, e.g. written by `segment_raster_tiled`.
+    n_segments : int
+        Number of segments, labelled 0 to n - 1.
+    window_size : int, optional
+        Side of the windows read at once, in pixels. Default is `DEFAULT_WINDOW_SIZE`.
+
+    Returns
+    -------
+    np.ndarray
+        Mean NDVI of each segment, indexed by label.
+    """
+    sums = np.zeros(n_segments)
+    counts = np.zeros(n_segments, dtype=np.int64)
+    with rasterio.open(tilepath) as src, rasterio.open(labels_path) as labels_src:
+        for window in _windows(labels_src.height, labels_src.width, window_size):
+            labels = labels_src.read(1, window=window).ravel()
+            ndvi = _read_ndvi(src, window).ravel()
+            sums += np.bincount(labels, weights=ndvi, minlength=n_segments)
+            counts += np.bincount(labels, minlength=n_segments)
+    return sums / np.maximum(counts, 1)
+
+
+def polygonize_segment_classes(labels_path, class_lookup, cleanup=None, window_size=DEFAULT_WINDOW_SIZE, workers=1):
+    """
+    Classifies the segments of a label GeoTIFF and polygonizes the classes, window by window.
+
+    Each window of the label raster is mapped to classes through `class_lookup`,
+    optionally cleaned with `MaskCleanup.apply_window` (with the context it needs read
+    around the window, so the result matches cleaning the whole mask) and polygonized
+    with `polygonize_windows`, which stitches the polygons across window seams. Memory
+    use is set by the window size and the polygons, not by the image size.
+
+    Parameters
+    ----------
+    labels_path : str
+        Path of the label GeoTIFF, e.g. written by `segment_raster_tiled`.
+    class_lookup : np.ndarray
+        uint8 class of each segment, indexed by label (e.g. 1 for tree, 0 for not tree).
+    cleanup : MaskCleanup, optional
+        Cleanup applied to the class mask before it is polygonized. Default is None.
+    window_size : int, optional
+        Side of the windows in pixels. Default is `DEFAULT_WINDOW_SIZE`.
+    workers : int, optional
+        Number of worker processes. 1 works in this process and None uses every
+        available core (default is 1).
+
+    Returns
+    -------
+    polygons : np.ndarray
+        Array of shapely Polygons, one per connected region of a class.
+    values : np.ndarray
+        Class of each polygon.
+    """
+    with rasterio.open(labels_path) as src:
+        shape = (src.height, src.width)
+        transform = src.transform
+        crs = src.crs
+
+    resolution = abs(transform.a)
+    context = 0 if cleanup is None else cleanup.context_pixels(resolution, crs)
+    read_window = partial(_class_window, labels_path, class_lookup, cleanup, context, resolution, crs)
+    polygons, values = polygonize_windows(read_window, shape, transform, window_size=window_size, workers=workers)
+    if cleanup is not None:
+        print(f"Mask cleanup applied window by window with {context} pixels of context.")
+    return polygons, values
@@ -0,0 +1,49 @@
+# Makes the utils modules importable when pytest is run from any directory, and
+# provides synthetic LiDAR tiles
+import os
+import sys
+
+import laspy
+import numpy as np
+import pytest
+from pyproj import CRS
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Projected CRS of the synthetic LiDAR tiles, in US survey feet
+TILE_CRS = CRS.from_epsg(6430)
+
+
+@pytest.fixture
+def write_tile(tmp_path):
+    """
+    Returns a function that writes a small synthetic LAS or LAZ tile and returns its path.
+
+    The tile is a gently sloping ground with a round 40 ft tree, with about 40% of the
+    points classified as ground.
+    """
+    def write(name, x0=3000000.0, y0=1700000.0, size=100.0, n_points=5000, seed=0):
+        rng = np.random.default_rng(seed)
+        header = laspy.LasHeader(point_format=3, version='1.2')
+        header.offsets = [x0, y0, 0]
+        header.scales = [0.01, 0.01, 0.01]
+        header.add_crs(TILE_CRS)
+        las = laspy.LasData(header)
+
+        x = x0 + rng.uniform(0, size, n_points)
+        y = y0 + rng.uniform(0, size, n_points)
+        ground = 5000 + 0.01 * (x - x0)
+        tree = (x - x0 - size / 2) ** 2 + (y - y0 - size / 2) ** 2 < (size / 4) ** 2
+        is_ground = rng.random(n_points) < 0.4
+        las.x = x
+        las.y = y
+        las.z = np.where(is_ground, ground, np.where(tree, ground + 40, ground + rng.uniform(0, 1, n_points)))
+        las.classification = np.where(is_ground, 2, 1).astype(np.uint8)
+        las.return_number = np.where(is_ground & tree, 2, 1).astype(np.uint8)
+        las.number_of_returns = np.where(tree, 2, 1).astype(np.uint8)
+
+        path = str(tmp_path / name)
+        las.write(path)
+        return path
+
+    return write
@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+import rasterio
+import xarray as xr
+from rasterio.transform import from_origin
+
+from utils.canopy_height import (
+    CHM_INT16_SCALE,
+    HEIGHT_CLASS_NODATA,
+    canopy_mask,
+    canopy_masks,
+    height_classes,
+    read_chm,
+    write_chm,
+)
+from utils.lidar_grid import grid_to_dataarray
+
+
+def _chm(heights):
+    # Two identical rows so squeezing the band does not drop the y dimension
+    heights = np.tile(np.asarray(heights), (2, 1))
+    chm = xr.DataArray(
+        heights[np.newaxis],
+        dims=('band', 'y', 'x'),
+        coords={'band': [1], 'y': 1700000.5 - np.arange(heights.shape[0]), 'x': 3000000.5 + np.arange(heights.shape[1])},
+    )
+    chm = chm.rio.write_transform(from_origin(3000000, 1700001, 1, 1))
+    return chm.rio.write_crs('EPSG:6430')
+
+
+@pytest.mark.parametrize('dtype', [np.float32, np.float64])
+def test_masks_agree_with_canopy_mask_at_thresholds(dtype):
+    # Heights on and next to thresholds that float32 cannot represent exactly
+    thresholds = [3.3, 5, 10.1, 20.7]
+    values = np.array([0, 3.3, np.float32(3.3), np.nextafter(np.float32(3.3), 4), 5, 10.1, 20.7, 30, np.nan])
+    chm = _chm(values.astype(dtype))
+
+    masks = canopy_masks(chm, thresholds)
+    np.testing.assert_array_equal(masks['canopy_height'].values, thresholds)
+    for band, threshold in enumerate(thresholds):
+        mask, valid = canopy_mask(chm, threshold)
+        expected = np.where(valid == 1, mask, HEIGHT_CLASS_NODATA)
+        np.testing.assert_array_equal(masks.values[band], expected)
+    assert masks['canopy_height'].dtype == np.float64
+
+
+def test_height_classes():
+    chm = _chm(np.array([0, 3, 4.99, 5, 25, np.nan], dtype=np.float32))
+    np.testing.assert_array_equal(height_classes(chm, [20, 5, 3, 5]), [[0, 1, 1, 2, 3, HEIGHT_CLASS_NODATA]] * 2)
+    with pytest.raises(ValueError):
+        height_classes(chm, np.arange(HEIGHT_CLASS_NODATA))
+
+
+def _random_chm(shape=(70, 90), seed=0):
+    rng = np.random.default_rng(seed)
+    heights = rng.uniform(0, 150, shape).astype(np.float32)
+    heights[rng.random(shape) < 0.2] = np.nan
+    return grid_to_dataarray(heights, from_origin(3000000, 1700000, 3, 3), 'EPSG:6430', nodata=np.nan)
+
+
+def test_write_read_chm_float32(tmp_path):
+    chm = _random_chm()
+    chm_path = write_chm(chm, str(tmp_path / 'chm' / 'chm.tif'), blocksize=32)
+
+    result = read_chm(chm_path).squeeze()
+    np.testing.assert_array_equal(result.values, chm.squeeze().values)
+    assert result.rio.transform() == chm.rio.transform()
+    assert result.rio.crs == chm.rio.crs
+    with rasterio.open(chm_path) as src:
+        assert len(src.overviews(1)) == 5
+
+
+def test_write_read_chm_int16(tmp_path):
+    chm = _random_chm()
+    chm_path = write_chm(chm, str(tmp_path / 'chm.tif'), dtype='int16', blocksize=32)
+    with rasterio.open(chm_path) as src:
+        assert src.dtypes == ('int16',)
+        assert src.scales == (CHM_INT16_SCALE,)
+
+    heights = chm.squeeze().values
+    result = read_chm(chm_path).squeeze().values
+    np.testing.assert_array_equal(np.isnan(result), np.isnan(heights))
+    valid = ~np.isnan(heights)
+    assert np.abs(result[valid] - heights[valid]).max() <= CHM_INT16_SCALE / 2 + 1e-4
+
+
+def test_write_chm_rejects_unknown_dtype(tmp_path):
+    with pytest.raises(ValueError):
+        write_chm(_random_chm(), str(tmp_path / 'chm.tif'), dtype='uint8')
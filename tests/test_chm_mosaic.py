@@ -0,0 +1,84 @@
+import itertools
+
+import geopandas as gpd
+import numpy as np
+import pytest
+from rasterio.transform import from_origin
+from shapely.geometry import box
+
+from conftest import TILE_CRS
+from utils.chm_mosaic import ChmMosaic
+from utils.lidar_grid import grid_to_dataarray
+
+# Origin on the resolution lattice the mosaic grid snaps to
+X0, Y0, RESOLUTION = 3000000.0, 1700001.0, 3.0
+
+
+def _tile(col, row, shape, seed):
+    rng = np.random.default_rng(seed)
+    heights = rng.uniform(0, 100, shape).astype(np.float32)
+    heights[rng.random(shape) < 0.3] = np.nan
+    transform = from_origin(X0 + col * RESOLUTION, Y0 - row * RESOLUTION, RESOLUTION, RESOLUTION)
+    return grid_to_dataarray(heights, transform, TILE_CRS, nodata=np.nan)
+
+
+def _project_area(cols, rows):
+    area = box(X0, Y0 - rows * RESOLUTION, X0 + cols * RESOLUTION, Y0)
+    return gpd.GeoDataFrame(geometry=[area], crs=TILE_CRS)
+
+
+def _expected(tiles, shape):
+    # Brute force: the highest height any tile gives each mosaic cell
+    expected = np.full(shape, np.nan, dtype=np.float32)
+    for tile in tiles:
+        transform = tile.rio.transform()
+        col = int(round((transform.c - X0) / RESOLUTION))
+        row = int(round((Y0 - transform.f) / RESOLUTION))
+        values = tile.squeeze().values
+        for i, j in np.ndindex(values.shape):
+            if 0 <= row + i < shape[0] and 0 <= col + j < shape[1] and not np.isnan(values[i, j]):
+                if np.isnan(expected[row + i, col + j]) or values[i, j] > expected[row + i, col + j]:
+                    expected[row + i, col + j] = values[i, j]
+    return expected
+
+
+def test_overlapping_tiles_keep_the_highest_height_in_any_order():
+    # Three overlapping tiles, one running off the project area
+    tiles = [_tile(0, 0, (20, 25), 0), _tile(15, 10, (20, 25), 1), _tile(30, 5, (20, 25), 2)]
+    proj_area = _project_area(40, 28)
+    expected = _expected(tiles, (28, 40))
+
+    for order in itertools.permutations(tiles):
+        with ChmMosaic(proj_area) as mosaic:
+            assert all(mosaic.add(tile) for tile in order)
+            assert mosaic.tile_count == 3
+            np.testing.assert_array_equal(mosaic.chm.squeeze().values, expected)
+            assert mosaic.chm.rio.transform() == from_origin(X0, Y0, RESOLUTION, RESOLUTION)
+
+
+def test_tiles_are_clipped_to_the_project_area():
+    tile = _tile(0, 0, (10, 10), 3)
+    tile.values[:] = 50
+    # Triangle covering the upper left half of the tile
+    area = gpd.GeoDataFrame(
+        geometry=gpd.GeoSeries.from_wkt([f'POLYGON(({X0} {Y0}, {X0 + 30} {Y0}, {X0} {Y0 - 30}, {X0} {Y0}))']),
+        crs=TILE_CRS
+    )
+    with ChmMosaic(area) as mosaic:
+        mosaic.add(tile)
+        heights = mosaic.chm.squeeze().values.copy()
+    rows, cols = np.indices((10, 10))
+    # Cells whose centre lies inside the triangle; the diagonal has centres on its edge
+    assert (heights[rows + cols < 9] == 50).all()
+    assert np.isnan(heights[rows + cols >= 10]).all()
+
+
+def test_tile_outside_and_mismatched_tiles():
+    with ChmMosaic(_project_area(10, 10)) as mosaic:
+        assert not mosaic.add(_tile(50, 50, (5, 5), 4))
+        assert mosaic.tile_count == 0
+        with pytest.raises(ValueError):
+            mosaic.add(_tile(0, 0, (5, 5), 5).rio.write_crs('EPSG:2927'))
+        coarse = grid_to_dataarray(np.ones((5, 5), dtype=np.float32), from_origin(X0, Y0, 6, 6), TILE_CRS)
+        with pytest.raises(ValueError):
+            mosaic.add(coarse)
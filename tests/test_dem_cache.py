@@ -0,0 +1,105 @@
+import os
+import shutil
+
+import numpy as np
+from rasterio.transform import from_origin
+
+from utils.dem_cache import DemCache
+
+TRANSFORM = from_origin(3000000, 1700100, 1, 1)
+
+
+def _dems(seed):
+    rng = np.random.default_rng(seed)
+    return rng.random((50, 40)).astype(np.float32), rng.random((50, 40)).astype(np.float32)
+
+
+def _age(path, seconds=3600):
+    # Moves the modification time of a file back
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime - seconds, stat.st_mtime - seconds))
+
+
+def _files(directory, suffix):
+    return sorted(name for name in os.listdir(directory) if name.endswith(suffix))
+
+
+def test_hit_and_miss(write_tile, tmp_path):
+    las_path = write_tile('a.las')
+    cache = DemCache(str(tmp_path / 'cache'))
+    key = cache.key(las_path, resolution=1.0)
+    assert cache.load(key) is None
+
+    dsm, dtm = _dems(0)
+    cache.store(key, dsm, dtm, TRANSFORM, 'EPSG:6430')
+    cached_dsm, cached_dtm, transform, crs_wkt = cache.load(key)
+    np.testing.assert_array_equal(cached_dsm, dsm)
+    np.testing.assert_array_equal(cached_dtm, dtm)
+    assert transform == TRANSFORM
+    assert crs_wkt == 'EPSG:6430'
+
+    # A copy of the tile hits the same entry, other parameters or contents do not
+    shutil.copy(las_path, tmp_path / 'copy.las')
+    assert cache.key(str(tmp_path / 'copy.las'), resolution=1.0) == key
+    assert cache.load(cache.key(las_path, resolution=2.0)) is None
+    write_tile('a.las', seed=1)
+    assert cache.load(cache.key(las_path, resolution=1.0)) is None
+
+
+def test_evicts_least_recently_used(write_tile, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    cache = DemCache(cache_dir)
+    keys = [cache.key(write_tile(f'{name}.las', seed=seed)) for seed, name in enumerate('abc')]
+    for seed, key in enumerate(keys):
+        cache.store(key, *_dems(seed), TRANSFORM, 'EPSG:6430')
+        _age(os.path.join(cache_dir, key + '.npz'), 3600 * (3 - seed))
+    entry_bytes = os.path.getsize(os.path.join(cache_dir, keys[0] + '.npz'))
+
+    # Reading the oldest entry makes it the most recently used
+    assert cache.load(keys[0]) is not None
+    cache.max_bytes = 2.5 * entry_bytes
+    assert cache.evict() == 1
+    assert cache.load(keys[1]) is None
+    assert cache.load(keys[0]) is not None and cache.load(keys[2]) is not None
+    assert cache.evict() == 0
+
+
+def test_prunes_unused_digests_of_earlier_runs(write_tile, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    cache = DemCache(cache_dir)
+    keys = [cache.key(write_tile(f'{name}.las', seed=seed)) for seed, name in enumerate('ab')]
+    cache.store(keys[0], *_dems(0), TRANSFORM, 'EPSG:6430')
+    digest_dir = os.path.join(cache_dir, 'digests')
+    for name in os.listdir(digest_dir):
+        _age(os.path.join(digest_dir, name))
+
+    # The hash of b.las has no entry, but a worker of this run may still be storing it
+    cache = DemCache(cache_dir, max_bytes=0)
+    cache.key(str(tmp_path / 'b.las'))
+    assert cache.evict() == 1
+    assert len(_files(digest_dir, '.json')) == 1
+
+    # In a later run, it is pruned once an entry is evicted
+    _age(os.path.join(digest_dir, _files(digest_dir, '.json')[0]))
+    cache = DemCache(cache_dir, max_bytes=0)
+    cache.store(keys[0], *_dems(0), TRANSFORM, 'EPSG:6430')
+    assert cache.evict() == 1
+    assert _files(digest_dir, '.json') == []
+
+
+def test_temporary_files(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    cache = DemCache(cache_dir)
+    cache.store('digest_params', *_dems(0), TRANSFORM, 'EPSG:6430')
+    entry_bytes = os.path.getsize(os.path.join(cache_dir, 'digest_params.npz'))
+
+    # A write that crashed in an earlier run, and one still in progress in this run
+    stale = tmp_path / 'cache' / 'stale.tmp'
+    stale.write_bytes(b'0' * 100)
+    _age(str(stale))
+    (tmp_path / 'cache' / 'writing.tmp').write_bytes(b'0' * entry_bytes)
+
+    cache.max_bytes = 1.5 * entry_bytes
+    assert cache.evict() == 1
+    assert _files(cache_dir, '.tmp') == ['writing.tmp']
+    assert _files(cache_dir, '.npz') == []
@@ -0,0 +1,142 @@
+import hashlib
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from utils.downloads import DOWNLOAD_CHUNK_SIZE, PARTIAL_SUFFIX, VALIDATOR_SUFFIX, DownloadError, TileDownloader
+
+
+class _TileServer(ThreadingHTTPServer):
+    # Serves `content` at any path with Range and If-Range support. The first
+    # `truncate` responses are cut off after half of their body.
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), _TileHandler)
+        self.content = b''
+        self.truncate = 0
+        self.requests = []
+
+    @property
+    def etag(self):
+        return '"' + hashlib.md5(self.content).hexdigest() + '"'
+
+
+class _TileHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self._respond(body=False)
+
+    def do_GET(self):
+        self._respond(body=True)
+
+    def _respond(self, body):
+        server = self.server
+        content = server.content
+        server.requests.append(dict(self.headers))
+        start = 0
+        byte_range = self.headers.get('Range')
+        if_range = self.headers.get('If-Range')
+        if byte_range and (if_range is None or if_range == server.etag):
+            start = int(byte_range.split('=')[1].rstrip('-'))
+            if start >= len(content):
+                self.send_response(416)
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{len(content) - 1}/{len(content)}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(content) - start))
+        self.send_header('ETag', server.etag)
+        self.end_headers()
+        if not body:
+            return
+        payload = content[start:]
+        if server.truncate:
+            server.truncate -= 1
+            payload = payload[:len(payload) // 2]
+            self.close_connection = True
+        self.wfile.write(payload)
+
+
+@pytest.fixture
+def server():
+    server = _TileServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _url(server, name='tile.tif'):
+    return f'http://127.0.0.1:{server.server_address[1]}/{name}'
+
+
+def test_truncated_download_is_resumed(server, tmp_path):
+    # Cut off half way through the second chunk, so only the first chunk is on disk
+    server.content = os.urandom(3 * DOWNLOAD_CHUNK_SIZE)
+    server.truncate = 1
+    path = str(tmp_path / 'tile.tif')
+
+    TileDownloader(backoff=0).download(_url(server), path)
+
+    with open(path, 'rb') as f:
+        assert f.read() == server.content
+    assert server.requests[1]['Range'] == f'bytes={DOWNLOAD_CHUNK_SIZE}-'
+    assert server.requests[1]['If-Range'] == server.etag
+    assert not os.path.exists(path + PARTIAL_SUFFIX)
+    assert not os.path.exists(path + PARTIAL_SUFFIX + VALIDATOR_SUFFIX)
+
+
+def test_truncated_download_fails_after_retries(server, tmp_path):
+    server.content = os.urandom(100_000)
+    server.truncate = 10
+    path = str(tmp_path / 'tile.tif')
+
+    with pytest.raises(DownloadError):
+        TileDownloader(retries=1, backoff=0).download(_url(server), path)
+
+    # The partial file is kept under its own name for the next run to resume
+    assert not os.path.exists(path)
+    assert os.path.exists(path + PARTIAL_SUFFIX)
+
+
+def test_partial_download_of_a_changed_file_restarts(server, tmp_path):
+    server.content = os.urandom(3 * DOWNLOAD_CHUNK_SIZE)
+    server.truncate = 1
+    path = str(tmp_path / 'tile.tif')
+    with pytest.raises(DownloadError):
+        TileDownloader(retries=0).download(_url(server), path)
+    assert os.path.getsize(path + PARTIAL_SUFFIX) == DOWNLOAD_CHUNK_SIZE
+
+    # The file changes on the server before the download is resumed
+    server.content = os.urandom(4 * DOWNLOAD_CHUNK_SIZE)
+    TileDownloader(backoff=0).download(_url(server), path)
+
+    with open(path, 'rb') as f:
+        assert f.read() == server.content
+    assert server.requests[-1]['Range'] == f'bytes={DOWNLOAD_CHUNK_SIZE}-'
+
+
+def test_truncated_existing_file_is_downloaded_again(server, tmp_path):
+    server.content = os.urandom(10_000)
+    path = tmp_path / 'tile.tif'
+    path.write_bytes(server.content[:5_000])
+
+    TileDownloader(backoff=0).download(_url(server), str(path))
+
+    assert path.read_bytes() == server.content
+
+
+def test_download_all_reports_every_failure(server, tmp_path):
+    server.content = os.urandom(1_000)
+    urls = [_url(server, 'a.tif'), 'http://127.0.0.1:1/b.tif', 'not a url/c.tif']
+
+    with pytest.raises(DownloadError, match='2 of 3'):
+        TileDownloader(retries=0).download_all(urls, str(tmp_path))
+
+    assert (tmp_path / 'a.tif').read_bytes() == server.content
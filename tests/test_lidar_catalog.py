@@ -0,0 +1,63 @@
+import os
+
+import geopandas as gpd
+from shapely.geometry import box
+
+from conftest import TILE_CRS
+from utils.lidar_catalog import CATALOG_FILENAME, select_tiles, update_catalog
+
+
+def _tiles(write_tile):
+    # Three tiles of 100 ft in a row, the last one compressed
+    return [
+        write_tile('a.las', x0=3000000.0, seed=1),
+        write_tile('b.las', x0=3000100.0, seed=2),
+        write_tile('c.laz', x0=3000200.0, seed=3),
+    ]
+
+
+def test_catalog_is_read_once_and_refreshed(write_tile, tmp_path, capsys):
+    paths = _tiles(write_tile)
+    catalog_df = update_catalog(str(tmp_path))
+    assert catalog_df['path'].tolist() == sorted(os.path.abspath(path) for path in paths)
+    assert catalog_df['point_count'].tolist() == [5000] * 3
+    assert os.path.exists(tmp_path / CATALOG_FILENAME)
+    assert 'Catalog updated: 3 tile(s) read' in capsys.readouterr().out
+
+    # Nothing changed, so no header is read again
+    update_catalog(str(tmp_path))
+    assert 'Catalog updated' not in capsys.readouterr().out
+
+    os.remove(paths[1])
+    write_tile('a.las', x0=3000000.0, n_points=4000, seed=1)
+    catalog_df = update_catalog(str(tmp_path))
+    assert 'Catalog updated: 1 tile(s) read, 1 removed.' in capsys.readouterr().out
+    assert catalog_df['point_count'].tolist() == [4000, 5000]
+
+
+def test_select_tiles_prunes_by_bounds(write_tile, tmp_path):
+    paths = _tiles(write_tile)
+    catalog_df = update_catalog(str(tmp_path))
+
+    area = gpd.GeoDataFrame(geometry=[box(3000120, 1700020, 3000180, 1700080)], crs=TILE_CRS)
+    assert select_tiles(catalog_df, area)['path'].tolist() == [os.path.abspath(paths[1])]
+
+    # Project areas in another CRS are reprojected to the tiles' CRS
+    area = gpd.GeoDataFrame(geometry=[box(3000050, 1700020, 3000250, 1700080)], crs=TILE_CRS).to_crs(4326)
+    assert len(select_tiles(catalog_df, area)) == 3
+
+
+def test_unreadable_tile_is_skipped(write_tile, tmp_path, capsys):
+    paths = _tiles(write_tile)
+    update_catalog(str(tmp_path))
+
+    # Truncate one tile inside its header, and add a new one that is not a LAS file
+    with open(paths[0], 'r+b') as f:
+        f.truncate(50)
+    (tmp_path / 'd.las').write_bytes(b'not a las file')
+
+    catalog_df = update_catalog(str(tmp_path))
+    out = capsys.readouterr().out
+    assert f'Failed to catalog {os.path.abspath(paths[0])}' in out
+    assert 'Skipped 2 LAS file(s)' in out
+    assert catalog_df['path'].tolist() == [os.path.abspath(path) for path in paths[1:]]
@@ -0,0 +1,72 @@
+import laspy
+import numpy as np
+import pytest
+
+from utils.lidar_grid import (
+    GROUND_CLASS, accumulate_dems, fill_empty_cells, grid_from_bounds, open_point_cloud, read_dems
+)
+
+
+def _brute_force_dems(las, resolution, ground_statistic):
+    # DSM and DTM from a loop over the points, cell by cell
+    header = las.header
+    transform, (height, width) = grid_from_bounds(
+        (header.mins[0], header.mins[1], header.maxs[0], header.maxs[1]), resolution
+    )
+    first, ground = {}, {}
+    for x, y, z, return_number, classification in zip(
+        las.x, las.y, las.z, las.return_number, las.classification
+    ):
+        col = min(int(np.floor((x - transform.c) / resolution)), width - 1)
+        row = min(int(np.floor((transform.f - y) / resolution)), height - 1)
+        if return_number == 1:
+            first.setdefault((row, col), []).append(z)
+        if classification == GROUND_CLASS:
+            ground.setdefault((row, col), []).append(z)
+
+    dsm = np.full((height, width), np.nan)
+    dtm = np.full((height, width), np.nan)
+    for (row, col), values in first.items():
+        dsm[row, col] = max(values)
+    for (row, col), values in ground.items():
+        dtm[row, col] = min(values) if ground_statistic == 'min' else np.mean(values)
+    return dsm.astype(np.float32), dtm.astype(np.float32), transform
+
+
+@pytest.mark.parametrize('ground_statistic', ['min', 'mean'])
+@pytest.mark.parametrize('resolution', [1.0, 2.5])
+def test_dems_match_brute_force(write_tile, ground_statistic, resolution):
+    las = laspy.read(write_tile('tile.las', n_points=3000, size=40))
+    dsm, dtm, transform = accumulate_dems(las.header, [las], resolution, ground_statistic, fill_radius=0)
+    expected_dsm, expected_dtm, expected_transform = _brute_force_dems(las, resolution, ground_statistic)
+
+    assert transform == expected_transform
+    np.testing.assert_array_equal(dsm, expected_dsm)
+    np.testing.assert_allclose(dtm, expected_dtm, rtol=1e-6)
+
+
+@pytest.mark.parametrize('name', ['tile.las', 'tile.laz'])
+@pytest.mark.parametrize('ground_statistic', ['min', 'mean'])
+def test_chunked_read_matches_whole_tile(write_tile, name, ground_statistic):
+    path = write_tile(name)
+    with open_point_cloud(path) as reader:
+        whole = read_dems(reader, ground_statistic=ground_statistic)
+    with open_point_cloud(path) as reader:
+        chunked = read_dems(reader, chunk_size=777, ground_statistic=ground_statistic)
+
+    np.testing.assert_allclose(chunked[0], whole[0])
+    np.testing.assert_allclose(chunked[1], whole[1], rtol=1e-6)
+    assert chunked[2] == whole[2]
+
+
+def test_grid_snaps_to_resolution():
+    transform, shape = grid_from_bounds((10.2, 20.7, 15.1, 23.0), resolution=2.0)
+    assert (transform.c, transform.f, transform.a, transform.e) == (10.0, 24.0, 2.0, -2.0)
+    assert shape == (2, 3)
+
+
+def test_fill_empty_cells_within_radius():
+    grid = np.full((1, 6), np.nan)
+    grid[0, 0] = 1.0
+    filled = fill_empty_cells(grid, max_distance=2)
+    np.testing.assert_array_equal(filled, [[1.0, 1.0, 1.0, np.nan, np.nan, np.nan]])
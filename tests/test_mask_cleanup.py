@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+from scipy import ndimage
+
+from utils.mask_cleanup import MaskCleanup
+
+
+def _mask(seed):
+    rng = np.random.default_rng(seed)
+    return ndimage.gaussian_filter(rng.normal(size=(150, 170)), 1.5) > 0.1
+
+
+def _clean_by_window(cleanup, mask, window_size):
+    # Cleans a mask window by window, reading each with the context it needs
+    context = cleanup.context_pixels()
+    height, width = mask.shape
+    cleaned = np.zeros(mask.shape, dtype=np.uint8)
+    for row in range(0, height, window_size):
+        for col in range(0, width, window_size):
+            core_height, core_width = min(window_size, height - row), min(window_size, width - col)
+            row0, col0 = max(row - context, 0), max(col - context, 0)
+            row1, col1 = min(row + core_height + context, height), min(col + core_width + context, width)
+            cleaned[row:row + core_height, col:col + core_width] = cleanup.apply_window(
+                mask[row0:row1, col0:col1], (row - row0, col - col0, core_height, core_width)
+            )
+    return cleaned
+
+
+@pytest.mark.parametrize('cleanup', [
+    MaskCleanup(opening_iterations=1),
+    MaskCleanup(closing_iterations=2, structure='square'),
+    MaskCleanup(min_pixels=40),
+    MaskCleanup(opening_iterations=1, closing_iterations=1, min_pixels=120),
+])
+@pytest.mark.parametrize('window_size', [16, 37, 500])
+def test_windows_match_whole_mask(cleanup, window_size):
+    mask = _mask(window_size)
+    expected, _ = cleanup.apply(mask)
+    np.testing.assert_array_equal(_clean_by_window(cleanup, mask, window_size), expected)
+
+
+def test_context_pixels():
+    assert MaskCleanup().context_pixels() == 0
+    assert MaskCleanup(opening_iterations=1, closing_iterations=2).context_pixels() == 6
+    assert MaskCleanup(opening_iterations=1, structure='square', min_pixels=10).context_pixels() == 11
+    # 0.01 acre is 435.6 square feet, so 109 cells of 2 feet
+    assert MaskCleanup(min_acres=0.01).context_pixels(resolution=2.0) == 108
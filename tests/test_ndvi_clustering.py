@@ -0,0 +1,67 @@
+from itertools import combinations
+
+import numpy as np
+import pytest
+
+from utils.ndvi_clustering import cluster_segments, optimal_breaks
+
+
+def _partition_cost(values, weights, breaks):
+    # Weighted within-cluster sum of squares of the partition starting at `breaks`
+    cost = 0.0
+    for start, end in zip([0, *breaks], [*breaks, len(values)]):
+        v, w = values[start:end], weights[start:end]
+        cost += np.sum(w * (v - np.average(v, weights=w)) ** 2)
+    return cost
+
+
+def _brute_force_cost(values, weights, n_clusters):
+    return min(
+        _partition_cost(values, weights, breaks)
+        for breaks in combinations(range(1, len(values)), n_clusters - 1)
+    )
+
+
+@pytest.mark.parametrize('n_clusters', [2, 3, 4])
+@pytest.mark.parametrize('weighted', [False, True])
+def test_optimal_breaks_matches_brute_force(n_clusters, weighted):
+    rng = np.random.default_rng(n_clusters)
+    for _ in range(20):
+        values = np.sort(rng.normal(size=rng.integers(n_clusters, 12)))
+        weights = rng.integers(1, 20, size=len(values)).astype(float) if weighted else np.ones(len(values))
+        breaks = optimal_breaks(values, n_clusters, weights=weights if weighted else None)
+        assert len(breaks) == n_clusters - 1
+        assert np.all(np.diff([0, *breaks, len(values)]) > 0)
+        assert _partition_cost(values, weights, breaks) == pytest.approx(_brute_force_cost(values, weights, n_clusters))
+
+
+@pytest.mark.parametrize('method', ['kmeans1d', 'jenks', 'otsu'])
+def test_tree_cluster_has_highest_ndvi(method):
+    rng = np.random.default_rng(0)
+    ndvi = np.concatenate([rng.normal(0.1, 0.05, 200), rng.normal(0.6, 0.05, 100)])
+    labels, tree_cluster_idx = cluster_segments(ndvi, method=method)
+    assert np.all(labels[200:] == tree_cluster_idx)
+    assert np.all(labels[:200] != tree_cluster_idx)
+
+
+@pytest.mark.parametrize('method', ['kmeans1d', 'jenks', 'otsu'])
+def test_uniform_ndvi_forms_one_cluster(method):
+    labels, tree_cluster_idx = cluster_segments(np.full(50, 0.4), method=method)
+    assert np.all(labels == 0)
+    assert tree_cluster_idx == 0
+
+
+@pytest.mark.parametrize('method', ['kmeans1d', 'jenks', 'otsu'])
+def test_fewer_values_than_clusters(method):
+    labels, tree_cluster_idx = cluster_segments([0.1, 0.7], n_clusters=3, method=method)
+    assert labels.tolist() == [0, 1]
+    assert tree_cluster_idx == 1
+
+    labels, tree_cluster_idx = cluster_segments([0.1, 0.1, 0.7, 0.7], n_clusters=3, method=method)
+    assert labels.tolist() == [0, 0, 1, 1]
+    assert tree_cluster_idx == 1
+
+
+def test_single_feature_backends_reject_several_features():
+    with pytest.raises(ValueError):
+        cluster_segments(np.zeros((10, 2)), method='kmeans1d')
@@ -0,0 +1,75 @@
+import threading
+
+import geopandas as gpd
+import numpy as np
+from shapely.geometry import box
+
+from conftest import TILE_CRS
+from utils import process_lidar
+from utils.lidar_grid import open_point_cloud
+from utils.process_lidar import _project_mosaics, iter_las_tiles, process_las_tile
+
+# Seconds a pool of two workers may take for a few small tiles before it counts as hung
+POOL_TIMEOUT = 120
+
+
+def _run_tiles(las_files, **kwargs):
+    # Runs iter_las_tiles in a thread so a hung pool fails the test instead of hanging it
+    results = []
+    thread = threading.Thread(target=lambda: results.extend(iter_las_tiles(las_files, **kwargs)), daemon=True)
+    thread.start()
+    thread.join(POOL_TIMEOUT)
+    assert not thread.is_alive(), "The tile pool did not finish."
+    return results
+
+
+def test_workers_after_serial_laz_read(write_tile):
+    las_files = [write_tile(f'tile{i}.laz', x0=3000000.0 + 100 * i, seed=i) for i in range(3)]
+
+    # Decompress a LAZ file in this process first, which starts its lazrs thread pool
+    with open_point_cloud(las_files[0]) as las_reader:
+        assert len(las_reader.read().points) == 5000
+
+    results = _run_tiles(las_files, workers=2, laz_threads=1)
+    assert sorted(las_filename for las_filename, _, _ in results) == las_files
+    assert all(error is None for _, _, error in results)
+
+    # The workers grid each tile the same way as this process
+    for las_filename, chm, _ in results:
+        np.testing.assert_array_equal(chm.values, process_las_tile(las_filename).values)
+
+
+def test_failed_tile_does_not_stop_the_others(write_tile, tmp_path):
+    las_files = [write_tile('good.las'), str(tmp_path / 'missing.las')]
+    for workers in (1, 2):
+        results = {las_filename: error for las_filename, _, error in _run_tiles(las_files, workers=workers)}
+        assert results[las_files[0]] is None
+        assert isinstance(results[las_files[1]], Exception)
+
+
+def test_project_mosaics_read_shared_tiles_once(write_tile, tmp_path, monkeypatch):
+    # Three tiles in a row; the two project areas share the middle one
+    las_files = [write_tile(f'tile{i}.las', x0=3000000.0 + 100 * i, seed=i) for i in range(3)]
+    las_folder = str(tmp_path)
+    proj_areas = {
+        proj_id: gpd.GeoDataFrame({'Proj_ID': [proj_id]}, geometry=[box(x0, 1700010.0, x0 + 180, 1700090.0)], crs=TILE_CRS)
+        for proj_id, x0 in [('west', 3000010.0), ('east', 3000110.0)]
+    }
+
+    reads = []
+
+    def counting_process_las_tile(las_filename, **kwargs):
+        reads.append(las_filename)
+        return process_las_tile(las_filename, **kwargs)
+
+    monkeypatch.setattr(process_lidar, 'process_las_tile', counting_process_las_tile)
+    with _project_mosaics(proj_areas, las_folder, str(tmp_path), use_cache=False) as mosaics:
+        assert sorted(reads) == las_files
+        assert {proj_id: mosaic.tile_count for proj_id, mosaic in mosaics.items()} == {'west': 2, 'east': 2}
+        batch = {proj_id: mosaic.chm.squeeze().values.copy() for proj_id, mosaic in mosaics.items()}
+
+    # Each area's mosaic matches processing that area on its own
+    for proj_id, proj_area in proj_areas.items():
+        with _project_mosaics({proj_id: proj_area}, las_folder, str(tmp_path), use_cache=False) as mosaics:
+            np.testing.assert_array_equal(mosaics[proj_id].chm.squeeze().values, batch[proj_id])
+            assert np.isfinite(batch[proj_id]).mean() > 0.9
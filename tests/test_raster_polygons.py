@@ -0,0 +1,78 @@
+from functools import partial
+
+import numpy as np
+import pytest
+import shapely
+from rasterio.transform import from_origin
+from scipy import ndimage
+
+from utils.raster_polygons import polygonize_raster, polygonize_windows
+
+TRANSFORM = from_origin(1000.0, 2000.0, 0.5, 0.5)
+
+
+def _blobs(shape, seed):
+    # Smoothed noise quantized into a few classes, giving regions of many shapes that
+    # cross block seams, with holes and diagonal contacts
+    rng = np.random.default_rng(seed)
+    noise = ndimage.gaussian_filter(rng.normal(size=shape), 2)
+    return np.digitize(noise, np.quantile(noise, [0.3, 0.6, 0.8])).astype(np.int32)
+
+
+def _read_window(raster, window):
+    row, col, height, width = window
+    return raster[row:row + height, col:col + width]
+
+
+def _assert_same_polygons(expected, actual):
+    expected_polygons, expected_values = expected
+    actual_polygons, actual_values = actual
+    assert len(actual_polygons) == len(expected_polygons)
+    assert sorted(actual_values.tolist()) == sorted(expected_values.tolist())
+    assert np.all(shapely.is_valid(actual_polygons))
+
+    # Match every polygon to the polygon of the same value at the same place
+    tree = shapely.STRtree(expected_polygons)
+    points = shapely.point_on_surface(actual_polygons)
+    actual_index, expected_index = tree.query(points, predicate='within')
+    assert np.array_equal(np.sort(actual_index), np.arange(len(actual_polygons)))
+    assert np.all(actual_values[actual_index] == expected_values[expected_index])
+    assert np.all(shapely.equals(actual_polygons[actual_index], expected_polygons[expected_index]))
+    # No collinear vertices are left on the seams
+    assert np.array_equal(
+        shapely.get_num_coordinates(actual_polygons[actual_index]),
+        shapely.get_num_coordinates(expected_polygons[expected_index])
+    )
+
+
+@pytest.mark.parametrize('block_rows', [1, 7, 32])
+def test_blocks_match_single_pass(block_rows):
+    raster = _blobs((90, 70), seed=block_rows)
+    single = polygonize_raster(raster, TRANSFORM, block_rows=raster.shape[0])
+    _assert_same_polygons(single, polygonize_raster(raster, TRANSFORM, block_rows=block_rows))
+
+
+def test_masked_blocks_match_single_pass():
+    raster = _blobs((80, 60), seed=1)
+    mask = raster >= 2
+    single = polygonize_raster(raster, TRANSFORM, mask=mask, block_rows=raster.shape[0])
+    blocked = polygonize_raster(raster, TRANSFORM, mask=mask, block_rows=9)
+    _assert_same_polygons(single, blocked)
+    assert set(blocked[1].tolist()) <= {2, 3}
+
+
+def test_workers_match_serial_blocks():
+    raster = _blobs((60, 50), seed=2)
+    serial = polygonize_raster(raster, TRANSFORM, block_rows=16)
+    _assert_same_polygons(serial, polygonize_raster(raster, TRANSFORM, block_rows=16, workers=2))
+
+
+@pytest.mark.parametrize('window_size', [8, 25, 200])
+def test_windows_match_single_pass(window_size):
+    raster = _blobs((90, 70), seed=window_size)
+    single = polygonize_raster(raster, TRANSFORM, block_rows=raster.shape[0])
+    windowed = polygonize_windows(
+        partial(_read_window, raster), raster.shape, TRANSFORM, window_size=window_size, workers=2
+    )
+    _assert_same_polygons(single, windowed)
+    assert windowed[1].dtype == raster.dtype
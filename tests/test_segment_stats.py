@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.segment_stats import segment_statistics
+
+
+def _labels_and_bands(seed=0):
+    rng = np.random.default_rng(seed)
+    # Labels with gaps (unused labels) and segments of a single pixel
+    labels = rng.choice([0, 1, 2, 5, 9, 40], size=(30, 40), p=[0.3, 0.3, 0.2, 0.1, 0.0975, 0.0025])
+    labels[0, 0] = 40
+    bands = {'ndvi': rng.normal(0.3, 0.2, labels.shape), 'red': rng.integers(0, 255, labels.shape)}
+    return labels, bands
+
+
+def _expected(labels, bands):
+    frame = pd.DataFrame({name: np.ravel(band).astype(float) for name, band in bands.items()})
+    frame['segment'] = labels.ravel()
+    return frame.groupby('segment')
+
+
+def test_statistics_match_pandas_groupby():
+    labels, bands = _labels_and_bands()
+    stats = segment_statistics(labels, bands, statistics=('count', 'mean', 'std', 'min', 'max'))
+    grouped = _expected(labels, bands)
+
+    assert stats.index.tolist() == sorted(np.unique(labels).tolist())
+    assert stats.index.name == 'segment'
+    np.testing.assert_array_equal(stats['count'], grouped.size())
+    for name in bands:
+        np.testing.assert_allclose(stats[f'{name}_mean'], grouped[name].mean())
+        np.testing.assert_allclose(stats[f'{name}_std'], grouped[name].std(ddof=0), atol=1e-9)
+        np.testing.assert_array_equal(stats[f'{name}_min'], grouped[name].min())
+        np.testing.assert_array_equal(stats[f'{name}_max'], grouped[name].max())
+
+
+def test_percentiles_match_pandas_groupby():
+    labels, bands = _labels_and_bands(seed=1)
+    stats = segment_statistics(labels, bands, statistics=(), percentiles=(0, 10, 50, 62.5, 100))
+    grouped = _expected(labels, bands)
+
+    assert 'count' not in stats
+    for name in bands:
+        for q in (0, 10, 50, 62.5, 100):
+            np.testing.assert_allclose(stats[f'{name}_p{q:g}'], grouped[name].quantile(q / 100))
+
+
+def test_array_bands_are_named_by_position():
+    labels, bands = _labels_and_bands()
+    stack = np.stack([bands['ndvi'], bands['red']])
+    assert list(segment_statistics(labels, stack).columns) == ['band1_mean', 'band2_mean']
+    assert list(segment_statistics(labels, bands['ndvi']).columns) == ['band_mean']
+
+
+def test_invalid_input_is_rejected():
+    labels, bands = _labels_and_bands()
+    with pytest.raises(ValueError):
+        segment_statistics(labels, bands, statistics=('median',))
+    with pytest.raises(ValueError):
+        segment_statistics(labels, {'ndvi': bands['ndvi'][:-1]})
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+import rasterio
+import shapely
+from rasterio.transform import from_origin
+from scipy import ndimage
+
+pytest.importorskip('earthpy')
+
+from utils.mask_cleanup import MaskCleanup  # noqa: E402
+from utils.raster_polygons import polygonize_raster  # noqa: E402
+from utils.segment_stats import segment_statistics  # noqa: E402
+from utils.tiled_segmentation import (  # noqa: E402
+    polygonize_segment_classes, segment_mean_ndvi, segment_raster_tiled
+)
+
+
+@pytest.fixture
+def tilepath(tmp_path):
+    # A 4-band (R, G, B, NIR) image of blobs of canopy
+    rng = np.random.default_rng(1)
+    tree = ndimage.gaussian_filter(rng.random((120, 100)), 4) > 0.5
+    red = np.where(tree, 60, 150) + rng.integers(0, 20, tree.shape)
+    nir = np.where(tree, 200, 120) + rng.integers(0, 20, tree.shape)
+    other = np.full(tree.shape, 100)
+    path = str(tmp_path / 'tile.tif')
+    with rasterio.open(
+        path, 'w', driver='GTiff', height=120, width=100, count=4, dtype='uint8', crs='EPSG:6430',
+        transform=from_origin(3000000, 1700000, 1, 1)
+    ) as dst:
+        dst.write(np.stack([red, other, other, nir]).astype(np.uint8))
+    return path
+
+
+def _read_whole(tilepath, labels_path):
+    with rasterio.open(tilepath) as src:
+        red = src.read(1).astype(float)
+        nir = src.read(4).astype(float)
+        transform = src.transform
+    with rasterio.open(labels_path) as src:
+        labels = src.read(1)
+    return labels, np.nan_to_num((nir - red) / (nir + red)), transform
+
+
+def test_mean_ndvi_matches_whole_image(tilepath, tmp_path):
+    labels_path = str(tmp_path / 'labels.tif')
+    n_segments = segment_raster_tiled(tilepath, labels_path, 'slic', window_size=40)
+    labels, ndvi, _ = _read_whole(tilepath, labels_path)
+
+    means = segment_mean_ndvi(tilepath, labels_path, n_segments, window_size=32)
+    expected = segment_statistics(labels, {'ndvi': ndvi})['ndvi_mean']
+    np.testing.assert_allclose(means, expected.to_numpy())
+
+
+@pytest.mark.parametrize('cleanup', [None, MaskCleanup(opening_iterations=1, closing_iterations=1, min_pixels=30)])
+def test_class_polygons_match_whole_image(tilepath, tmp_path, cleanup):
+    labels_path = str(tmp_path / 'labels.tif')
+    n_segments = segment_raster_tiled(tilepath, labels_path, 'slic', window_size=40)
+    labels, ndvi, transform = _read_whole(tilepath, labels_path)
+    class_lookup = (segment_mean_ndvi(tilepath, labels_path, n_segments) > 0.1).astype(np.uint8)
+
+    mask = class_lookup[labels]
+    if cleanup is not None:
+        mask, _ = cleanup.apply(mask, crs='EPSG:6430')
+    expected_polygons, expected_values = polygonize_raster(mask, transform)
+    polygons, values = polygonize_segment_classes(labels_path, class_lookup, cleanup=cleanup, window_size=32)
+
+    assert sorted(values.tolist()) == sorted(expected_values.tolist())
+    for value in (0, 1):
+        actual = shapely.union_all(polygons[values == value])
+        expected = shapely.union_all(expected_polygons[expected_values == value])
+        assert shapely.equals(actual, expected)
@@ -0,0 +1,60 @@
+# Utility methods used to size canopy gaps in acres and classify them by size
+import numpy as np
+import pandas as pd
+from rasterio.crs import CRS
+from rasterio.errors import CRSError
+
+# Square feet per acre; gap areas assume a CRS in feet
+SQFT_PER_ACRE = 43560
+
+# Square metres per acre
+SQM_PER_ACRE = 4046.8564224
+
+# Gap size classes: lower bounds in acres and their labels
+GAP_SIZE_BINS = [0, 1/8, 1/4, 1/2, 1, np.inf]
+GAP_SIZE_LABELS = ['< 1/8 acre', '1/8 - 1/4 acre', '1/4 - 1/2 acre', '1/2 - 1 acre', '> 1 acre']
+
+
+def categorize_gap_sizes(acres):
+    """
+    Assigns each gap area to a size category.
+
+    Parameters
+    ----------
+    acres : array-like
+        Gap areas in acres.
+
+    Returns
+    -------
+    np.ndarray
+        Category label of each gap, using `GAP_SIZE_LABELS`.
+    """
+    categories = pd.cut(np.asarray(acres, dtype=float), bins=GAP_SIZE_BINS, labels=GAP_SIZE_LABELS, right=False)
+    return np.asarray(categories.astype(str), dtype=object)
+
+
+def square_units_per_acre(crs=None):
+    """
+    Returns the number of square CRS units in an acre.
+
+    Parameters
+    ----------
+    crs : rasterio.crs.CRS, pyproj.CRS or str, optional
+        Projected CRS the areas are measured in. Default is None, a CRS in feet.
+
+    Returns
+    -------
+    float
+        Square map units per acre, e.g. 43560 for CRSs in feet and about 4046.86 for
+        CRSs in metres.
+    """
+    if crs is None:
+        return SQFT_PER_ACRE
+    try:
+        unit, metres_per_unit = CRS.from_user_input(crs).linear_units_factor
+    except CRSError as e:
+        raise ValueError(f"Areas in acres need a projected CRS: {e}") from e
+    # The acre is defined in feet, so CRSs in (US survey) feet use it as is
+    if 'foot' in unit.lower() or 'feet' in unit.lower():
+        return SQFT_PER_ACRE
+    return SQM_PER_ACRE / metres_per_unit ** 2
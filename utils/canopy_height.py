@@ -0,0 +1,298 @@
+# Utility methods used to store and reload canopy height models (CHMs)
+import os
+
+import numpy as np
+import rasterio
+import rioxarray as rxr
+import xarray as xr
+from rasterio.enums import Resampling
+from rasterio.windows import Window
+
+# Scale of CHMs stored as int16 (0.01 units, so heights up to ~327 units)
+CHM_INT16_SCALE = 0.01
+CHM_INT16_NODATA = -32768
+
+# Overview levels built into stored CHMs
+CHM_OVERVIEW_LEVELS = [2, 4, 8, 16, 32]
+
+# Nodata value of height class and canopy mask rasters
+HEIGHT_CLASS_NODATA = 255
+
+
+def write_chm(chm, chm_path, dtype='float32', blocksize=512):
+    """
+    Writes a canopy height model to a tiled, compressed GeoTIFF with overviews.
+
+    Parameters
+    ----------
+    chm : xr.DataArray
+        Single band canopy height model with NaN marking cells without data.
+    chm_path : str
+        Path of the GeoTIFF to write. Parent folders are created if needed.
+    dtype : {'float32', 'int16'}, optional
+        Storage type. 'int16' stores heights scaled by `CHM_INT16_SCALE`, halving the file
+        size; the scale is recorded in the file so readers get heights back. Default is
+        'float32'.
+    blocksize : int, optional
+        Tile size in pixels. Default is 512.
+
+    Returns
+    -------
+    str
+        The path of the written GeoTIFF.
+    """
+    chm = chm.squeeze()
+    height, width = chm.shape
+
+    if dtype == 'float32':
+        nodata = np.nan
+        predictor = 3
+        scale = 1.0
+    elif dtype == 'int16':
+        nodata = CHM_INT16_NODATA
+        predictor = 2
+        scale = CHM_INT16_SCALE
+    else:
+        raise ValueError(f"Unsupported CHM dtype '{dtype}'. Use 'float32' or 'int16'.")
+
+    os.makedirs(os.path.dirname(os.path.abspath(chm_path)), exist_ok=True)
+
+    profile = {
+        'driver': 'GTiff',
+        'height': height,
+        'width': width,
+        'count': 1,
+        'dtype': dtype,
+        'crs': chm.rio.crs,
+        'transform': chm.rio.transform(),
+        'nodata': nodata,
+        'tiled': True,
+        'blockxsize': blocksize,
+        'blockysize': blocksize,
+        'compress': 'deflate',
+        'predictor': predictor,
+        'BIGTIFF': 'IF_SAFER',
+    }
+    with rasterio.open(chm_path, 'w', **profile) as dst:
+        # Write one strip of blocks at a time so the CHM can be larger than memory
+        for row in range(0, height, blocksize):
+            heights = np.asarray(chm[row:row + blocksize], dtype=np.float32)
+            if dtype == 'int16':
+                heights = _encode_int16(heights)
+            dst.write(heights, 1, window=Window(0, row, width, heights.shape[0]))
+        dst.scales = (scale,)
+        levels = [level for level in CHM_OVERVIEW_LEVELS if min(height, width) // level >= 1]
+        if levels:
+            dst.build_overviews(levels, Resampling.average)
+            dst.update_tags(ns='rio_overview', resampling='average')
+
+    return chm_path
+
+
+def _encode_int16(heights):
+    valid = ~np.isnan(heights)
+    data = np.full(heights.shape, CHM_INT16_NODATA, dtype=np.int16)
+    data[valid] = np.clip(
+        np.round(heights[valid] / CHM_INT16_SCALE),
+        CHM_INT16_NODATA + 1,
+        np.iinfo(np.int16).max
+    )
+    return data
+
+
+def read_chm(chm_path):
+    """
+    Reads a canopy height model written by `write_chm`.
+
+    Parameters
+    ----------
+    chm_path : str
+        Path to the CHM GeoTIFF.
+
+    Returns
+    -------
+    xr.DataArray
+        Single band float canopy height model with NaN marking cells without data.
+    """
+    return rxr.open_rasterio(chm_path, masked=True, mask_and_scale=True)
+
+
+def _at_least(heights, threshold, out):
+    # Heights greater than or equal to a threshold, compared in float64 whatever the CHM
+    # dtype (a float32 threshold of e.g. 3.3 is lower than 3.3) so every path agrees on
+    # cells at a threshold. The ufunc casts the heights in buffered blocks, without a
+    # full-size float64 copy.
+    return np.greater_equal(heights, threshold, out=out, signature=(np.float64, np.float64, np.bool_))
+
+
+def canopy_mask(chm, canopy_height=5, packed=False):
+    """
+    Thresholds a canopy height model into a compact canopy mask and a validity mask.
+
+    The threshold and the nodata handling are fused into a single comparison (NaN never
+    compares greater than or equal to the threshold, which is compared in float64),
+    written straight into a 1 byte per cell buffer with no float or int temporaries.
+
+    Parameters
+    ----------
+    chm : xr.DataArray or np.ndarray
+        Single band canopy height model with NaN marking cells without data.
+    canopy_height : float, optional
+        Cells greater than or equal to this height are canopy. Default is 5.
+    packed : bool, optional
+        Whether to return the masks bit-packed along rows with `np.packbits` (1 bit per
+        cell). Use `unpack_mask` to restore them. Default is False.
+
+    Returns
+    -------
+    mask : np.ndarray
+        2D uint8 array, 1 for canopy and 0 for no canopy or no data.
+    valid : np.ndarray
+        2D uint8 array, 1 where the CHM has data.
+    """
+    heights = np.asarray(getattr(chm, 'data', chm)).squeeze()
+
+    mask = np.empty(heights.shape, dtype=bool)
+    _at_least(heights, canopy_height, mask)
+    valid = np.empty(heights.shape, dtype=bool)
+    np.isnan(heights, out=valid)
+    np.logical_not(valid, out=valid)
+
+    if packed:
+        return np.packbits(mask, axis=-1), np.packbits(valid, axis=-1)
+    return mask.view(np.uint8), valid.view(np.uint8)
+
+
+def unpack_mask(packed_mask, width):
+    """
+    Restores a mask bit-packed by `canopy_mask`.
+
+    Parameters
+    ----------
+    packed_mask : np.ndarray
+        Mask packed along rows with `np.packbits`.
+    width : int
+        Number of columns of the original mask.
+
+    Returns
+    -------
+    np.ndarray
+        2D uint8 array of 0s and 1s.
+    """
+    return np.unpackbits(packed_mask, axis=-1, count=width)
+
+
+def height_classes(chm, canopy_heights):
+    """
+    Stratifies a canopy height model into height classes.
+
+    Each threshold is compared in float64, as in `canopy_mask`, so a cell is in the class
+    of a threshold exactly when `canopy_mask` marks it as canopy at that height.
+
+    Parameters
+    ----------
+    chm : xr.DataArray
+        Single band canopy height model with NaN marking cells without data.
+    canopy_heights : list of float
+        Height thresholds, e.g. [3, 5, 10, 15, 20]. Sorted and deduplicated.
+
+    Returns
+    -------
+    np.ndarray
+        2D uint8 raster holding, for each cell, the number of thresholds its height is
+        greater than or equal to (0 below the lowest threshold), and
+        `HEIGHT_CLASS_NODATA` where the CHM has no data.
+    """
+    thresholds = np.unique(np.asarray(canopy_heights, dtype=np.float64))
+    if len(thresholds) >= HEIGHT_CLASS_NODATA:
+        raise ValueError(f"At most {HEIGHT_CLASS_NODATA - 1} canopy heights are supported.")
+
+    heights = np.asarray(getattr(chm, 'data', chm)).squeeze()
+    classes = np.zeros(heights.shape, dtype=np.uint8)
+    at_least = np.empty(heights.shape, dtype=bool)
+    for threshold in thresholds:
+        np.add(classes, _at_least(heights, threshold, at_least), out=classes)
+    classes[np.isnan(heights)] = HEIGHT_CLASS_NODATA
+    return classes
+
+
+def canopy_masks(chm, canopy_heights):
+    """
+    Builds one binary canopy mask per height threshold from a canopy height model.
+
+    Parameters
+    ----------
+    chm : xr.DataArray
+        Single band canopy height model with NaN marking cells without data.
+    canopy_heights : list of float
+        Height thresholds. Sorted and deduplicated; band i holds the i-th lowest threshold.
+
+    Returns
+    -------
+    xr.DataArray
+        uint8 raster with one band per threshold, 1 where the height is greater than or
+        equal to the threshold, 0 below it and `HEIGHT_CLASS_NODATA` where the CHM has no
+        data. The thresholds are stored in the 'canopy_height' coordinate.
+    """
+    thresholds = np.unique(np.asarray(canopy_heights, dtype=np.float64))
+    classes = height_classes(chm, thresholds)
+
+    masks = np.empty((len(thresholds),) + classes.shape, dtype=np.uint8)
+    for band in range(len(thresholds)):
+        np.greater(classes, band, out=masks[band])
+    masks[:, classes == HEIGHT_CLASS_NODATA] = HEIGHT_CLASS_NODATA
+
+    template = chm.squeeze()
+    masks = xr.DataArray(
+        masks,
+        dims=('band', 'y', 'x'),
+        coords={'band': np.arange(1, len(thresholds) + 1), 'y': template.y, 'x': template.x,
+                'canopy_height': ('band', thresholds)},
+    )
+    masks = masks.rio.write_transform(template.rio.transform())
+    masks = masks.rio.write_crs(template.rio.crs)
+    return masks.rio.write_nodata(HEIGHT_CLASS_NODATA)
+
+
+def write_canopy_masks(masks, masks_path, blocksize=512):
+    """
+    Writes per-threshold canopy masks to a single compact multi-band uint8 GeoTIFF.
+
+    Parameters
+    ----------
+    masks : xr.DataArray
+        Canopy masks from `canopy_masks`.
+    masks_path : str
+        Path of the GeoTIFF to write. Parent folders are created if needed.
+    blocksize : int, optional
+        Tile size in pixels. Default is 512.
+
+    Returns
+    -------
+    str
+        The path of the written GeoTIFF. Each band is described as 'canopy >= <height>'.
+    """
+    count, height, width = masks.shape
+    os.makedirs(os.path.dirname(os.path.abspath(masks_path)), exist_ok=True)
+
+    profile = {
+        'driver': 'GTiff',
+        'height': height,
+        'width': width,
+        'count': count,
+        'dtype': 'uint8',
+        'crs': masks.rio.crs,
+        'transform': masks.rio.transform(),
+        'nodata': HEIGHT_CLASS_NODATA,
+        'tiled': True,
+        'blockxsize': blocksize,
+        'blockysize': blocksize,
+        'compress': 'deflate',
+        'interleave': 'pixel',
+    }
+    with rasterio.open(masks_path, 'w', **profile) as dst:
+        dst.write(masks.values)
+        for band, canopy_height in enumerate(masks['canopy_height'].values, start=1):
+            dst.set_band_description(band, f"canopy >= {canopy_height:g}")
+
+    return masks_path
@@ -0,0 +1,130 @@
+# Utility methods used to mosaic per-tile canopy height models on disk
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from rasterio.features import geometry_mask
+from rasterio.transform import Affine
+
+from .lidar_grid import grid_from_bounds, grid_to_dataarray
+
+
+class ChmMosaic:
+    """
+    Streams per-tile canopy height models into a memory-mapped mosaic clipped to a project area.
+
+    The output grid is computed from the project area bounds when the first tile is added,
+    on the same resolution lattice the tiles are gridded on, so every tile maps onto a
+    whole-cell window of the mosaic. Each tile is cropped to its window and masked to the
+    project area as it is added, and the mosaic itself lives in a memory-mapped scratch
+    file, so only about one tile is held in memory regardless of the project area size.
+
+    Where tiles overlap, the mosaic keeps the highest canopy height of the overlapping
+    tiles. Unlike keeping the first tile added, this does not depend on the order tiles
+    are added in, so mosaics built from tiles processed in parallel are reproducible.
+
+    Parameters
+    ----------
+    proj_area : gpd.GeoDataFrame
+        The project area the mosaic is clipped to.
+    scratch_dir : str, optional
+        Directory in which the memory-mapped scratch file is created. It is removed when
+        the mosaic is closed. Defaults to the system temporary directory.
+
+    Examples
+    --------
+    >>> with ChmMosaic(proj_area) as mosaic:
+    ...     for tile_chm in tile_chms:
+    ...         mosaic.add(tile_chm)
+    ...     write_chm(mosaic.chm, "canopy_height_model.tif")
+    """
+
+    def __init__(self, proj_area, scratch_dir=None):
+        self.proj_area = proj_area
+        self.scratch_dir = scratch_dir
+        self.chm = None
+        self.tile_count = 0
+        self._work_dir = None
+        self._mosaic = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _allocate(self, tile_chm):
+        crs = tile_chm.rio.crs
+        resolution = tile_chm.rio.transform().a
+
+        self.geometry = self.proj_area.to_crs(crs).geometry
+        self.transform, self.shape = grid_from_bounds(self.geometry.total_bounds, resolution)
+
+        self._work_dir = tempfile.mkdtemp(prefix='chm_mosaic_', dir=self.scratch_dir)
+        self._mosaic = np.lib.format.open_memmap(
+            os.path.join(self._work_dir, 'chm.npy'),
+            mode='w+',
+            dtype=np.float32,
+            shape=self.shape
+        )
+        self._mosaic.fill(np.nan)
+        self.chm = grid_to_dataarray(self._mosaic, self.transform, crs, nodata=np.nan)
+
+    def add(self, tile_chm):
+        """
+        Writes a tile into the mosaic, clipped to the project area.
+
+        Parameters
+        ----------
+        tile_chm : xr.DataArray
+            Single band canopy height model of a tile, as returned by `process_las_tile`.
+
+        Returns
+        -------
+        bool
+            False if the tile lies entirely outside the mosaic grid.
+        """
+        if self._mosaic is None:
+            self._allocate(tile_chm)
+        elif tile_chm.rio.crs != self.chm.rio.crs:
+            raise ValueError(f"Tile CRS {tile_chm.rio.crs} does not match the mosaic CRS {self.chm.rio.crs}.")
+
+        tile_transform = tile_chm.rio.transform()
+        if not np.isclose(tile_transform.a, self.transform.a):
+            raise ValueError(f"Tile resolution {tile_transform.a} does not match the mosaic resolution {self.transform.a}.")
+
+        values = np.asarray(tile_chm.squeeze(), dtype=np.float32)
+        col_off = int(round((tile_transform.c - self.transform.c) / self.transform.a))
+        row_off = int(round((tile_transform.f - self.transform.f) / self.transform.e))
+
+        # Intersect the tile with the mosaic grid
+        row_start, col_start = max(row_off, 0), max(col_off, 0)
+        row_stop = min(row_off + values.shape[0], self.shape[0])
+        col_stop = min(col_off + values.shape[1], self.shape[1])
+        if row_start >= row_stop or col_start >= col_stop:
+            return False
+
+        values = values[row_start - row_off:row_stop - row_off, col_start - col_off:col_stop - col_off]
+        outside = geometry_mask(
+            self.geometry,
+            out_shape=values.shape,
+            transform=self.transform * Affine.translation(col_start, row_start)
+        )
+
+        window = self._mosaic[row_start:row_stop, col_start:col_stop]
+        inside = ~outside
+        # np.fmax ignores NaN, so cells only one tile covers keep that tile's height
+        window[inside] = np.fmax(window[inside], values[inside])
+        self.tile_count += 1
+        return True
+
+    def close(self):
+        """
+        Releases the mosaic and removes its scratch file. `chm` is no longer usable afterwards.
+        """
+        self.chm = None
+        self._mosaic = None
+        if self._work_dir is not None:
+            shutil.rmtree(self._work_dir, ignore_errors=True)
+            self._work_dir = None
@@ -0,0 +1,248 @@
+# Utility methods used to cache gridded LIDAR DEMs between runs
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+from rasterio.transform import Affine
+
+# Bump when the gridding algorithm changes so stale DEMs are never reused
+DEM_CACHE_VERSION = 1
+
+# Default cap on the total size of cached DEMs (10 GB)
+DEFAULT_CACHE_BYTES = 10 * 1024 ** 3
+
+
+def file_digest(path, block_size=8 * 1024 ** 2):
+    """
+    Computes the BLAKE2b content hash of a file.
+
+    Parameters
+    ----------
+    path : str
+        Path to the file.
+    block_size : int, optional
+        Number of bytes read at a time. Default is 8 MB.
+
+    Returns
+    -------
+    str
+        Hex digest of the file contents.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class DemCache:
+    """
+    Content-addressed cache of first return and ground return DEMs.
+
+    Entries are keyed by the hash of the LAS file contents plus the gridding parameters,
+    so renamed or copied tiles still hit the cache and changed tiles never do. Each entry
+    is a single compressed .npz file; reading an entry refreshes its modification time,
+    and `evict` removes the least recently used entries once the cache grows past
+    `max_bytes`. `process_las_tile` evicts after every `store`, so the cap holds during a
+    run, not only after it.
+
+    File hashes are memoized per path (keyed by modification time and size) so unchanged
+    tiles are not re-read just to compute their key. Memoized hashes whose entries have
+    all been evicted are removed along with them, except those used since the cache was
+    opened: a worker may still be gridding the tile to store its entry.
+
+    Entries are written to temporary files first. Those of writes still in progress count
+    towards `max_bytes`, and those left by writes that crashed before the cache was
+    opened are removed by `evict`.
+
+    Parameters
+    ----------
+    cache_dir : str
+        Directory holding the cache. Created if it does not exist.
+    max_bytes : int, optional
+        Maximum total size of cached DEMs in bytes. Default is `DEFAULT_CACHE_BYTES`.
+    """
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_CACHE_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.digest_dir = os.path.join(cache_dir, 'digests')
+        os.makedirs(self.digest_dir, exist_ok=True)
+        # Files modified since then may belong to this run, including its other workers
+        self.opened = time.time()
+
+    def _digest(self, las_path):
+        las_path = os.path.abspath(las_path)
+        stat = os.stat(las_path)
+        path_hash = hashlib.blake2b(las_path.encode('utf-8'), digest_size=16).hexdigest()
+        memo_path = os.path.join(self.digest_dir, path_hash + '.json')
+
+        try:
+            with open(memo_path) as f:
+                memo = json.load(f)
+            if memo['mtime'] == stat.st_mtime and memo['size'] == stat.st_size:
+                # Mark the hash as in use so `evict` does not prune it during this run
+                os.utime(memo_path)
+                return memo['digest']
+        except (OSError, ValueError, KeyError):
+            pass
+
+        digest = file_digest(las_path)
+        with open(memo_path, 'w') as f:
+            json.dump({'mtime': stat.st_mtime, 'size': stat.st_size, 'digest': digest}, f)
+        return digest
+
+    def key(self, las_path, **params):
+        """
+        Builds the cache key of a LAS file and its gridding parameters.
+
+        Parameters
+        ----------
+        las_path : str
+            Path to the LAS or LAZ file.
+        **params
+            Parameters that change the gridded DEMs (e.g. resolution, fill_radius).
+
+        Returns
+        -------
+        str
+            Cache key.
+        """
+        params = json.dumps({'version': DEM_CACHE_VERSION, **params}, sort_keys=True)
+        params_hash = hashlib.blake2b(params.encode('utf-8'), digest_size=8).hexdigest()
+        return f"{self._digest(las_path)}_{params_hash}"
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key + '.npz')
+
+    def load(self, key):
+        """
+        Loads cached DEMs.
+
+        Parameters
+        ----------
+        key : str
+            Cache key from `key`.
+
+        Returns
+        -------
+        tuple or None
+            (dsm, dtm, transform, crs_wkt), or None on a cache miss.
+        """
+        entry_path = self._entry_path(key)
+        try:
+            with np.load(entry_path) as entry:
+                dsm = entry['dsm']
+                dtm = entry['dtm']
+                transform = Affine(*entry['transform'])
+                crs_wkt = str(entry['crs_wkt'])
+            os.utime(entry_path)
+        except (OSError, KeyError, ValueError):
+            return None
+        return dsm, dtm, transform, crs_wkt
+
+    def store(self, key, dsm, dtm, transform, crs_wkt):
+        """
+        Stores DEMs in the cache. The entry is compressed (DEMs compress well, and
+        uncompressed float64 pairs are larger than the LAZ tiles they come from) and
+        written to a temporary file that is then renamed, so concurrent readers never see
+        a partial entry.
+
+        Parameters
+        ----------
+        key : str
+            Cache key from `key`.
+        dsm, dtm : np.ndarray
+            First return and ground return elevation grids.
+        transform : affine.Affine
+            Affine transform shared by both grids.
+        crs_wkt : str
+            CRS of the grids as WKT.
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez_compressed(
+                    f,
+                    dsm=dsm,
+                    dtm=dtm,
+                    transform=np.array(tuple(transform)[:6]),
+                    crs_wkt=np.array(crs_wkt)
+                )
+            os.replace(tmp_path, self._entry_path(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def evict(self):
+        """
+        Removes least recently used entries until the cache fits in `max_bytes`, along
+        with the memoized file hashes no remaining entry uses and the temporary files of
+        writes that crashed before the cache was opened.
+
+        Returns
+        -------
+        int
+            Number of entries removed.
+        """
+        entries = []
+        writing_bytes = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(('.npz', '.tmp')):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                # Evicted, or renamed into place, by another worker in the meantime
+                continue
+            if name.endswith('.npz'):
+                entries.append((stat.st_mtime, stat.st_size, name))
+            elif stat.st_mtime < self.opened:
+                # Left by a write that crashed in an earlier run
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            else:
+                writing_bytes += stat.st_size
+
+        total_bytes = writing_bytes + sum(size for _, size, _ in entries)
+        removed = 0
+        kept = []
+        for _, size, name in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                kept.append(name)
+                continue
+            try:
+                os.remove(os.path.join(self.cache_dir, name))
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+            removed += 1
+
+        if removed:
+            self._prune_digests({name.partition('_')[0] for name in kept})
+        return removed
+
+    def _prune_digests(self, digests):
+        # Removes memoized file hashes that no cached entry is keyed by and that have not
+        # been used since the cache was opened
+        for name in os.listdir(self.digest_dir):
+            memo_path = os.path.join(self.digest_dir, name)
+            try:
+                if os.stat(memo_path).st_mtime >= self.opened:
+                    continue
+                with open(memo_path) as f:
+                    digest = json.load(f)['digest']
+            except (OSError, ValueError, KeyError):
+                digest = None
+            if digest not in digests:
+                try:
+                    os.remove(memo_path)
+                except OSError:
+                    pass
@@ -0,0 +1,271 @@
+# Utility methods used to download DRAPP and LiDAR tiles concurrently and resumably
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Bytes written per chunk while streaming a download to disk
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Suffix of the partial file a download is streamed into before it is renamed
+PARTIAL_SUFFIX = '.part'
+
+# Suffix of the file next to a partial file holding the ETag or Last-Modified date of
+# the version it was downloaded from, sent as If-Range when the download is resumed
+VALIDATOR_SUFFIX = '.validator'
+
+# Status codes worth retrying: rate limiting and server errors
+RETRY_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class DownloadError(Exception):
+    """Raised when a file cannot be downloaded or fails verification."""
+
+
+def _etag_md5(etag):
+    # S3 and most static servers use the MD5 of the content as the ETag of files
+    # uploaded in one part; multipart and weak ETags cannot be checked this way
+    if not etag:
+        return None
+    etag = etag.strip('"')
+    if len(etag) == 32 and all(c in '0123456789abcdef' for c in etag.lower()):
+        return etag.lower()
+    return None
+
+
+def _validator(headers):
+    # Value to send as If-Range to resume a download of the same version of a file: a
+    # strong ETag, else the Last-Modified date (weak ETags are not allowed in If-Range)
+    etag = headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return headers.get('Last-Modified')
+
+
+def _file_md5(path):
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _remove_partial(part_path):
+    # Removes a partial file and its validator
+    for stale in (part_path, part_path + VALIDATOR_SUFFIX):
+        if os.path.exists(stale):
+            os.remove(stale)
+
+
+class TileDownloader:
+    """
+    Downloads files concurrently over a pooled HTTP session.
+
+    Each file is streamed in chunks to a '.part' file next to its destination and only
+    renamed into place once its size (and its MD5 where the ETag is one) has been
+    verified, so an interrupted download never leaves a truncated file under the final
+    name. A '.part' file left by an earlier run is resumed with an HTTP Range request,
+    made conditional with If-Range on the ETag or Last-Modified date the partial file was
+    downloaded with, so a file changed on the server since is downloaded again in full
+    instead of being spliced onto the old bytes.
+    Connection errors, timeouts and 408/429/5xx responses are retried with exponential
+    backoff.
+
+    Parameters
+    ----------
+    workers : int, optional
+        Number of files downloaded at once. Default is 4.
+    retries : int, optional
+        Number of retries per file after the first attempt. Default is 3.
+    backoff : float, optional
+        Seconds waited before the first retry; doubled on each further retry. Default is 1.0.
+    timeout : float, optional
+        Connect and read timeout of each request, in seconds. Default is 60.
+    verify_existing : bool, optional
+        Whether files already at their destination are checked against the size the
+        server reports (one HEAD request each) and downloaded again if they differ,
+        which catches truncated files left by older versions. If the server cannot be
+        reached the existing file is kept. Default is True.
+    session : requests.Session, optional
+        Session to use; a pooled session is created if None.
+
+    Examples
+    --------
+    >>> downloader = TileDownloader(workers=8)
+    >>> paths = downloader.download_all(tile_urls, "path/to/tiles")
+    """
+
+    def __init__(self, workers=4, retries=3, backoff=1.0, timeout=60, verify_existing=True, session=None):
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.verify_existing = verify_existing
+
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        self.session = session
+
+    def _is_complete(self, url, path):
+        # Checks a file already at its destination against the size the server reports
+        try:
+            resp = self.session.head(url, allow_redirects=True, timeout=self.timeout)
+        except requests.RequestException:
+            return True
+        size = resp.headers.get('Content-Length')
+        if not resp.ok or size is None:
+            return True
+        return os.path.getsize(path) == int(size)
+
+    def _fetch(self, url, part_path):
+        # Streams the remaining bytes of url into part_path and returns the expected
+        # total size and the ETag of the file
+        validator_path = part_path + VALIDATOR_SUFFIX
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        validator = None
+        if offset and os.path.exists(validator_path):
+            with open(validator_path) as f:
+                validator = f.read().strip() or None
+        # Without a validator the partial file cannot be matched to a version of the
+        # file, so only resume when there is one
+        headers = {'Range': f'bytes={offset}-', 'If-Range': validator} if validator else {}
+
+        with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as resp:
+            if resp.status_code == 416:
+                # The partial file is already as long as (or longer than) the file
+                _remove_partial(part_path)
+                raise requests.ConnectionError(f"Stale partial download of {url}")
+            if resp.status_code in RETRY_STATUS_CODES:
+                raise requests.ConnectionError(f"HTTP {resp.status_code} for {url}")
+            if not resp.ok:
+                raise DownloadError(f"HTTP {resp.status_code} for {url}")
+
+            if resp.status_code == 206:
+                # Content-Range: bytes <start>-<end>/<total>
+                total = resp.headers.get('Content-Range', '').rpartition('/')[2]
+                total = int(total) if total.isdigit() else None
+                mode = 'ab'
+            else:
+                # A new download, or the server ignored the Range header or the file
+                # changed since the partial download; start over
+                length = resp.headers.get('Content-Length')
+                total = int(length) if length is not None else None
+                mode = 'wb'
+                validator = _validator(resp.headers)
+                if validator:
+                    with open(validator_path, 'w') as f:
+                        f.write(validator)
+                elif os.path.exists(validator_path):
+                    os.remove(validator_path)
+
+            with open(part_path, mode) as f:
+                for chunk in resp.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+            return total, resp.headers.get('ETag')
+
+    def download(self, url, path):
+        """
+        Downloads a single file, resuming and retrying as needed.
+
+        Parameters
+        ----------
+        url : str
+            URL of the file.
+        path : str
+            Destination path.
+
+        Returns
+        -------
+        str
+            `path`, once the complete file is in place.
+
+        Raises
+        ------
+        DownloadError
+            If the file could not be downloaded after all retries, the server refused
+            it, or the downloaded file does not match the size or ETag reported.
+        """
+        if os.path.exists(path):
+            if not self.verify_existing or self._is_complete(url, path):
+                return path
+            print(f"{os.path.basename(path)} is incomplete; downloading it again.")
+            os.remove(path)
+
+        part_path = path + PARTIAL_SUFFIX
+        for attempt in range(self.retries + 1):
+            try:
+                total, etag = self._fetch(url, part_path)
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                if attempt == self.retries:
+                    raise DownloadError(f"Failed to download {url}: {e}") from e
+                time.sleep(self.backoff * 2 ** attempt)
+                continue
+
+            size = os.path.getsize(part_path)
+            if total is not None and size != total:
+                # The connection dropped mid-file; resume from where it stopped
+                if attempt == self.retries:
+                    raise DownloadError(f"Downloaded {size} of {total} bytes of {url}")
+                time.sleep(self.backoff * 2 ** attempt)
+                continue
+
+            md5 = _etag_md5(etag)
+            if md5 is not None and _file_md5(part_path) != md5:
+                _remove_partial(part_path)
+                raise DownloadError(f"Checksum of {url} does not match its ETag")
+
+            os.replace(part_path, path)
+            if os.path.exists(part_path + VALIDATOR_SUFFIX):
+                os.remove(part_path + VALIDATOR_SUFFIX)
+            return path
+
+    def download_all(self, urls, localpath):
+        """
+        Downloads files concurrently into a directory, named after the last URL path segment.
+
+        Every download is attempted before any failure is raised; partial files of failed
+        downloads are kept so the next run resumes them.
+
+        Parameters
+        ----------
+        urls : list
+            URLs of the files.
+        localpath : str
+            Directory the files are saved to.
+
+        Returns
+        -------
+        list
+            Paths of the downloaded files, in the order of `urls`.
+
+        Raises
+        ------
+        DownloadError
+            If any file could not be downloaded.
+        """
+        os.makedirs(localpath, exist_ok=True)
+        paths = [os.path.join(localpath, os.path.basename(url)) for url in urls]
+
+        failed = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(self.download, url, path): url for url, path in zip(urls, paths)}
+            for future, url in futures.items():
+                try:
+                    future.result()
+                except DownloadError as e:
+                    print(e)
+                    failed[url] = e
+                except (OSError, requests.RequestException) as e:
+                    # e.g. a full disk, a denied write or an invalid URL
+                    print(f"Failed to download {url}: {e}")
+                    failed[url] = e
+
+        if failed:
+            raise DownloadError(f"Failed to download {len(failed)} of {len(urls)} file(s).")
+        return paths
@@ -14,6 +14,8 @@ import pandas as pd
 from rasterio.mask import mask
 from shapely.geometry import box
 
+from .downloads import TileDownloader
+
 
 def get_filename_from_url(url):
     """
@@ -55,27 +57,25 @@ def extract_zip(target_dir, zip_filename, resp):
         z.extractall(target_dir)
 
 
-def download_files(localpath, urls):
+def download_files(localpath, urls, workers=4, downloader=None):
     """
     Downloads files from a list of URLs and saves them to a specified local directory.
 
+    Files are downloaded concurrently and resumably with a `TileDownloader`; a file only
+    appears under its final name once it is complete.
+
     Parameters:
     localpath (str): The directory where the files will be saved.
     urls (list): A list of URLs to download the files from.
+    workers (int, optional): Number of files downloaded at once. Defaults to 4.
+    downloader (TileDownloader, optional): Downloader to use, e.g. to change retries. Defaults to a new one.
 
     Returns:
     list: A list of paths to the downloaded files.
     """
-    paths = []
-    for url in urls:
-        filename = os.path.basename(url)
-        path = os.path.join(localpath, filename)
-        paths.append(path)
-        if not os.path.exists(path):
-            resp = requests.get(url)
-            with open(path, 'wb') as f:
-                f.write(resp.content)
-    return paths
+    if downloader is None:
+        downloader = TileDownloader(workers=workers)
+    return downloader.download_all(urls, localpath)
 
 
 def save_shapefile(local_path: str, url=None):
@@ -112,7 +112,7 @@ def save_shapefile(local_path: str, url=None):
     return shapefilepath
 
 
-def save_tiles(localpath, tilenames: list, tile_base_url=None):
+def save_tiles(localpath, tilenames: list, tile_base_url=None, workers=4):
     """
     Downloads and saves DRAPP tiles to a specified local directory.
 
@@ -120,6 +120,7 @@ def save_tiles(localpath, tilenames: list, tile_base_url=None):
     localpath (str): The directory where the tiles will be saved.
     tilenames (list): A list of tile names to download.
     tile_base_url (str, optional): The base URL for the tile files. Defaults to DRAPP archive URL.
+    workers (int, optional): Number of tiles downloaded at once. Defaults to 4.
 
     Returns:
     list: A list of paths to the downloaded tile files.
@@ -129,7 +130,7 @@ def save_tiles(localpath, tilenames: list, tile_base_url=None):
         tile_base_url = 'https://drapparchive.s3.amazonaws.com/2020/'
     tile_urls = [f'{tile_base_url}{tile}.tif' for tile in tilenames]
 
-    tile_paths = download_files(localpath, tile_urls)
+    tile_paths = download_files(localpath, tile_urls, workers=workers)
     return tile_paths
 
 
@@ -0,0 +1,195 @@
+# Utility methods used to catalog LIDAR tiles from their LAS headers
+import json
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import shapely
+from shapely.ops import unary_union
+
+from .lidar_grid import is_point_cloud_file, open_point_cloud
+
+# Name of the catalog sidecar written next to the LAS files
+CATALOG_FILENAME = 'lidar_catalog.sqlite'
+
+CATALOG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tiles (
+    path TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    minx REAL NOT NULL,
+    miny REAL NOT NULL,
+    maxx REAL NOT NULL,
+    maxy REAL NOT NULL,
+    crs_wkt TEXT,
+    point_count INTEGER NOT NULL,
+    return_counts TEXT NOT NULL,
+    class_counts TEXT
+)
+"""
+
+CATALOG_COLUMNS = [
+    'path', 'mtime', 'size', 'minx', 'miny', 'maxx', 'maxy',
+    'crs_wkt', 'point_count', 'return_counts', 'class_counts'
+]
+
+
+def read_tile_record(las_path, count_classes=False, chunk_size=5_000_000):
+    """
+    Reads the catalog record of a single LAS or LAZ tile.
+
+    Everything except the class counts comes from the LAS header. Class counts are not
+    stored in LAS headers, so they are only computed (by streaming the classification
+    field) when `count_classes` is True.
+
+    Parameters
+    ----------
+    las_path : str
+        Path to the LAS or LAZ file.
+    count_classes : bool, optional
+        Whether to count points per classification code. Default is False.
+    chunk_size : int, optional
+        Points read at once when counting classes. Default is 5,000,000.
+
+    Returns
+    -------
+    dict
+        Catalog record keyed by `CATALOG_COLUMNS`.
+    """
+    stat = os.stat(las_path)
+    with open_point_cloud(las_path) as las_reader:
+        header = las_reader.header
+        crs = header.parse_crs()
+        class_counts = None
+        if count_classes:
+            counts = np.zeros(256, dtype=np.int64)
+            for points in las_reader.chunk_iterator(chunk_size):
+                counts += np.bincount(np.asarray(points.classification), minlength=256)[:256]
+            class_counts = json.dumps({int(code): int(counts[code]) for code in np.flatnonzero(counts)})
+
+        return {
+            'path': os.path.abspath(las_path),
+            'mtime': stat.st_mtime,
+            'size': stat.st_size,
+            'minx': float(header.mins[0]),
+            'miny': float(header.mins[1]),
+            'maxx': float(header.maxs[0]),
+            'maxy': float(header.maxs[1]),
+            'crs_wkt': crs.to_wkt() if crs is not None else None,
+            'point_count': int(header.point_count),
+            'return_counts': json.dumps([int(count) for count in header.number_of_points_by_return]),
+            'class_counts': class_counts,
+        }
+
+
+def update_catalog(las_folder_path, catalog_path=None, count_classes=False):
+    """
+    Creates or incrementally refreshes the tile catalog of a folder of LAS/LAZ files.
+
+    Only tiles that are new, or whose modification time or size changed since they were
+    cataloged, have their headers read. Records of tiles that no longer exist are removed.
+    Tiles whose header cannot be read (e.g. corrupt or truncated files) are reported and
+    left out of the catalog, so they are skipped instead of aborting the run.
+
+    Parameters
+    ----------
+    las_folder_path : str
+        The path to the directory containing the LAS or LAZ files.
+    catalog_path : str, optional
+        Path to the SQLite catalog. Defaults to `CATALOG_FILENAME` inside `las_folder_path`.
+    count_classes : bool, optional
+        Whether to also count points per classification code (requires reading the
+        points of new or changed tiles). Default is False.
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per tile with the columns in `CATALOG_COLUMNS`.
+    """
+    if catalog_path is None:
+        catalog_path = os.path.join(las_folder_path, CATALOG_FILENAME)
+
+    las_files = [
+        os.path.abspath(os.path.join(las_folder_path, file))
+        for file in sorted(os.listdir(las_folder_path)) if is_point_cloud_file(file)
+    ]
+
+    with sqlite3.connect(catalog_path) as connection:
+        connection.execute(CATALOG_SCHEMA)
+        cataloged = {
+            path: (mtime, size, class_counts)
+            for path, mtime, size, class_counts
+            in connection.execute('SELECT path, mtime, size, class_counts FROM tiles')
+        }
+
+        updated = 0
+        failed = []
+        for las_path in las_files:
+            stat = os.stat(las_path)
+            entry = cataloged.get(las_path)
+            if entry is not None:
+                mtime, size, class_counts = entry
+                if (mtime == stat.st_mtime and size == stat.st_size
+                        and (class_counts is not None or not count_classes)):
+                    continue
+
+            try:
+                record = read_tile_record(las_path, count_classes=count_classes)
+            except Exception as e:
+                print(f"Failed to catalog {las_path}: {e}")
+                failed.append(las_path)
+                continue
+            connection.execute(
+                f"INSERT OR REPLACE INTO tiles ({', '.join(CATALOG_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(CATALOG_COLUMNS))})",
+                [record[column] for column in CATALOG_COLUMNS]
+            )
+            updated += 1
+
+        # Drop the tiles that no longer exist, and the stale records of tiles that changed
+        # but can no longer be read
+        removed = set(cataloged) - set(las_files)
+        connection.executemany('DELETE FROM tiles WHERE path = ?', [(path,) for path in removed | set(failed)])
+
+        if updated or removed:
+            print(f"Catalog updated: {updated} tile(s) read, {len(removed)} removed.")
+        if failed:
+            print(f"Skipped {len(failed)} LAS file(s) whose header could not be read.")
+
+        catalog_df = pd.read_sql_query(
+            f"SELECT {', '.join(CATALOG_COLUMNS)} FROM tiles ORDER BY path", connection
+        )
+    connection.close()
+
+    return catalog_df
+
+
+def select_tiles(catalog_df, proj_area):
+    """
+    Selects the cataloged tiles whose header bounds intersect the project area.
+
+    The project area is reprojected once per distinct tile CRS. Tiles without a CRS
+    cannot be tested and are always kept.
+
+    Parameters
+    ----------
+    catalog_df : pd.DataFrame
+        Tile catalog as returned by `update_catalog`.
+    proj_area : gpd.GeoDataFrame
+        The project area.
+
+    Returns
+    -------
+    pd.DataFrame
+        The rows of `catalog_df` for tiles that intersect the project area.
+    """
+    keep = np.ones(len(catalog_df), dtype=bool)
+
+    for crs_wkt, tiles in catalog_df.groupby('crs_wkt', dropna=True):
+        area = unary_union(proj_area.to_crs(crs_wkt).geometry)
+        shapely.prepare(area)
+        boxes = shapely.box(tiles['minx'], tiles['miny'], tiles['maxx'], tiles['maxy'])
+        keep[catalog_df.index.get_indexer(tiles.index)] = shapely.intersects(area, boxes)
+
+    return catalog_df[keep]
@@ -0,0 +1,347 @@
+# Utility methods used to grid LIDAR point clouds into surface and terrain models
+import laspy
+import numpy as np
+import rioxarray  # noqa: F401 (registers the .rio accessor)
+import xarray as xr
+from rasterio.transform import from_origin
+from scipy.ndimage import distance_transform_edt
+
+# ASPRS classification code for ground points
+GROUND_CLASS = 2
+
+# File extensions of the point cloud files read by the canopy pipeline
+POINT_CLOUD_EXTENSIONS = ('.las', '.laz')
+
+# Only the point fields used to grid DEMs are decompressed from LAZ files
+GRID_FIELDS = (
+    laspy.DecompressionSelection.XY_RETURNS_CHANNEL
+    | laspy.DecompressionSelection.Z
+    | laspy.DecompressionSelection.CLASSIFICATION
+)
+
+
+def is_point_cloud_file(filename):
+    """
+    Checks whether a file name has a LAS or LAZ extension (case insensitive).
+
+    Parameters
+    ----------
+    filename : str
+        File name or path.
+
+    Returns
+    -------
+    bool
+        True for .las and .laz files.
+    """
+    return filename.lower().endswith(POINT_CLOUD_EXTENSIONS)
+
+
+def open_point_cloud(path):
+    """
+    Opens a LAS or LAZ file for reading without loading any points.
+
+    LAZ files are decompressed with laspy's multi-threaded lazrs backend and only the
+    fields needed for gridding (coordinates, returns and classification) are decompressed.
+    lazrs sizes its thread pool once per process from the RAYON_NUM_THREADS environment
+    variable (every core by default), so it cannot be set per file.
+
+    Parameters
+    ----------
+    path : str
+        Path to the .las or .laz file.
+
+    Returns
+    -------
+    laspy.LasReader
+        Reader positioned after the header.
+    """
+    if path.lower().endswith('.laz'):
+        return laspy.open(
+            path,
+            laz_backend=laspy.LazBackend.LazrsParallel,
+            decompression_selection=GRID_FIELDS
+        )
+    return laspy.open(path)
+
+
+def grid_from_bounds(bounds, resolution=1.0):
+    """
+    Builds a raster grid that covers the given bounds and snaps to multiples of the resolution.
+
+    Snapping every tile to the same lattice means adjacent tiles line up cell for cell
+    and can be merged without resampling.
+
+    Parameters
+    ----------
+    bounds : tuple
+        Bounding box as (minx, miny, maxx, maxy) in map units.
+    resolution : float, optional
+        Cell size in map units. Default is 1.0.
+
+    Returns
+    -------
+    transform : affine.Affine
+        Affine transform of the upper left corner of the grid.
+    shape : tuple
+        Grid shape as (rows, columns).
+    """
+    minx, miny, maxx, maxy = bounds
+    left = np.floor(minx / resolution) * resolution
+    bottom = np.floor(miny / resolution) * resolution
+    right = np.ceil(maxx / resolution) * resolution
+    top = np.ceil(maxy / resolution) * resolution
+
+    width = max(int(round((right - left) / resolution)), 1)
+    height = max(int(round((top - bottom) / resolution)), 1)
+
+    return from_origin(left, top, resolution, resolution), (height, width)
+
+
+def cell_index(x, y, transform, shape):
+    """
+    Computes the flat (row-major) grid cell index for each point.
+
+    Points on the right or bottom edge of the grid are assigned to the last column or row.
+
+    Parameters
+    ----------
+    x, y : np.ndarray
+        Point coordinates in map units.
+    transform : affine.Affine
+        Affine transform of the grid.
+    shape : tuple
+        Grid shape as (rows, columns).
+
+    Returns
+    -------
+    np.ndarray
+        Flat cell index for each point.
+    """
+    height, width = shape
+    col = np.floor((np.asarray(x) - transform.c) / transform.a).astype(np.int64)
+    row = np.floor((np.asarray(y) - transform.f) / transform.e).astype(np.int64)
+    np.clip(col, 0, width - 1, out=col)
+    np.clip(row, 0, height - 1, out=row)
+    return row * width + col
+
+
+class GridAccumulator:
+    """
+    Accumulates point values into grid cells across any number of point batches.
+
+    Only the grid-sized state is kept between batches (a running max/min, or running
+    sums and counts for the mean), so memory is bounded by the grid, not the point count.
+
+    Parameters
+    ----------
+    size : int
+        Total number of cells in the grid.
+    statistic : {'max', 'min', 'mean'}, optional
+        Reduction applied to the points falling in each cell. Default is 'max'.
+    """
+
+    def __init__(self, size, statistic='max'):
+        if statistic == 'max':
+            self.values = np.full(size, -np.inf)
+        elif statistic == 'min':
+            self.values = np.full(size, np.inf)
+        elif statistic == 'mean':
+            self.values = np.zeros(size)
+            self.counts = np.zeros(size, dtype=np.int64)
+        else:
+            raise ValueError(f"Unsupported statistic '{statistic}'. Use 'max', 'min' or 'mean'.")
+        self.size = size
+        self.statistic = statistic
+
+    def add(self, index, values):
+        """
+        Adds a batch of points to the grid.
+
+        Parameters
+        ----------
+        index : np.ndarray
+            Flat cell index of each point, as returned by `cell_index`.
+        values : np.ndarray
+            Value of each point (e.g. elevation).
+        """
+        if self.statistic == 'max':
+            np.maximum.at(self.values, index, values)
+        elif self.statistic == 'min':
+            np.minimum.at(self.values, index, values)
+        else:
+            self.values += np.bincount(index, weights=values, minlength=self.size)
+            self.counts += np.bincount(index, minlength=self.size)
+
+    def result(self):
+        """
+        Returns the reduced cell values.
+
+        Returns
+        -------
+        np.ndarray
+            Flat float64 array of cell values, NaN where a cell received no points.
+        """
+        if self.statistic == 'mean':
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return self.values / self.counts
+        grid = self.values.copy()
+        grid[np.isinf(grid)] = np.nan
+        return grid
+
+
+def fill_empty_cells(grid, max_distance):
+    """
+    Fills empty (NaN) cells with the value of the nearest populated cell.
+
+    Cells farther than `max_distance` cells from any populated cell are left empty,
+    which mirrors the search radius of an IDW interpolation.
+
+    Parameters
+    ----------
+    grid : np.ndarray
+        2D grid with NaN marking empty cells.
+    max_distance : float
+        Maximum fill distance in cells.
+
+    Returns
+    -------
+    np.ndarray
+        Grid with empty cells filled where possible.
+    """
+    empty = np.isnan(grid)
+    if not empty.any() or empty.all():
+        return grid
+
+    distance, (rows, cols) = distance_transform_edt(empty, return_indices=True)
+    filled = grid[rows, cols]
+    filled[distance > max_distance] = np.nan
+    return filled
+
+
+def accumulate_dems(header, point_chunks, resolution=1.0, ground_statistic='min', fill_radius=3.0):
+    """
+    Grids batches of LAS points into a first return surface model (DSM) and a ground terrain model (DTM).
+
+    The grid is sized from the header bounds, so the point batches can be streamed from
+    disk one at a time. For each batch, cell indices are computed once for all points; the
+    DSM takes the maximum elevation of first returns and the DTM takes the minimum (or mean)
+    elevation of ground-classified points in each cell. Once all batches are added, empty
+    cells within `fill_radius` of data are filled from the nearest populated cell.
+
+    Parameters
+    ----------
+    header : laspy.LasHeader
+        Header of the LAS file, used for the grid bounds.
+    point_chunks : iterable
+        Point records (laspy.LasData or laspy.ScaleAwarePointRecord) with x, y, z,
+        return_number and classification fields.
+    resolution : float, optional
+        Cell size in map units. Default is 1.0.
+    ground_statistic : {'min', 'mean'}, optional
+        Reduction used for ground points in each cell. Default is 'min'.
+    fill_radius : float, optional
+        Maximum distance in map units used to fill empty cells. Default is 3.0.
+
+    Returns
+    -------
+    dsm : np.ndarray
+        2D float32 first return elevation grid, NaN where empty.
+    dtm : np.ndarray
+        2D float32 ground elevation grid, NaN where empty.
+    transform : affine.Affine
+        Affine transform shared by both grids.
+    """
+    bounds = (header.mins[0], header.mins[1], header.maxs[0], header.maxs[1])
+    transform, shape = grid_from_bounds(bounds, resolution)
+    size = shape[0] * shape[1]
+
+    first_returns = GridAccumulator(size, statistic='max')
+    ground_returns = GridAccumulator(size, statistic=ground_statistic)
+
+    for points in point_chunks:
+        index = cell_index(points.x, points.y, transform, shape)
+        z = np.asarray(points.z)
+
+        first = np.asarray(points.return_number) == 1
+        ground = np.asarray(points.classification) == GROUND_CLASS
+
+        first_returns.add(index[first], z[first])
+        ground_returns.add(index[ground], z[ground])
+
+    max_distance = fill_radius / resolution
+    dsm = fill_empty_cells(first_returns.result().reshape(shape), max_distance).astype(np.float32)
+    dtm = fill_empty_cells(ground_returns.result().reshape(shape), max_distance).astype(np.float32)
+
+    return dsm, dtm, transform
+
+
+def read_dems(reader, chunk_size=None, resolution=1.0, ground_statistic='min', fill_radius=3.0):
+    """
+    Streams points from an open LAS reader into first return (DSM) and ground (DTM) elevation models.
+
+    Parameters
+    ----------
+    reader : laspy.LasReader
+        Reader returned by `laspy.open`. Only its header has been read.
+    chunk_size : int, optional
+        Maximum number of points held in memory at once. If None, the whole file is
+        read in a single chunk.
+    resolution : float, optional
+        Cell size in map units. Default is 1.0.
+    ground_statistic : {'min', 'mean'}, optional
+        Reduction used for ground points in each cell. Default is 'min'.
+    fill_radius : float, optional
+        Maximum distance in map units used to fill empty cells. Default is 3.0.
+
+    Returns
+    -------
+    dsm, dtm, transform
+        See `accumulate_dems`.
+    """
+    points_per_chunk = max(int(chunk_size or reader.header.point_count), 1)
+    return accumulate_dems(
+        reader.header,
+        reader.chunk_iterator(points_per_chunk),
+        resolution,
+        ground_statistic,
+        fill_radius
+    )
+
+
+def grid_to_dataarray(array, transform, crs, nodata=None):
+    """
+    Wraps a 2D numpy grid as a single band georeferenced DataArray.
+
+    Parameters
+    ----------
+    array : np.ndarray
+        2D grid of values.
+    transform : affine.Affine
+        Affine transform of the grid.
+    crs : str or rasterio.crs.CRS
+        Coordinate reference system of the grid.
+    nodata : float, optional
+        Nodata value to record on the DataArray.
+
+    Returns
+    -------
+    xr.DataArray
+        DataArray with band, y and x dimensions and spatial metadata written. It shares
+        memory with `array`.
+    """
+    height, width = array.shape
+    x = transform.c + (np.arange(width) + 0.5) * transform.a
+    y = transform.f + (np.arange(height) + 0.5) * transform.e
+
+    data_array = xr.DataArray(
+        array[np.newaxis, :, :],
+        dims=('band', 'y', 'x'),
+        coords={'band': [1], 'y': y, 'x': x},
+    )
+    # Write the metadata in place; rioxarray otherwise deep copies the (possibly memory-mapped) grid
+    data_array.rio.write_transform(transform, inplace=True)
+    data_array.rio.write_crs(crs, inplace=True)
+    if nodata is not None:
+        data_array.rio.write_nodata(nodata, inplace=True)
+    return data_array
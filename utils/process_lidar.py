@@ -1,21 +1,87 @@
 # Utility methods used in processing LIDAR .las files into canopy gaps
+import multiprocessing
 import numpy as np
 import os
-import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import ExitStack, contextmanager
 
-import laspy
-import rioxarray as rxr
-import rioxarray.merge as rxrm
-import rasterio
-from rasterio.crs import CRS
 import geopandas as gpd
-from shapely.geometry import shape
-from scipy.ndimage import binary_opening, binary_closing
-from shapely.ops import unary_union
-import whitebox
+import shapely
+
+from .acreage import SQFT_PER_ACRE, categorize_gap_sizes
+from .canopy_height import canopy_mask, canopy_masks, read_chm, write_canopy_masks, write_chm
+from .chm_mosaic import ChmMosaic
+from .dem_cache import DEFAULT_CACHE_BYTES, DemCache
+from .gap_raster import canopy_gaps_raster
+from .lidar_catalog import select_tiles, update_catalog
+from .lidar_grid import grid_to_dataarray, is_point_cloud_file, open_point_cloud, read_dems
+from .polygon_simplify import simplify_polygons
+from .raster_polygons import polygonize_raster
+from .vector_ops import DEFAULT_CELL_SIZE, overlay_zones
+from .vector_output import write_layers
+from .vector_union import buffered_union
+
+def canopy_gaps_vector(canopy_gdf, study_area, buffer_distance=5, workers=1, cell_size=DEFAULT_CELL_SIZE):
+    """
+    Computes buffered canopy and canopy gaps with vector buffer, union and clipping operations.
+
+    Parameters
+    ----------
+    canopy_gdf : gpd.GeoDataFrame
+        GeoDataFrame representing canopy areas.
+    study_area : gpd.GeoDataFrame
+        The study area, in the CRS of `canopy_gdf`.
+    buffer_distance : float, optional
+        The distance to buffer the canopy geometries. Default is 5 units.
+    workers : int, optional
+        Number of worker processes used to union the buffered canopy and to clip it to
+        the study area. Default is 1.
+    cell_size : float, optional
+        Side of the grid cells the study area is cut into for clipping. Default is 1000 units.
+
+    Returns
+    -------
+    clipped_buffer : gpd.GeoDataFrame
+        GeoDataFrame with the buffered and clipped canopy areas.
+    exploded_gap_gdf : gpd.GeoDataFrame
+        GeoDataFrame with exploded geometries representing non-tree canopy areas, including acreage and size category.
+    """
+    # Buffer the canopy geometries and dissolve them into a single MultiPolygon
+    dissolved_canopy = buffered_union(canopy_gdf.geometry.values, buffer_distance, workers=workers)
+
+    # Clip the dissolved canopy with each study area zone and subtract it to get the
+    # gaps, already exploded into single polygons, one grid cell at a time
+    clipped_geoms, gap_geoms, gap_zones = overlay_zones(
+        dissolved_canopy,
+        study_area.geometry.values,
+        cell_size=cell_size,
+        workers=workers
+    )
+    attributes = study_area.drop(columns=study_area.geometry.name).reset_index(drop=True)
+
+    has_canopy = ~shapely.is_empty(clipped_geoms)
+    clipped_buffer = gpd.GeoDataFrame(
+        attributes[has_canopy].reset_index(drop=True),
+        geometry=clipped_geoms[has_canopy],
+        crs=canopy_gdf.crs
+    )
+
+    exploded_gap_gdf = gpd.GeoDataFrame(
+        attributes.iloc[gap_zones].reset_index(drop=True),
+        geometry=gap_geoms,
+        crs=canopy_gdf.crs
+    )
+
+    # Calculate the area in acres and categorize the gap sizes
+    exploded_gap_gdf['Acreage'] = exploded_gap_gdf.geometry.area / SQFT_PER_ACRE
+    exploded_gap_gdf['Gap_Size_Category'] = categorize_gap_sizes(exploded_gap_gdf['Acreage'])
+
+    return clipped_buffer, exploded_gap_gdf
+
 
 # Method to process canopy gaps.
-def process_canopy_areas(canopy_gdf, study_area, output_path, buffer_distance=5):
+def process_canopy_areas(canopy_gdf, study_area, output_path, buffer_distance=5, engine='vector', resolution=1.0,
+                         workers=1, output_format='shapefile'):
     """
     Processes canopy areas by buffering, dissolving, clipping, and exploding the geometries.
     Adds acreage and size category columns.
@@ -30,6 +96,19 @@ def process_canopy_areas(canopy_gdf, study_area, output_path, buffer_distance=5)
         File path to output processed shapefiles
     buffer_distance : float, optional
         The distance to buffer the canopy geometries. Default is 5 units.
+    engine : {'vector', 'raster'}, optional
+        'vector' buffers, unions and overlays the canopy polygons. 'raster' burns the
+        canopy into a grid, buffers it with a distance transform and sizes gaps from
+        pixel counts, which is much faster and lighter on large areas. Default is 'vector'.
+    resolution : float, optional
+        Cell size of the grid used by the 'raster' engine; use the resolution the canopy
+        was derived at. Default is 1.0.
+    workers : int, optional
+        Number of worker processes used by the 'vector' engine to union the buffered
+        canopy; None uses every available core. Default is 1.
+    output_format : {'shapefile', 'gpkg', 'fgb', 'parquet'}, optional
+        Format of the output layers, see `write_layers`. 'gpkg' writes all three layers
+        into one 'lidar_<Proj_ID>.gpkg'. Default is 'shapefile'.
 
     Returns
     -------
@@ -45,68 +124,254 @@ def process_canopy_areas(canopy_gdf, study_area, output_path, buffer_distance=5)
     if canopy_gdf.crs is None or study_area.crs is None:
         raise ValueError("Input GeoDataFrames must have a CRS defined.")
 
-    # Buffer the canopy geometries
-    buffered_canopy = canopy_gdf.geometry.buffer(buffer_distance)
+    if engine == 'vector':
+        clipped_buffer, exploded_gap_gdf = canopy_gaps_vector(canopy_gdf, study_area, buffer_distance, workers=workers)
+    elif engine == 'raster':
+        clipped_buffer, exploded_gap_gdf = canopy_gaps_raster(canopy_gdf, study_area, buffer_distance, resolution)
+    else:
+        raise ValueError(f"Unsupported engine '{engine}'. Use 'vector' or 'raster'.")
 
-    # Create a new GeoDataFrame with the buffered geometries
-    buffer_gdf = gpd.GeoDataFrame(geometry=buffered_canopy, crs=canopy_gdf.crs)
+    # Output layers
+    proj_area_name = str(study_area['Proj_ID'].iloc[0])
+    write_layers(
+        {'canopy_gaps_calced': exploded_gap_gdf, 'canopy': canopy_gdf, 'buffered_canopy': clipped_buffer},
+        output_path, 'lidar_' + proj_area_name, output_format
+    )
 
-    # Dissolve the buffered geometries into a single MultiPolygon
-    dissolved_canopy = unary_union(buffer_gdf.geometry)
+    return clipped_buffer, exploded_gap_gdf
 
-    # Convert the dissolved canopy back to a GeoDataFrame
-    dissolved_canopy_gdf = gpd.GeoDataFrame(geometry=[dissolved_canopy], crs=canopy_gdf.crs)
+def process_las_tile(las_filename, resolution=1.0, fill_radius=3.0,
+                     ground_statistic='min', chunk_size=None, dem_cache=None):
+    """
+    Processes a single LAS or LAZ tile into a canopy height model (CHM).
 
-    # Clip the dissolved canopy with the study area
-    clipped_buffer = gpd.overlay(dissolved_canopy_gdf, study_area, how='intersection')
+    Parameters
+    ----------
+    las_filename : str
+        Path to the LAS or LAZ file.
+    resolution : float, optional
+        Cell size of the DEMs in the LAS file units (default is 1.0).
+    fill_radius : float, optional
+        Maximum distance in LAS file units used to fill cells without returns (default is 3.0).
+    ground_statistic : {'min', 'mean'}, optional
+        Reduction applied to ground returns in each cell (default is 'min').
+    chunk_size : int, optional
+        Maximum number of points read into memory at once (default is None, whole tile).
+    dem_cache : DemCache, optional
+        Cache of gridded DEMs. On a hit the LAS file is not gridded again (default is None).
 
-    # Calculate the difference between the study area and the clipped buffer
-    non_tree_canopy_gdf = gpd.overlay(study_area, clipped_buffer, how='difference')
+    Returns
+    -------
+    chm : xr.DataArray
+        Single band float32 raster of canopy heights (first return minus ground elevation)
+        with NaN where either DEM has no data, in the CRS of the LAS file.
+    """
+    cached = None
+    if dem_cache is not None:
+        cache_key = dem_cache.key(
+            las_filename,
+            resolution=resolution,
+            fill_radius=fill_radius,
+            ground_statistic=ground_statistic
+        )
+        cached = dem_cache.load(cache_key)
+
+    if cached is not None:
+        fr_dem, gr_dem, transform, crs_wkt = cached
+    else:
+        # Grid LAS file into first and ground return DEMs
+        with open_point_cloud(las_filename) as las_reader:
+            crs_wkt = las_reader.header.parse_crs().to_wkt()
 
-    # Explode multipart polygon to prepare for area calculations
-    exploded_gap_gdf = non_tree_canopy_gdf.explode(index_parts=True)
+            fr_dem, gr_dem, transform = read_dems(
+                las_reader,
+                chunk_size=chunk_size,
+                resolution=resolution,
+                ground_statistic=ground_statistic,
+                fill_radius=fill_radius
+            )
 
-    # Reset the index to have a clean DataFrame
-    exploded_gap_gdf.reset_index(drop=True, inplace=True)
+        if dem_cache is not None:
+            dem_cache.store(cache_key, fr_dem, gr_dem, transform, crs_wkt)
+            # Keep the cache within its size cap while the run goes on
+            dem_cache.evict()
 
-    # Calculate the area in acres (1 acre = 43,560 square feet)
-    exploded_gap_gdf['Acreage'] = exploded_gap_gdf.geometry.area / 43560
+    # Generate canopy DEM
+    canopy_dem = fr_dem - gr_dem
+    return grid_to_dataarray(canopy_dem, transform, crs_wkt, nodata=np.nan)
 
-    # Define a function to categorize the gap size
-    def categorize_gap_size(acres):
-        if acres < 1/8:
-            return '< 1/8 acre'
-        elif 1/8 <= acres < 1/4:
-            return '1/8 - 1/4 acre'
-        elif 1/4 <= acres < 1/2:
-            return '1/4 - 1/2 acre'
-        elif 1/2 <= acres < 1:
-            return '1/2 - 1 acre'
-        else:
-            return '> 1 acre'
 
-    # Apply the categorization function to the Acreage column
-    exploded_gap_gdf['Gap_Size_Category'] = exploded_gap_gdf['Acreage'].apply(categorize_gap_size)
+def _init_tile_worker(laz_threads):
+    # Sizes the LAZ decompression thread pool of a fresh worker process before it reads
+    # any file; lazrs reads RAYON_NUM_THREADS once, when it first decompresses
+    if laz_threads is not None:
+        os.environ['RAYON_NUM_THREADS'] = str(int(laz_threads))
 
-    # Output shapefiles
-    proj_area_name = str(study_area['Proj_ID'].iloc[0])
-    canopy_gaps_calced_path = os.path.join(output_path,'lidar_'+ proj_area_name + '_canopy_gaps_calced.shp')
-    exploded_gap_gdf.to_file(canopy_gaps_calced_path)
-    dissolved_canopy_gdf = os.path.join(output_path, 'lidar_'+ proj_area_name + '_canopy.shp')
-    canopy_gdf.to_file(dissolved_canopy_gdf)
-    buffered_canopy_path = os.path.join(output_path,'lidar_'+ proj_area_name + '_buffered_canopy.shp')
-    clipped_buffer.to_file(buffered_canopy_path)
 
-def process_lidar_to_canopy(proj_area, las_folder_path, canopy_height=5):
+def iter_las_tiles(las_files, workers=1, laz_threads=None, **tile_kwargs):
+    """
+    Runs `process_las_tile` over many LAS tiles, serially or in a process pool, yielding
+    each tile as soon as it finishes so callers never hold more than one tile at a time.
+
+    Tiles that raise an error are reported and yielded with their exception so one bad
+    tile does not abort the whole project area.
+
+    The worker processes are spawned rather than forked: a process that has already
+    decompressed a LAZ file owns the lazrs thread pool, and forked copies of it can
+    deadlock on that pool. As on Windows, scripts that use workers must therefore guard
+    their entry point with ``if __name__ == '__main__':``.
+
+    Parameters
+    ----------
+    las_files : list of str
+        Paths to the LAS files.
+    workers : int, optional
+        Number of worker processes. 1 runs the tiles serially in this process and None
+        uses every available core (default is 1).
+    laz_threads : int, optional
+        Number of threads each worker process uses to decompress LAZ files. Tiles run
+        serially use the thread pool of this process, which uses every core (default is
+        None, every core).
+    **tile_kwargs
+        Keyword arguments passed to `process_las_tile`.
+
+    Yields
+    ------
+    las_filename : str
+        Path of the tile.
+    chm : xr.DataArray or None
+        Canopy height model of the tile, or None if it failed.
+    error : Exception or None
+        The exception the tile raised, or None if it succeeded.
+    """
+    if workers is not None and workers <= 1:
+        for las_filename in las_files:
+            print(las_filename)
+            try:
+                chm = process_las_tile(las_filename, **tile_kwargs)
+            except Exception as e:
+                print(f"Failed to process {las_filename}: {e}")
+                yield las_filename, None, e
+            else:
+                yield las_filename, chm, None
+    else:
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_tile_worker,
+            initargs=(laz_threads,)
+        ) as executor:
+            futures = {
+                executor.submit(process_las_tile, las_filename, **tile_kwargs): las_filename
+                for las_filename in las_files
+            }
+            for future in as_completed(futures):
+                # Drop the future so its result is released once the caller is done with it
+                las_filename = futures.pop(future)
+                try:
+                    chm = future.result()
+                except Exception as e:
+                    print(f"Failed to process {las_filename}: {e}")
+                    yield las_filename, None, e
+                else:
+                    print(las_filename)
+                    yield las_filename, chm, None
+
+
+@contextmanager
+def _project_mosaics(proj_areas, las_folder_path, scratch_dir, workers=1, laz_threads=None,
+                     use_catalog=True, catalog_path=None,
+                     use_cache=True, cache_dir=None, cache_max_bytes=DEFAULT_CACHE_BYTES, **tile_kwargs):
+    # Processes the tiles of one or more project areas, each tile once, and streams every
+    # tile's CHM into the on-disk mosaic of each area it intersects. Yields the mosaics
+    # by project area id; they are closed on exit. Failures are recorded per area, so a
+    # tile that cannot be mosaicked into one area still counts for the others.
+    single = len(proj_areas) == 1
+
+    # Work out which tiles each project area needs, and the union of them
+    if use_catalog:
+        # Catalog the LAS headers and skip tiles that don't touch the project areas
+        catalog_df = update_catalog(las_folder_path, catalog_path=catalog_path)
+        area_tiles = {
+            proj_id: set(select_tiles(catalog_df, proj_area)['path'])
+            for proj_id, proj_area in proj_areas.items()
+        }
+    else:
+        # List all .las and .laz files in the directory
+        las_files = [os.path.join(las_folder_path, file) for file in os.listdir(las_folder_path) if is_point_cloud_file(file)]
+        area_tiles = {proj_id: set(las_files) for proj_id in proj_areas}
+    las_files = sorted(set().union(*area_tiles.values()))
+    if single and use_catalog:
+        print(f"{len(las_files)} of {len(catalog_df)} LAS files intersect the project area.")
+    elif not single:
+        tile_reads = sum(len(tiles) for tiles in area_tiles.values())
+        print(
+            f"{len(las_files)} LAS files cover {len(proj_areas)} project areas "
+            f"({tile_reads - len(las_files)} repeated tile reads avoided)."
+        )
+    if not las_files:
+        raise ValueError(
+            f"None of the LAS files in {las_folder_path} intersect the project area{'' if single else 's'}."
+        )
+
+    # Avoid oversubscribing cores when parallel workers each decompress LAZ files
+    if laz_threads is None and workers != 1:
+        laz_threads = max(os.cpu_count() // (workers or os.cpu_count()), 1)
+
+    dem_cache = None
+    if use_cache:
+        if cache_dir is None:
+            cache_dir = os.path.join(las_folder_path, 'dem_cache')
+        dem_cache = DemCache(cache_dir, max_bytes=cache_max_bytes)
+
+    failed_tiles = {proj_id: {} for proj_id in proj_areas}
+    with ExitStack() as stack:
+        # One on-disk mosaic per project area; each tile is routed to the areas it touches
+        mosaics = {
+            proj_id: stack.enter_context(ChmMosaic(proj_area, scratch_dir=scratch_dir))
+            for proj_id, proj_area in proj_areas.items()
+        }
+        tiles = iter_las_tiles(las_files, workers=workers, laz_threads=laz_threads, dem_cache=dem_cache, **tile_kwargs)
+        for las_filename, tile_chm, error in tiles:
+            for proj_id, mosaic in mosaics.items():
+                if las_filename not in area_tiles[proj_id]:
+                    continue
+                if error is not None:
+                    failed_tiles[proj_id][las_filename] = error
+                    continue
+                try:
+                    mosaic.add(tile_chm)
+                except ValueError as e:
+                    print(f"Failed to mosaic {las_filename}{'' if single else ' for ' + str(proj_id)}: {e}")
+                    failed_tiles[proj_id][las_filename] = e
+            del tile_chm
+
+        if dem_cache is not None:
+            dem_cache.evict()
+        for proj_id, failed in failed_tiles.items():
+            if failed:
+                print(f"Skipped {len(failed)} LAS file(s) that failed to process{'' if single else ' for ' + str(proj_id)}.")
+
+        yield mosaics
+
+
+def process_lidar_to_canopy(proj_area, las_folder_path, canopy_height=5,
+                            resolution=1.0, fill_radius=3.0, ground_statistic='min',
+                            chunk_size=None, workers=1, laz_threads=None,
+                            use_catalog=True, catalog_path=None,
+                            use_cache=True, cache_dir=None, cache_max_bytes=DEFAULT_CACHE_BYTES,
+                            chm_path=None, chm_dtype='float32', cleanup=None, simplify_tolerance=None):
     """
     Processes LIDAR data to generate a canopy height GeoDataFrame for a specific project area.
 
     This function performs the following steps:
-    1. Lists all LAS files in the specified directory.
-    2. Processes each LAS file to create DEMs from first and ground returns.
+    1. Lists all LAS and LAZ files in the specified directory and, using a catalog of
+       their headers, skips tiles that do not intersect the project area.
+    2. Streams each LAS file into DEMs from first and ground returns.
     3. Generates a canopy height DEM by subtracting the ground return DEM from the first return DEM.
-    4. Classifies the canopy height into binary values (1 for canopy, 0 for no canopy).
-    5. Merges and clips the processed DEMs to the specified project area.
+    4. Streams each tile's canopy height DEM, clipped to the project area, into an
+       on-disk mosaic and saves it as a canopy height model (CHM) GeoTIFF.
+    5. Classifies the canopy height into binary values (1 for canopy, 0 for no canopy).
     6. Converts the binary canopy mask into polygons and returns a GeoDataFrame of canopy areas.
 
     Parameters
@@ -114,10 +379,60 @@ def process_lidar_to_canopy(proj_area, las_folder_path, canopy_height=5):
     proj_area : GeoDataFrame
         A GeoDataFrame containing the geometry of the project area to which the output will be clipped.
     las_folder_path : str
-        The path to the directory containing the LAS files to be processed.
+        The path to the directory containing the LAS or LAZ files to be processed.
     canopy_height : float, optional
         The height threshold to classify canopy vs. no canopy. 
         All values greater than or equal to this threshold will be considered canopy (default is 5).
+    resolution : float, optional
+        Cell size of the DEMs in the LAS file units (default is 1.0).
+    fill_radius : float, optional
+        Maximum distance in LAS file units used to fill cells without returns (default is 3.0).
+    ground_statistic : {'min', 'mean'}, optional
+        Reduction applied to ground returns in each cell (default is 'min').
+    chunk_size : int, optional
+        Maximum number of points read into memory at once per tile. Peak memory is then
+        set by the tile grid size rather than the tile point count. If None, each tile is
+        read in a single chunk (default is None).
+    workers : int, optional
+        Number of worker processes used to process tiles, and then to polygonize the
+        canopy mask, in parallel. 1 processes tiles serially and None uses every available
+        core (default is 1). Tiles that fail are skipped with a message instead of
+        aborting the project area.
+    laz_threads : int, optional
+        Number of threads each worker process uses to decompress LAZ files when workers is
+        not 1. If None, the cores are split evenly between the workers; tiles run serially
+        always use every core (default is None).
+    use_catalog : bool, optional
+        Whether to catalog the LAS headers and skip tiles whose bounds do not intersect
+        the project area before reading any points (default is True).
+    catalog_path : str, optional
+        Path to the SQLite tile catalog. Defaults to a 'lidar_catalog.sqlite' sidecar in
+        `las_folder_path`. The catalog is refreshed incrementally on each run.
+    use_cache : bool, optional
+        Whether to reuse first and ground return DEMs gridded by earlier runs with the same
+        LAS contents, resolution, fill_radius and ground_statistic, so re-runs with a
+        different canopy_height skip gridding entirely (default is True).
+    cache_dir : str, optional
+        Directory of the DEM cache. Defaults to 'dem_cache' inside `las_folder_path`.
+    cache_max_bytes : int, optional
+        Size cap of the DEM cache; least recently used DEMs are evicted past it
+        (default is 10 GB).
+    chm_path : str, optional
+        Path of the canopy height model GeoTIFF. Use `process_chm_to_canopy` on it to get
+        canopy polygons for a new canopy_height without reading any LAS files. Defaults to
+        'output/canopy_height_model.tif' inside `las_folder_path`.
+    chm_dtype : {'float32', 'int16'}, optional
+        Storage type of the CHM GeoTIFF; 'int16' stores heights in hundredths (default is 'float32').
+    cleanup : MaskCleanup, optional
+        Raster cleanup (opening/closing and a minimum mapping unit sieve) applied to the
+        canopy mask before it is polygonized. The number of features it removed is
+        printed (default is None, no cleanup).
+    simplify_tolerance : float, optional
+        If given, the canopy polygons are simplified with this tolerance (in map units,
+        about one cell size) before they are returned, preserving shared boundaries and
+        keeping the area error within 1%. The vertex reduction is printed. This makes
+        `process_canopy_areas` and the output writes several times faster (default is
+        None, no simplification).
 
     Returns
     -------
@@ -128,118 +443,304 @@ def process_lidar_to_canopy(proj_area, las_folder_path, canopy_height=5):
     -----
     - The function assumes that the LAS files are in the EPSG:6430 coordinate system.
     - The output GeoDataFrame is reprojected to EPSG:6430.
+    - DEMs are built with `utils.lidar_grid.read_dems` rather than WhiteboxTools IDW
+      interpolation, so no intermediate GeoTIFFs are written.
+    - Only the LAS header is read to get the CRS and bounds of each tile.
+    - Tiles are mosaicked into a memory-mapped scratch file next to `chm_path` instead of
+      merging them in memory, so about one tile is held in memory at a time.
 
     Examples
     --------
     >>> proj_area = gpd.read_file("path/to/project_area.shp")
     >>> las_folder_path = "path/to/las_files"
-    >>> output_fr_tif = "path/to/output_fr.tif"
-    >>> output_gr_tif = "path/to/output_gr.tif"
-    >>> canopy_gdf = process_lidar_to_canopy(proj_area, las_folder_path, output_fr_tif, output_gr_tif)
+    >>> canopy_gdf = process_lidar_to_canopy(proj_area, las_folder_path, canopy_height=5)
     >>> print(canopy_gdf.head())
     """
-    # List all .tif files in the directory
-    las_files = [os.path.join(las_folder_path, file) for file in os.listdir(las_folder_path) if file.endswith('.las')]
+    if chm_path is None:
+        chm_path = os.path.join(las_folder_path, 'output', 'canopy_height_model.tif')
+    chm_folder = os.path.dirname(os.path.abspath(chm_path))
+    os.makedirs(chm_folder, exist_ok=True)
+
+    # Stream each processed tile into an on-disk mosaic clipped to the project area
+    with _project_mosaics(
+        {None: proj_area},
+        las_folder_path,
+        scratch_dir=chm_folder,
+        workers=workers,
+        laz_threads=laz_threads,
+        use_catalog=use_catalog,
+        catalog_path=catalog_path,
+        use_cache=use_cache,
+        cache_dir=cache_dir,
+        cache_max_bytes=cache_max_bytes,
+        resolution=resolution,
+        fill_radius=fill_radius,
+        ground_statistic=ground_statistic,
+        chunk_size=chunk_size
+    ) as mosaics:
+        mosaic = mosaics[None]
+        if mosaic.chm is None:
+            raise ValueError(f"None of the LAS files in {las_folder_path} could be processed.")
+        print(mosaic.chm.rio.crs.to_wkt())
+
+        # Keep the continuous canopy height model
+        write_chm(mosaic.chm, chm_path, dtype=chm_dtype)
+        print(f"Canopy height model saved to {chm_path}")
+
+        canopy_gdf = chm_to_canopy(
+            mosaic.chm,
+            canopy_height,
+            workers=workers,
+            cleanup=cleanup,
+            simplify_tolerance=simplify_tolerance
+        )
 
-    output_folder_path = os.path.join(las_folder_path, "output")
+    return canopy_gdf
 
-    if not os.path.exists(output_folder_path):
-        os.makedirs(output_folder_path)
-        print(f"'output' folder created at: {output_folder_path}")
-    else:
-        print(f"'output' folder already exists at: {output_folder_path}")
 
-    tile_agg = []
+def process_lidar_projects(proj_area_gdf, las_folder_path, output_path, canopy_height=5,
+                           buffer_distance=5, engine='vector', output_format='shapefile',
+                           resolution=1.0, fill_radius=3.0, ground_statistic='min',
+                           chunk_size=None, workers=1, laz_threads=None,
+                           use_catalog=True, catalog_path=None,
+                           use_cache=True, cache_dir=None, cache_max_bytes=DEFAULT_CACHE_BYTES,
+                           chm_dtype='float32', cleanup=None, simplify_tolerance=None):
+    """
+    Processes LIDAR data for many project areas at once, reading each shared tile only once.
+
+    Calling `process_lidar_to_canopy` once per project area reads and grids the tiles
+    shared by neighbouring areas again for every area. Here the tiles required by each
+    area are selected from the tile catalog, the union of them is processed once, and
+    each tile's canopy height model is streamed into the on-disk mosaic of every area it
+    intersects. Each area then goes through `chm_to_canopy` and `process_canopy_areas`
+    as before. `process_lidar_to_canopy` shares the same tile setup for a single area.
+    Failures are recorded per area: a tile that cannot be mosaicked into one area is
+    still used for the others.
 
-    for las_file in las_files:
-        # Process LAS file to TIFF for first and ground returns
-        print(las_file)
+    Outputs are written to `output_path` per project area: the CHM GeoTIFF as
+    'lidar_<Proj_ID>_canopy_height_model.tif' and the canopy and gap layers named
+    'lidar_<Proj_ID>_*' by `process_canopy_areas`.
 
-        las_filename_no_ext = os.path.splitext(las_file)[0]
-        las_filename = las_filename_no_ext + ".las"
+    Parameters
+    ----------
+    proj_area_gdf : GeoDataFrame
+        Project areas, one or more rows per area, identified by their 'Proj_ID'.
+    las_folder_path : str
+        The path to the directory containing the LAS or LAZ files of all project areas.
+    output_path : str
+        Folder the outputs of every project area are written to.
+    canopy_height : float, optional
+        The height threshold to classify canopy vs. no canopy (default is 5).
+    buffer_distance : float, optional
+        The distance to buffer the canopy geometries when finding gaps (default is 5).
+    engine : {'vector', 'raster'}, optional
+        Gap engine passed to `process_canopy_areas` (default is 'vector').
+    output_format : {'shapefile', 'gpkg', 'fgb', 'parquet'}, optional
+        Format of the canopy and gap layers (default is 'shapefile').
+    resolution, fill_radius, ground_statistic, chunk_size, workers, laz_threads, use_catalog, catalog_path, use_cache, cache_dir, cache_max_bytes, chm_dtype, cleanup, simplify_tolerance
+        As in `process_lidar_to_canopy`.
 
-        las_file = laspy.read(las_filename)
-        crs_wkt = las_file.header.parse_crs().to_wkt()
-        print(crs_wkt)
-        proj_area = proj_area.to_crs(crs_wkt)
+    Returns
+    -------
+    dict
+        Project area id to a (canopy_gdf, clipped_buffer, exploded_gap_gdf) tuple. Areas
+        that no LAS file could be processed for are skipped with a message.
 
-        wbt = whitebox.WhiteboxTools()
+    Examples
+    --------
+    >>> proj_area_gdf = gpd.read_file("path/to/project_areas.shp")
+    >>> results = process_lidar_projects(proj_area_gdf, "path/to/las_files", "path/to/output")
+    >>> canopy_gdf, clipped_buffer, exploded_gap_gdf = results['Conifer Hill']
+    """
+    proj_areas = {
+        proj_id: proj_area_gdf[proj_area_gdf['Proj_ID'] == proj_id]
+        for proj_id in proj_area_gdf['Proj_ID'].unique()
+    }
+    os.makedirs(output_path, exist_ok=True)
+
+    results = {}
+    with _project_mosaics(
+        proj_areas,
+        las_folder_path,
+        scratch_dir=output_path,
+        workers=workers,
+        laz_threads=laz_threads,
+        use_catalog=use_catalog,
+        catalog_path=catalog_path,
+        use_cache=use_cache,
+        cache_dir=cache_dir,
+        cache_max_bytes=cache_max_bytes,
+        resolution=resolution,
+        fill_radius=fill_radius,
+        ground_statistic=ground_statistic,
+        chunk_size=chunk_size
+    ) as mosaics:
+        for proj_id, mosaic in mosaics.items():
+            if mosaic.chm is None:
+                print(f"No LAS files could be processed for {proj_id}; skipping it.")
+                continue
+            print("Processing canopy for " + str(proj_id))
+
+            chm_path = os.path.join(output_path, 'lidar_' + str(proj_id) + '_canopy_height_model.tif')
+            write_chm(mosaic.chm, chm_path, dtype=chm_dtype)
+            print(f"Canopy height model saved to {chm_path}")
+
+            canopy_gdf = chm_to_canopy(
+                mosaic.chm,
+                canopy_height,
+                workers=workers,
+                cleanup=cleanup,
+                simplify_tolerance=simplify_tolerance
+            )
+            # Release the mosaic's scratch file before moving on to the next area
+            mosaic.close()
+
+            clipped_buffer, exploded_gap_gdf = process_canopy_areas(
+                canopy_gdf,
+                proj_areas[proj_id],
+                output_path,
+                buffer_distance=buffer_distance,
+                engine=engine,
+                resolution=resolution,
+                workers=workers,
+                output_format=output_format
+            )
+            results[proj_id] = (canopy_gdf, clipped_buffer, exploded_gap_gdf)
+
+    return results
+
+
+def chm_to_canopy(chm, canopy_height=5, workers=1, cleanup=None, simplify_tolerance=None):
+    """
+    Converts a canopy height model into canopy polygons for a height threshold.
 
-        output_fr_tif = os.path.join(
-            las_folder_path,
-            "output",
-            las_filename_no_ext +'_fr.tif'
-        )
-        output_gr_tif = os.path.join(
-            las_folder_path,
-            "output",
-            las_filename_no_ext +'_gr.tif'
-        )
+    Parameters
+    ----------
+    chm : xr.DataArray
+        Single band canopy height model with NaN marking cells without data.
+    canopy_height : float, optional
+        The height threshold to classify canopy vs. no canopy.
+        All values greater than or equal to this threshold will be considered canopy (default is 5).
+    workers : int, optional
+        Number of worker processes used to polygonize the canopy mask in row blocks.
+        1 polygonizes in this process and None uses every available core (default is 1).
+    cleanup : MaskCleanup, optional
+        Opening/closing and minimum mapping unit sieve applied to the canopy mask before
+        it is polygonized (default is None, no cleanup).
+    simplify_tolerance : float, optional
+        If given, the pixel-staircase polygons are simplified with this tolerance (in map
+        units, about one cell size) while preserving shared boundaries and keeping the
+        area error within 1% (default is None, no simplification).
 
-        first_return = wbt.lidar_idw_interpolation(
-            i=las_filename,
-            output=output_fr_tif,
-            parameter="elevation",
-            returns="first",
-            resolution=1.0,
-            radius=3.0
-        )
-        ground_return = wbt.lidar_idw_interpolation(
-            i=las_filename,
-            output=output_gr_tif,
-            parameter="elevation",
-            returns="ground",
-            resolution=1.0,
-            radius=3.0
-        )
+    Returns
+    -------
+    canopy_gdf : GeoDataFrame
+        A GeoDataFrame containing polygons representing canopy areas, in the CRS of the CHM.
+    """
+    chm = chm.squeeze()  # Assuming the data is in the first band
 
-        fr_dem = rxr.open_rasterio(output_fr_tif)
-
-        gr_dem = rxr.open_rasterio(output_gr_tif)
-
-        # Generate canopy DEM
-        canopy_dem = fr_dem - gr_dem
-
-        # Set all values greater than 5 (canopy) to 1 and all values less than 5 (no canopy) to 0
-        # Modify this value to adjust canopy height sensitivity
-        # Process individual LIDAR tiles and prep for merge
-        canopy_dem.values[canopy_dem < canopy_height] = 0
-        canopy_dem.values[canopy_dem > canopy_height] = 1
-        canopy_dem = canopy_dem.round()
-        canopy_dem = canopy_dem.rio.write_crs(crs_wkt, inplace=True)
-        #canopy_dem = canopy_dem.rio.reproject(CRS.from_epsg(4326))
-        canopy_dem = canopy_dem.astype('float64')
-        nodata_value = canopy_dem.rio.nodata
-        if nodata_value is not None:
-            canopy_dem = canopy_dem.where(~np.isclose(canopy_dem, nodata_value), 0)
-        canopy_dem.rio.write_nodata(0, inplace=True)
-        canopy_dem = canopy_dem.astype('int32')
-        tile_agg.append(canopy_dem)
-    # Merge all processed tiles
-    canopy_merged = rxrm.merge_arrays(tile_agg).rio.clip(proj_area.geometry)
-    binary_mask = canopy_merged.squeeze()  # Assuming the data is in the first band
-
-    # Create a mask where cell values are 1
-    mask = binary_mask == 1
+    # Set all values greater than or equal to canopy_height (canopy) to 1 and everything
+    # else, including cells without data, to 0, as a uint8 mask
+    # Modify canopy_height to adjust canopy height sensitivity
+    mask, valid = canopy_mask(chm, canopy_height)
 
     # Get the affine transform from the raster data
-    transform = binary_mask.rio.transform()
+    transform = chm.rio.transform()
+
+    # Remove speckles, pinholes and features below the minimum mapping unit
+    if cleanup is not None:
+        mask, _ = cleanup.apply(mask, resolution=abs(transform.a), crs=chm.rio.crs)
+        mask &= valid
 
-    # Extract shapes (polygons) from the binary mask
-    shapes = rasterio.features.shapes(mask.astype(np.int16).values, transform=transform)
-    polygons = [shape(geom) for geom, value in shapes if value == 1]
+    # Extract shapes (polygons) of the canopy cells only from the binary mask
+    polygons, _ = polygonize_raster(mask, transform, mask=mask.view(bool), workers=workers)
+
+    # Drop the pixel-corner vertices to speed up every downstream geometry operation
+    if simplify_tolerance:
+        polygons, _ = simplify_polygons(polygons, simplify_tolerance, cell_size=abs(transform.a))
 
     # Create a GeoDataFrame from the polygons
-    canopy_gdf = gpd.GeoDataFrame({'geometry': polygons})
+    canopy_gdf = gpd.GeoDataFrame({'geometry': polygons}, crs=chm.rio.crs)
 
-    crs = canopy_merged.rio.crs
+    return canopy_gdf
 
-    if canopy_gdf.crs is None:
-        canopy_gdf = canopy_gdf.set_crs(canopy_merged.rio.crs)
 
-    # Reproject to EPSG: the identified CRS
-    canopy_gdf = canopy_gdf.to_crs(crs_wkt)
+def process_chm_to_canopy(chm_path, canopy_height=5, proj_area=None, cleanup=None, simplify_tolerance=None):
+    """
+    Generates canopy polygons from a saved canopy height model without reading any LAS files.
 
-    return canopy_gdf
+    Parameters
+    ----------
+    chm_path : str
+        Path to a canopy height model GeoTIFF saved by `process_lidar_to_canopy`.
+    canopy_height : float, optional
+        The height threshold to classify canopy vs. no canopy.
+        All values greater than or equal to this threshold will be considered canopy (default is 5).
+    proj_area : GeoDataFrame, optional
+        Project area to clip the canopy height model to. The saved CHM is already clipped
+        to the project area it was generated for.
+    cleanup : MaskCleanup, optional
+        Raster cleanup applied to the canopy mask before it is polygonized (default is None).
+    simplify_tolerance : float, optional
+        Topology-preserving simplification tolerance of the canopy polygons (default is None).
+
+    Returns
+    -------
+    canopy_gdf : GeoDataFrame
+        A GeoDataFrame containing polygons representing canopy areas, in the CRS of the CHM.
+
+    Examples
+    --------
+    >>> canopy_gdf = process_chm_to_canopy("path/to/las_files/output/canopy_height_model.tif", canopy_height=10)
+    """
+    chm = read_chm(chm_path)
+    if proj_area is not None:
+        chm = chm.rio.clip(proj_area.to_crs(chm.rio.crs).geometry)
+    return chm_to_canopy(chm, canopy_height, cleanup=cleanup, simplify_tolerance=simplify_tolerance)
+
+
+def process_chm_to_canopy_masks(chm_path, canopy_heights, masks_path=None, proj_area=None, polygon_heights=None):
+    """
+    Classifies a saved canopy height model against many height thresholds in one pass.
+
+    Useful for calibrating canopy_height against field plots without reprocessing LiDAR.
+
+    Parameters
+    ----------
+    chm_path : str
+        Path to a canopy height model GeoTIFF saved by `process_lidar_to_canopy`.
+    canopy_heights : list of float
+        Height thresholds, e.g. [3, 5, 10, 15, 20].
+    masks_path : str, optional
+        If given, the masks are written there as a single multi-band uint8 GeoTIFF with
+        one band per threshold.
+    proj_area : GeoDataFrame, optional
+        Project area to clip the canopy height model to.
+    polygon_heights : list of float, optional
+        Thresholds (from `canopy_heights`) for which canopy polygons are also returned.
+
+    Returns
+    -------
+    masks : xr.DataArray
+        uint8 canopy masks, one band per sorted threshold (1 canopy, 0 no canopy, 255 no data).
+    canopy_gdfs : dict
+        Maps each of `polygon_heights` to its canopy GeoDataFrame.
+
+    Examples
+    --------
+    >>> masks, canopy_gdfs = process_chm_to_canopy_masks(chm_path, [3, 5, 10, 15, 20], masks_path="canopy_masks.tif")
+    """
+    chm = read_chm(chm_path)
+    if proj_area is not None:
+        chm = chm.rio.clip(proj_area.to_crs(chm.rio.crs).geometry)
+
+    masks = canopy_masks(chm, canopy_heights)
+    if masks_path is not None:
+        write_canopy_masks(masks, masks_path)
+        print(f"Canopy masks saved to {masks_path}")
 
+    canopy_gdfs = {}
+    for canopy_height in polygon_heights or []:
+        canopy_gdfs[canopy_height] = chm_to_canopy(chm, canopy_height)
 
+    return masks, canopy_gdfs
@@ -0,0 +1,192 @@
+# Utility methods used to convert rasters into polygons in parallel row blocks
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import rasterio.features
+import shapely
+from rasterio.transform import Affine
+
+# Rows polygonized per block; blocks are only split off for rasters taller than this
+DEFAULT_BLOCK_ROWS = 2048
+
+
+def _polygonize_block(raster, mask, transform):
+    # Returns the polygons of a block as flat numpy arrays (coordinates, ring offsets,
+    # polygon offsets, values), which are much cheaper to send between processes than
+    # shapely geometries
+    coords = []
+    ring_offsets = [0]
+    polygon_offsets = [0]
+    values = []
+    for geom, value in rasterio.features.shapes(raster, mask=mask, transform=transform):
+        for ring in geom['coordinates']:
+            coords.append(np.asarray(ring, dtype=np.float64))
+            ring_offsets.append(ring_offsets[-1] + len(ring))
+        polygon_offsets.append(polygon_offsets[-1] + len(geom['coordinates']))
+        values.append(value)
+
+    coords = np.concatenate(coords) if coords else np.empty((0, 2))
+    return coords, np.asarray(ring_offsets), np.asarray(polygon_offsets), np.asarray(values)
+
+
+def _build_polygons(coords, ring_offsets, polygon_offsets, values):
+    # Builds all polygons of a block in one call
+    if len(values) == 0:
+        return np.empty(0, dtype=object)
+    return shapely.from_ragged_array(shapely.GeometryType.POLYGON, coords, (ring_offsets, polygon_offsets))
+
+
+def _polygonize_window(read_window, window, transform):
+    # Reads one window of a raster and polygonizes it with the values in its dtype
+    row, col = window[:2]
+    raster = read_window(window)
+    coords, ring_offsets, polygon_offsets, values = _polygonize_block(
+        raster, None, transform * Affine.translation(col, row)
+    )
+    return coords, ring_offsets, polygon_offsets, values.astype(raster.dtype)
+
+
+def _stitch_seams(polygons, values, transform, seam_rows=(), seam_cols=()):
+    # Unions the polygons of each value that touch an interior block seam (at the given
+    # rows and columns) and splits them back into 4-connected parts
+    seam_ys = np.array([(transform * (0, row))[1] for row in seam_rows])
+    seam_xs = np.array([(transform * (col, 0))[0] for col in seam_cols])
+    bounds = shapely.bounds(polygons)
+    on_seam = np.zeros(len(polygons), dtype=bool)
+    for seams, low, high, cell_size in ((seam_ys, 1, 3, transform.e), (seam_xs, 0, 2, transform.a)):
+        tolerance = abs(cell_size) * 1e-6
+        for seam in seams:
+            on_seam |= (np.abs(bounds[:, low] - seam) <= tolerance) | (np.abs(bounds[:, high] - seam) <= tolerance)
+
+    # Union the seam polygons of each value and split them back into connected parts
+    seam_index = np.flatnonzero(on_seam)
+    stitched_polygons = []
+    stitched_values = []
+    seam_values, inverse = np.unique(values[seam_index], return_inverse=True)
+    for group, value in enumerate(seam_values):
+        group_polygons = polygons[seam_index[inverse == group]]
+        if len(group_polygons) > 1:
+            group_polygons = shapely.get_parts(shapely.union_all(group_polygons))
+            # Drop the collinear vertices left on the seam
+            group_polygons = shapely.simplify(group_polygons, 0)
+        stitched_polygons.append(group_polygons)
+        stitched_values.append(np.full(len(group_polygons), value, dtype=values.dtype))
+
+    polygons = np.concatenate([polygons[~on_seam]] + stitched_polygons)
+    values = np.concatenate([values[~on_seam]] + stitched_values)
+    return polygons, values
+
+
+def polygonize_raster(raster, transform, mask=None, block_rows=DEFAULT_BLOCK_ROWS, workers=1):
+    """
+    Converts the regions of equal value of a raster into polygons, block by block.
+
+    The raster is split into blocks of rows that are polygonized independently (in a
+    process pool when `workers` is not 1). Polygons that touch a block seam are then
+    unioned with the polygons of the same value and split back into 4-connected parts, so
+    the result matches polygonizing the whole raster at once. Geometries are built in bulk
+    as shapely arrays rather than one `shape` call per polygon.
+
+    Parameters
+    ----------
+    raster : np.ndarray
+        2D raster of a type supported by `rasterio.features.shapes` (e.g. uint8, int16,
+        int32, float32).
+    transform : affine.Affine
+        Affine transform of the raster.
+    mask : np.ndarray, optional
+        2D boolean raster; only cells where it is True are polygonized (e.g. the canopy
+        cells of a binary mask). Default is None, all cells.
+    block_rows : int, optional
+        Number of rows per block. Default is `DEFAULT_BLOCK_ROWS`.
+    workers : int, optional
+        Number of worker processes. 1 polygonizes the blocks serially in this process and
+        None uses every available core (default is 1).
+
+    Returns
+    -------
+    polygons : np.ndarray
+        Array of shapely Polygons, one per connected region.
+    values : np.ndarray
+        Raster value of each polygon, in the dtype of `raster`.
+    """
+    height = raster.shape[0]
+    starts = list(range(0, height, max(int(block_rows), 1)))
+    blocks = [
+        (
+            raster[start:start + block_rows],
+            None if mask is None else mask[start:start + block_rows],
+            transform * Affine.translation(0, start)
+        )
+        for start in starts
+    ]
+
+    if len(blocks) == 1 or (workers is not None and workers <= 1):
+        results = [_polygonize_block(*block) for block in blocks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_polygonize_block, *zip(*blocks)))
+
+    polygons = np.concatenate([_build_polygons(*result) for result in results])
+    values = np.concatenate([result[-1] for result in results]).astype(raster.dtype)
+    if len(blocks) == 1 or len(polygons) == 0:
+        return polygons, values
+    return _stitch_seams(polygons, values, transform, seam_rows=starts[1:])
+
+
+def polygonize_windows(read_window, shape, transform, window_size=DEFAULT_BLOCK_ROWS, workers=1):
+    """
+    Converts the regions of equal value of a raster into polygons, reading it window by window.
+
+    Like `polygonize_raster`, but for rasters too large to hold in memory: each square
+    window is read by `read_window` and polygonized independently (in a process pool
+    when `workers` is not 1), and the polygons that touch a seam between windows are
+    stitched the same way. Memory use is set by the window size and the polygons, not
+    by the raster size.
+
+    Parameters
+    ----------
+    read_window : callable
+        Called with a (row, col, height, width) window and returns the 2D raster of that
+        window, e.g. read from a GeoTIFF. Must be picklable (a module-level function or a
+        `functools.partial` of one) when `workers` is not 1.
+    shape : tuple of int
+        (height, width) of the raster.
+    transform : affine.Affine
+        Affine transform of the raster.
+    window_size : int, optional
+        Side of the windows in pixels. Default is `DEFAULT_BLOCK_ROWS`.
+    workers : int, optional
+        Number of worker processes. 1 polygonizes the windows serially in this process
+        and None uses every available core (default is 1).
+
+    Returns
+    -------
+    polygons : np.ndarray
+        Array of shapely Polygons, one per connected region.
+    values : np.ndarray
+        Raster value of each polygon, in the dtype returned by `read_window`.
+    """
+    height, width = shape
+    window_size = max(int(window_size), 1)
+    windows = [
+        (row, col, min(window_size, height - row), min(window_size, width - col))
+        for row in range(0, height, window_size)
+        for col in range(0, width, window_size)
+    ]
+    args = ([read_window] * len(windows), windows, [transform] * len(windows))
+
+    if len(windows) == 1 or (workers is not None and workers <= 1):
+        results = list(map(_polygonize_window, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_polygonize_window, *args))
+
+    polygons = np.concatenate([_build_polygons(*result) for result in results])
+    values = np.concatenate([result[-1] for result in results])
+    if len(windows) == 1 or len(polygons) == 0:
+        return polygons, values
+    return _stitch_seams(
+        polygons, values, transform,
+        seam_rows=range(window_size, height, window_size), seam_cols=range(window_size, width, window_size)
+    )
@@ -1,129 +1,161 @@
+import os
+
 import earthpy.spatial as es
 import numpy as np
 import pandas as pd
 import geopandas as gpd
 import matplotlib.pyplot as plt
 import rasterio
-from rasterio.features import shapes
-from shapely.geometry import shape, Polygon, MultiPolygon
+import shapely
+from shapely.geometry import Polygon, MultiPolygon
 from shapely.ops import unary_union
 from skimage import io, color
-from skimage.segmentation import quickshift
-from sklearn.cluster import KMeans
-from tqdm import tqdm
+
+from .ndvi_clustering import cluster_segments
+from .polygon_simplify import simplify_polygons
+from .raster_polygons import polygonize_raster
+from .segment_stats import segment_statistics
+from .segmentation import segment_ndvi
+from .tiled_segmentation import polygonize_segment_classes, segment_mean_ndvi, segment_raster_tiled
 
 
-def generate_binary_gdf_ndvi(tilepath, n_clusters=2, plot_segments=False, plot_path=None):
+def generate_binary_gdf_ndvi(tilepath, n_clusters=2, plot_segments=False, plot_path=None, workers=1, cleanup=None,
+                             simplify_tolerance=None, segmentation='quickshift', segmentation_params=None,
+                             window_size=None, labels_path=None, clustering='kmeans'):
     """
     Generates a GeoDataFrame with two classes: 'tree' and 'not tree' based on NDVI values.
 
     Parameters:
     - tilepath (str): Path to the GeoTIFF image.
-    - n_clusters (int): Number of clusters to use in KMeans clustering (default is 2).
-    - plot_segments (bool): Whether to plot the quickshift segments (default is False).
+    - n_clusters (int): Number of clusters to split the segments into (default is 2).
+    - plot_segments (bool): Whether to plot the segments (default is False).
     - plot_path (str): Path to save the segment plots (optional).
+    - workers (int): Number of worker processes used to polygonize the segments; None uses every core (default is 1).
+    - cleanup (MaskCleanup): Opening/closing and minimum mapping unit sieve applied to the tree mask before dissolving (optional).
+    - simplify_tolerance (float): Topology-preserving simplification tolerance applied to the polygons before dissolving (optional).
+    - segmentation (str): Segmentation backend: 'quickshift', 'felzenszwalb', 'slic', 'watershed' or 'pixel' (default is 'quickshift').
+      'slic' is many times faster than 'quickshift' on large mosaics; see `SEGMENTATION_METHODS`.
+    - segmentation_params (dict): Parameters passed to the segmentation backend, e.g. {'segment_size': 200} (optional).
+    - window_size (int): If given, the image is segmented in overlapping windows of this many pixels, in parallel
+      when workers != 1, and segments crossing window edges are merged; see `segment_raster_tiled` (optional).
+      The segment statistics, cleanup and polygons are then computed window by window as well, so the image is
+      never loaded whole, and `plot_segments` is skipped.
+    - labels_path (str): Path of the label GeoTIFF written in tiled mode (default is '<tilepath>_segments.tif').
+    - clustering (str): Clustering backend for the segment NDVI means: 'kmeans', 'kmeans1d', 'jenks', 'otsu' or
+      'minibatch' (default is 'kmeans'). 'kmeans1d' is exact and deterministic; see `CLUSTERING_METHODS`.
 
     Returns:
     - GeoDataFrame: A dissolved GeoDataFrame with polygons classified as 'tree' or 'not tree'.
     """
-    # Load the image and bands
-    tile = rasterio.open(tilepath)
-    red = tile.read(1).astype(float)
-    nir = tile.read(4).astype(float)
-
     # Get image bounding box info
-    sr = tile.crs
-    bounds = tile.bounds
-    affine = tile.transform
-
-    # Compute NDVI using earthpy.spatial.normalized_diff
-    ndvi = es.normalized_diff(nir, red)
-
-    # Handle NaN values
-    ndvi = np.where(np.isnan(ndvi), 0, ndvi)
-
-    # Segment the NDVI image using quickshift
-    img = io.imread(tilepath)
-    img_ndvi = np.expand_dims(ndvi, axis=2).astype(np.float32)
-    rgb_img = img[:, :, :3]
-    segments = quickshift(img_ndvi, kernel_size=3, convert2lab=False, max_dist=6, ratio=0.5).astype('int32')
-    print("Quickshift number of segments: %d" % len(np.unique(segments)))
-
-    # Plot Segments
-    if plot_segments:
-        fig, ax = plt.subplots(1, 2, figsize=(5, 10))
-
-        # Original Pixels
-        ax[0].imshow(rgb_img)
-        ax[0].set_title("Original Pixels")
-        ax[0].set_xticks([])
-        ax[0].set_yticks([])
-        ax[0].set_xticklabels([])
-        ax[0].set_yticklabels([])
-        ax[0].tick_params(axis='both', which='both', length=0)
-
-        # Quickshift Segments
-        ax[1].imshow(color.label2rgb(segments, rgb_img, bg_label=0))
-        ax[1].set_title("Quickshift Segments")
-        ax[1].set_xticks([])
-        ax[1].set_yticks([])
-        ax[1].set_xticklabels([])
-        ax[1].set_yticklabels([])
-        ax[1].tick_params(axis='both', which='both', length=0)
-
-        if plot_path:
-            plt.savefig(plot_path)
-        plt.show()
-
-    # Convert segments to vector features
-    polys = []
-    for shp, value in tqdm(shapes(segments, transform=affine), desc="Converting segments to vector features"):
-        polys.append(shp)
-
-    # Compute mean NDVI for each segment
-    mean_ndvi_vals = []
-    for shp in tqdm(polys, desc="Computing mean NDVI values"):
-        """
-            Improvement Ideas:
-            - by indexes instead of coordinates
-            - by segments instead of polys 
-            - zip them later
-            - have both steps dependent on segments
-        """
-        mask = rasterio.features.geometry_mask([shp], transform=affine, invert=True, out_shape=ndvi.shape)
-        mean_ndvi_vals.append(ndvi[mask].mean())
-
-    mean_ndvi_vals = np.array(mean_ndvi_vals).reshape(-1, 1)
-
-    # Apply k-means clustering
-    kmeans = KMeans(n_clusters=n_clusters, random_state=0).fit(mean_ndvi_vals)
-    labels = kmeans.labels_
-
-    # Create GeoDataFrame with segments and their cluster labels
-    geom = [shape(i) for i in polys]
-    gdf = gpd.GeoDataFrame({'geometry': geom, 'cluster': labels}, crs=sr)
-
-    # Determine which cluster corresponds to 'tree' based on NDVI values
+    with rasterio.open(tilepath) as tile:
+        sr = tile.crs
+        bounds = tile.bounds
+        affine = tile.transform
+
+    if window_size:
+        # Segment the NDVI window by window into a label GeoTIFF and compute the mean
+        # NDVI of each segment from it, without loading the whole image
+        if labels_path is None:
+            labels_path = os.path.splitext(tilepath)[0] + '_segments.tif'
+        n_segments = segment_raster_tiled(
+            tilepath, labels_path, segmentation, segmentation_params, window_size=window_size, workers=workers
+        )
+        print("%s number of segments: %d" % (segmentation.capitalize(), n_segments))
+        if plot_segments:
+            print("Segment plots are skipped in tiled mode, which never loads the whole image.")
+        segment_index = np.arange(n_segments)
+        mean_ndvi_vals = segment_mean_ndvi(tilepath, labels_path, n_segments, window_size).reshape(-1, 1)
+    else:
+        # Load the image and bands
+        with rasterio.open(tilepath) as tile:
+            red = tile.read(1).astype(float)
+            nir = tile.read(4).astype(float)
+
+        # Compute NDVI using earthpy.spatial.normalized_diff
+        ndvi = es.normalized_diff(nir, red)
+
+        # Handle NaN values
+        ndvi = np.where(np.isnan(ndvi), 0, ndvi)
+
+        # Segment the NDVI image into an int32 label raster
+        segments = segment_ndvi(ndvi, segmentation, **(segmentation_params or {}))
+        print("%s number of segments: %d" % (segmentation.capitalize(), len(np.unique(segments))))
+
+        # Plot Segments
+        if plot_segments:
+            img = io.imread(tilepath)
+            rgb_img = img[:, :, :3]
+            fig, ax = plt.subplots(1, 2, figsize=(5, 10))
+
+            # Original Pixels
+            ax[0].imshow(rgb_img)
+            ax[0].set_title("Original Pixels")
+            ax[0].set_xticks([])
+            ax[0].set_yticks([])
+            ax[0].set_xticklabels([])
+            ax[0].set_yticklabels([])
+            ax[0].tick_params(axis='both', which='both', length=0)
+
+            # Segments
+            ax[1].imshow(color.label2rgb(segments, rgb_img, bg_label=0))
+            ax[1].set_title(f"{segmentation.capitalize()} Segments")
+            ax[1].set_xticks([])
+            ax[1].set_yticks([])
+            ax[1].set_xticklabels([])
+            ax[1].set_yticklabels([])
+            ax[1].tick_params(axis='both', which='both', length=0)
+
+            if plot_path:
+                plt.savefig(plot_path)
+            plt.show()
+
+        # Compute mean NDVI for each segment directly on the label raster
+        segment_ndvi_stats = segment_statistics(segments, {'ndvi': ndvi}, statistics=('mean',))
+        segment_index = segment_ndvi_stats.index.to_numpy()
+        mean_ndvi_vals = segment_ndvi_stats['ndvi_mean'].to_numpy().reshape(-1, 1)
+
+    # Cluster the segments; the cluster with the highest mean NDVI is 'tree'
+    labels, tree_cluster_idx = cluster_segments(mean_ndvi_vals, n_clusters, clustering)
     cluster_mean_ndvi = [mean_ndvi_vals[labels == i].mean() for i in range(n_clusters)]
-    tree_cluster_idx = np.argmax(cluster_mean_ndvi)
 
     # Test
     print("Cluster mean NDVI values:", cluster_mean_ndvi)
     print("Index of tree cluster:", tree_cluster_idx)
 
-    # Assign class labels based on the cluster with higher NDVI being 'tree'
-    gdf['class'] = gdf['cluster'].apply(lambda x: 1 if x == tree_cluster_idx else 0)
-
-    # Dissolve polygons by 'class' to merge connected polygons
-    dissolved_gdfs = []
-    for cls in tqdm(gdf['class'].unique(), desc="Dissolving polygons by class"):
-        class_gdf = gdf[gdf['class'] == cls]
-        dissolved_gdf = class_gdf.dissolve()
-        dissolved_gdf['class'] = cls
-        dissolved_gdfs.append(dissolved_gdf)
-
-    # Combine the dissolved GeoDataFrames
-    dissolved_gdf = gpd.GeoDataFrame(pd.concat(dissolved_gdfs, ignore_index=True), crs=sr)
+    # Map the classes back onto the segment raster through a lookup table, so a
+    # tree/not-tree raster is polygonized instead of every segment
+    class_lookup = np.zeros(segment_index.max() + 1, dtype=np.uint8)
+    class_lookup[segment_index] = labels == tree_cluster_idx
+
+    if window_size:
+        # Classify, clean and polygonize the label GeoTIFF window by window
+        polys, classes = polygonize_segment_classes(
+            labels_path, class_lookup, cleanup=cleanup, window_size=window_size, workers=workers
+        )
+    else:
+        tree_mask = class_lookup[segments]
+        del segments
+
+        # Optionally clean the tree mask before it is polygonized
+        if cleanup is not None:
+            tree_mask, _ = cleanup.apply(tree_mask, resolution=abs(affine.a), crs=sr)
+
+        polys, classes = polygonize_raster(tree_mask, affine, workers=workers)
+        del tree_mask
+
+    # Optionally drop the pixel-corner vertices, keeping shared boundaries intact
+    if simplify_tolerance:
+        polys, _ = simplify_polygons(polys, simplify_tolerance, simplify_boundary=False, cell_size=abs(affine.a))
+
+    # Gather the polygons of each class into one MultiPolygon; polygons of a class built
+    # from one raster never overlap, so no dissolve (union) is needed
+    class_values = np.unique(classes)
+    dissolved_gdf = gpd.GeoDataFrame(
+        {'class': class_values.astype(int)},
+        geometry=[shapely.multipolygons(polys[classes == cls]) for cls in class_values],
+        crs=sr
+    )
 
     return dissolved_gdf
 
@@ -0,0 +1,194 @@
+# Utility methods used to clip and subtract canopy geometries per study area zone on a grid of cells
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import shapely
+
+# Side of the grid cells the study area zones are cut into, in map units (feet)
+DEFAULT_CELL_SIZE = 1000
+
+# Number of cells sent to a worker process at a time
+CELLS_PER_TASK = 64
+
+
+def polygon_parts(geometries):
+    """
+    Splits geometries into their polygon parts, dropping points and lines.
+
+    Parameters
+    ----------
+    geometries : array-like of shapely.Geometry
+        Geometries to split; None and empty geometries are skipped.
+
+    Returns
+    -------
+    parts : np.ndarray
+        Polygon parts.
+    index : np.ndarray
+        Index into `geometries` of each part.
+    """
+    parts, index = shapely.get_parts(np.asarray(geometries), return_index=True)
+    polygonal = shapely.get_type_id(parts) == shapely.GeometryType.POLYGON
+    return parts[polygonal], index[polygonal]
+
+
+def zone_cells(zones, cell_size=DEFAULT_CELL_SIZE):
+    """
+    Cuts study area zones into grid cells.
+
+    Cells that fall entirely inside a zone are kept as boxes (checked with the prepared
+    zone); only the cells crossing the zone boundary are intersected with it.
+
+    Parameters
+    ----------
+    zones : array-like of shapely.Geometry
+        Study area zones, e.g. the geometries of a study area GeoDataFrame.
+    cell_size : float, optional
+        Side of the grid cells in map units. Default is `DEFAULT_CELL_SIZE`.
+
+    Returns
+    -------
+    cells : np.ndarray
+        Cell geometries clipped to their zone.
+    cell_zones : np.ndarray
+        Index of the zone of each cell.
+    cell_boxes : np.ndarray
+        (minx, miny, maxx, maxy) of each cell before clipping.
+    """
+    cells = []
+    cell_zones = []
+    cell_boxes = []
+    for zone_index, zone in enumerate(zones):
+        if zone is None or zone.is_empty:
+            continue
+        minx, miny, maxx, maxy = zone.bounds
+        x0, y0 = np.meshgrid(np.arange(minx, maxx, cell_size), np.arange(miny, maxy, cell_size))
+        bounds = np.column_stack([
+            x0.ravel(), y0.ravel(),
+            np.minimum(x0.ravel() + cell_size, maxx), np.minimum(y0.ravel() + cell_size, maxy)
+        ])
+        boxes = shapely.box(*bounds.T)
+
+        shapely.prepare(zone)
+        inside = shapely.contains_properly(zone, boxes)
+        clipped = boxes.copy()
+        clipped[~inside] = shapely.intersection(boxes[~inside], zone)
+        keep = ~shapely.is_empty(clipped) & (shapely.area(clipped) > 0)
+
+        cells.append(clipped[keep])
+        cell_zones.append(np.full(keep.sum(), zone_index))
+        cell_boxes.append(bounds[keep])
+
+    if not cells:
+        return np.empty(0, dtype=object), np.empty(0, dtype=int), np.empty((0, 4))
+    return np.concatenate(cells), np.concatenate(cell_zones), np.concatenate(cell_boxes)
+
+
+def _overlay_cells(cells, canopy_parts):
+    # Intersects and subtracts the canopy parts touching each cell, in vectorized calls
+    inside = np.array([shapely.Polygon()] * len(cells), dtype=object)
+    outside = cells.copy()
+    if len(canopy_parts) == 0:
+        return inside, outside
+
+    cell_index, part_index = shapely.STRtree(canopy_parts).query(cells, predicate='intersects')
+    if len(cell_index) == 0:
+        return inside, outside
+
+    hit_cells, local_index = np.unique(cell_index, return_inverse=True)
+    local_canopy = shapely.multipolygons(canopy_parts[part_index], indices=local_index)
+    inside[hit_cells] = shapely.intersection(cells[hit_cells], local_canopy)
+    outside[hit_cells] = shapely.difference(cells[hit_cells], local_canopy)
+    return inside, outside
+
+
+def _stitch_cell_edges(pieces, piece_zones, piece_boxes, zone_bounds, tolerance):
+    # Unions the pieces that touch an interior cell edge with the other pieces of their
+    # zone and splits them back into parts, so regions cut by the grid are whole again
+    bounds = shapely.bounds(pieces)
+    zone_box = zone_bounds[piece_zones]
+    on_edge = np.zeros(len(pieces), dtype=bool)
+    for side in range(4):
+        interior = np.abs(piece_boxes[:, side] - zone_box[:, side]) > tolerance
+        on_edge |= interior & (np.abs(bounds[:, side] - piece_boxes[:, side]) <= tolerance)
+
+    stitched = [pieces[~on_edge]]
+    stitched_zones = [piece_zones[~on_edge]]
+    for zone_index in np.unique(piece_zones[on_edge]):
+        group = pieces[on_edge & (piece_zones == zone_index)]
+        parts, _ = polygon_parts(shapely.union_all(group)) if len(group) > 1 else (group, None)
+        stitched.append(parts)
+        stitched_zones.append(np.full(len(parts), zone_index))
+    stitched, stitched_zones = np.concatenate(stitched), np.concatenate(stitched_zones)
+
+    # Drop the slivers left where a canopy edge runs along a cell edge
+    keep = shapely.area(stitched) > tolerance ** 2
+    return stitched[keep], stitched_zones[keep]
+
+
+def overlay_zones(canopy, zones, cell_size=DEFAULT_CELL_SIZE, workers=1):
+    """
+    Clips a dissolved canopy to each study area zone and subtracts it to find the gaps.
+
+    Replaces a pair of `gpd.overlay` calls (intersection, then difference) with direct
+    shapely set operations. The zones are cut into grid cells; each cell is intersected
+    with, and differenced from, only the canopy parts an STRtree finds for it, so every
+    GEOS operation stays small. Cells are processed in a process pool when `workers` is
+    not 1. The clipped canopy is then reassembled per zone, and gap pieces cut by the
+    grid are stitched back together.
+
+    Parameters
+    ----------
+    canopy : shapely.Geometry
+        The dissolved (buffered) canopy.
+    zones : array-like of shapely.Geometry
+        Study area zones.
+    cell_size : float, optional
+        Side of the grid cells in map units. Default is `DEFAULT_CELL_SIZE`.
+    workers : int, optional
+        Number of worker processes. 1 processes the cells in this process and None uses
+        every available core (default is 1).
+
+    Returns
+    -------
+    clipped : np.ndarray
+        Canopy inside each zone, aligned with `zones` (empty where there is none).
+    gaps : np.ndarray
+        Polygons of the zones not covered by the canopy.
+    gap_zones : np.ndarray
+        Index of the zone of each gap.
+    """
+    zones = np.asarray(zones)
+    canopy_parts, _ = polygon_parts([canopy])
+    cells, cell_zones, cell_boxes = zone_cells(zones, cell_size)
+
+    if (workers is not None and workers <= 1) or len(cells) <= CELLS_PER_TASK:
+        inside, outside = _overlay_cells(cells, canopy_parts)
+    else:
+        # Send each worker a batch of cells with only the canopy parts they touch
+        tree = shapely.STRtree(canopy_parts)
+        batches = []
+        for start in range(0, len(cells), CELLS_PER_TASK):
+            batch = cells[start:start + CELLS_PER_TASK]
+            batches.append((batch, canopy_parts[np.unique(tree.query(batch)[1])]))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_overlay_cells, *zip(*batches)))
+        inside = np.concatenate([result[0] for result in results])
+        outside = np.concatenate([result[1] for result in results])
+
+    # Reassemble the clipped canopy of each zone
+    clipped = np.array([shapely.Polygon()] * len(zones), dtype=object)
+    inside_parts, inside_cells = polygon_parts(inside)
+    inside_zones = cell_zones[inside_cells]
+    for zone_index in np.unique(inside_zones):
+        clipped[zone_index] = shapely.union_all(inside_parts[inside_zones == zone_index])
+
+    # Stitch the gaps cut by cell edges back together
+    gap_pieces, gap_cells = polygon_parts(outside)
+    if len(gap_pieces) == 0:
+        return clipped, gap_pieces, cell_zones[gap_cells]
+    zone_bounds = shapely.bounds(zones)
+    gaps, gap_zones = _stitch_cell_edges(
+        gap_pieces, cell_zones[gap_cells], cell_boxes[gap_cells], zone_bounds, tolerance=cell_size * 1e-9
+    )
+    return clipped, gaps, gap_zones
@@ -0,0 +1,86 @@
+# Utility methods used to write the canopy and gap layers of a run to disk
+import os
+
+try:
+    import pyogrio
+except ImportError:
+    pyogrio = None
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+# Output formats: OGR driver and file extension. GeoParquet is written by geopandas.
+OUTPUT_FORMATS = {
+    'shapefile': ('ESRI Shapefile', '.shp'),
+    'gpkg': ('GPKG', '.gpkg'),
+    'fgb': ('FlatGeobuf', '.fgb'),
+    'parquet': (None, '.parquet'),
+}
+
+
+def _write_ogr(gdf, path, layer, driver, **layer_options):
+    # Writes through pyogrio, and through its Arrow path when pyarrow is installed too,
+    # which hands GDAL whole record batches instead of one feature at a time
+    if pyogrio is None:
+        gdf.to_file(path, layer=layer, driver=driver, **layer_options)
+    elif pyarrow is None:
+        gdf.to_file(path, layer=layer, driver=driver, engine='pyogrio', **layer_options)
+    else:
+        gdf.to_file(path, layer=layer, driver=driver, engine='pyogrio', use_arrow=True, **layer_options)
+
+
+def write_layers(layers, output_path, prefix, output_format='shapefile'):
+    """
+    Writes the layers of a run in the selected vector format.
+
+    'gpkg' writes every layer into a single GeoPackage named after `prefix`. GeoParquet
+    and FlatGeobuf hold one layer per file, so 'parquet' and 'fgb' write one file per
+    layer: GeoParquet with bbox covering columns (so readers can filter row groups by
+    extent) and FlatGeobuf with its packed spatial index. 'shapefile' keeps the previous
+    one-shapefile-per-layer output.
+
+    Parameters
+    ----------
+    layers : dict
+        Layer name to gpd.GeoDataFrame, e.g. {'canopy': canopy_gdf}.
+    output_path : path
+        Folder the output is written to.
+    prefix : str
+        Prefix of the output file names, e.g. 'lidar_<Proj_ID>'.
+    output_format : {'shapefile', 'gpkg', 'fgb', 'parquet'}, optional
+        Output format. Default is 'shapefile'.
+
+    Returns
+    -------
+    dict
+        Layer name to the path it was written to.
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(
+            f"Unsupported output format '{output_format}'. Use one of {', '.join(OUTPUT_FORMATS)}."
+        )
+    driver, extension = OUTPUT_FORMATS[output_format]
+
+    paths = {}
+    if output_format == 'gpkg':
+        container_path = os.path.join(output_path, prefix + extension)
+        # Start from a fresh container so layers from a previous run do not linger
+        if os.path.exists(container_path):
+            os.remove(container_path)
+        for layer, gdf in layers.items():
+            _write_ogr(gdf, container_path, layer, driver)
+            paths[layer] = container_path
+        return paths
+
+    for layer, gdf in layers.items():
+        path = os.path.join(output_path, f'{prefix}_{layer}{extension}')
+        if output_format == 'parquet':
+            gdf.to_parquet(path, write_covering_bbox=True)
+        elif output_format == 'fgb':
+            _write_ogr(gdf, path, layer, driver, SPATIAL_INDEX='YES')
+        else:
+            _write_ogr(gdf, path, layer, driver)
+        paths[layer] = path
+    return paths
@@ -0,0 +1,133 @@
+# Utility methods used to union large numbers of canopy polygons quickly
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import shapely
+
+# Target number of geometries per partition of the fallback union
+DEFAULT_PARTITION_SIZE = 5000
+
+# Segments per quarter circle of buffered corners, as in GeoSeries.buffer, so buffers
+# match the ones the GeoDataFrame code path produced
+BUFFER_QUAD_SEGS = 16
+
+
+def is_coverage(geometries):
+    """
+    Checks whether polygons form a valid coverage (no overlaps, matching shared edges).
+
+    Polygons built by `rasterio.features.shapes` from a single raster always do. Requires
+    shapely 2.1 or newer; with older versions the check conservatively returns False.
+
+    Parameters
+    ----------
+    geometries : array-like of shapely.Geometry
+        Polygons to check.
+
+    Returns
+    -------
+    bool
+        True if the polygons form a valid coverage.
+    """
+    if not hasattr(shapely, 'coverage_is_valid'):
+        return False
+    return bool(shapely.coverage_is_valid(np.asarray(geometries)))
+
+
+def _union_partition(geometries):
+    return shapely.union_all(geometries)
+
+
+def partitioned_union(geometries, partition_size=DEFAULT_PARTITION_SIZE, workers=1):
+    """
+    Unions polygons over a grid of spatial partitions, optionally in parallel.
+
+    The geometries are binned into grid cells by the centre of their bounding boxes,
+    with the grid sized so each cell holds about `partition_size` geometries. Each cell
+    is unioned independently in a process pool and the cell results, which only overlap
+    along cell edges, are unioned last. With a single worker, or few geometries, the
+    geometries are unioned directly with one cascaded `shapely.union_all`.
+
+    Parameters
+    ----------
+    geometries : array-like of shapely.Geometry
+        Geometries to union.
+    partition_size : int, optional
+        Target number of geometries per partition. Default is `DEFAULT_PARTITION_SIZE`.
+    workers : int, optional
+        Number of worker processes. 1 unions in this process and None uses every
+        available core (default is 1).
+
+    Returns
+    -------
+    shapely.Geometry
+        Union of all geometries.
+    """
+    geometries = np.asarray(geometries)
+    # Serially, a single cascaded union is as fast as any partitioning
+    if len(geometries) <= partition_size or (workers is not None and workers <= 1):
+        return shapely.union_all(geometries)
+
+    bounds = shapely.bounds(geometries)
+    centers_x = (bounds[:, 0] + bounds[:, 2]) / 2
+    centers_y = (bounds[:, 1] + bounds[:, 3]) / 2
+
+    cells_per_side = int(np.ceil(np.sqrt(len(geometries) / partition_size)))
+    x_edges = np.linspace(centers_x.min(), centers_x.max(), cells_per_side + 1)[1:-1]
+    y_edges = np.linspace(centers_y.min(), centers_y.max(), cells_per_side + 1)[1:-1]
+    cells = np.digitize(centers_x, x_edges) * cells_per_side + np.digitize(centers_y, y_edges)
+
+    order = np.argsort(cells, kind='stable')
+    splits = np.flatnonzero(np.diff(cells[order])) + 1
+    partitions = np.split(geometries[order], splits)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        partial_unions = list(executor.map(_union_partition, partitions))
+
+    return shapely.union_all(partial_unions)
+
+
+def buffered_union(geometries, buffer_distance, coverage=None, partition_size=DEFAULT_PARTITION_SIZE, workers=1):
+    """
+    Buffers polygons and dissolves them into a single geometry.
+
+    Buffering distributes over union, so when the polygons form a coverage (as polygons
+    polygonized from a raster do) they are first merged with a coverage union, which only
+    has to drop shared edges and is much cheaper than a general union. This collapses
+    fragmented inputs (e.g. per-segment or per-block polygons) into their connected
+    parts before anything is buffered. The parts, or the original polygons when they do
+    not form a coverage, are then buffered in one vectorized call and merged with
+    `partitioned_union`.
+
+    Buffering the coverage union as a single geometry is avoided on purpose: GEOS buffers
+    a large MultiPolygon far more slowly than its parts.
+
+    Parameters
+    ----------
+    geometries : array-like of shapely.Geometry
+        Polygons to buffer and union.
+    buffer_distance : float
+        The distance to buffer the polygons.
+    coverage : bool, optional
+        Whether the polygons form a valid coverage. If None, it is checked with
+        `is_coverage` (default is None).
+    partition_size : int, optional
+        Target number of geometries per partition of the union.
+    workers : int, optional
+        Number of worker processes used by the partitioned union (default is 1).
+
+    Returns
+    -------
+    shapely.Geometry
+        The dissolved buffered polygons.
+    """
+    geometries = np.asarray(geometries)
+    if len(geometries) == 0:
+        return shapely.Polygon()
+
+    if coverage is None:
+        coverage = is_coverage(geometries)
+
+    if coverage:
+        geometries = shapely.get_parts(shapely.coverage_union_all(geometries))
+    return partitioned_union(shapely.buffer(geometries, buffer_distance, quad_segs=BUFFER_QUAD_SEGS), partition_size, workers)